@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite of similar_files_finder.check_for_duplicates
+
+Each scenario generates a reproducible synthetic tree and scans it
+in a freshly spawned process, not a fork that would share the memory
+of the generator, so that the peak RSS belongs to the interpreter and the scan alone.
+The peak is taken from VmHWM of the process: ru_maxrss survives exec on Linux
+and would report the peak of the generator.
+
+Usage: python benchmarks/duplicates_benchmark.py [--scale N] [--scenario NAME]
+                                                 [--json FILE] [--baseline FILE]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from tempfile import TemporaryDirectory
+
+from supertool import similar_files_finder
+
+SEED = 239
+
+
+def write_file(file_path: str, content: bytes) -> None:
+    """
+    Creates a file with the given content
+
+    :param file_path: path to the file being created
+    :param content: content of the file
+    :return: None
+    """
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, 'wb') as file_object:
+        file_object.write(content)
+
+
+def random_bytes(rng: random.Random, size: int) -> bytes:
+    """
+    Generates reproducible random bytes
+
+    :param rng: random generator
+    :param size: number of bytes
+    :return: bytes -- random bytes
+    """
+    return rng.getrandbits(size * 8).to_bytes(size, 'little') if size else b''
+
+
+def many_tiny_files(root: str, rng: random.Random, scale: int) -> None:
+    """Tens of thousands of files of a few bytes, a quarter of them are copies."""
+    for index in range(20000 * scale):
+        content = str(rng.randrange(15000 * scale)).encode()
+        write_file(os.path.join(root, str(index % 100), str(index)), content)
+
+
+def few_huge_files(root: str, rng: random.Random, scale: int) -> None:
+    """A few files of 64 MiB, one pair of them is identical."""
+    content = random_bytes(rng, 64 * 1024 * 1024)
+    for index in range(2 * scale):
+        write_file(os.path.join(root, f'copy{index}'), content)
+        write_file(os.path.join(root, f'unique{index}'),
+                   random_bytes(rng, len(content)))
+
+
+def deep_nesting(root: str, rng: random.Random, scale: int) -> None:
+    """A chain of 100 nested directories with small files on each level."""
+    path = root
+    for depth in range(100):
+        path = os.path.join(path, f'level{depth}')
+        for index in range(20 * scale):
+            write_file(os.path.join(path, str(index)),
+                       random_bytes(rng, rng.randrange(1, 4096)))
+
+
+def high_duplicate_ratio(root: str, rng: random.Random, scale: int) -> None:
+    """Thousands of 64 KiB files made of only 50 distinct contents."""
+    contents = [random_bytes(rng, 64 * 1024) for _ in range(50)]
+    for index in range(2000 * scale):
+        write_file(os.path.join(root, str(index % 20), str(index)), rng.choice(contents))
+
+
+def same_size_different_content(root: str, rng: random.Random, scale: int) -> None:
+    """Thousands of distinct 256 KiB files that differ only in the middle."""
+    head = random_bytes(rng, 128 * 1024)
+    for index in range(1000 * scale):
+        write_file(os.path.join(root, str(index)),
+                   head + index.to_bytes(8, 'little') + head[8:])
+
+
+SCENARIOS = {
+    'tiny': many_tiny_files,
+    'huge': few_huge_files,
+    'deep': deep_nesting,
+    'duplicates': high_duplicate_ratio,
+    'same_size': same_size_different_content,
+}
+
+
+def peak_rss_mb() -> float:
+    """
+    Returns the peak RSS of the current process
+
+    :return: float -- peak RSS in MB
+    """
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def scan(path: str, options: dict) -> dict:
+    """
+    Scans the tree and measures the scan, runs in a separate process
+
+    :param path: path to the tree
+    :param options: options of check_for_duplicates
+    :return: dict -- measurements
+    """
+    stats = similar_files_finder.create_statistics()
+    start = time.perf_counter()
+    duplicates = similar_files_finder.check_for_duplicates(path, stats=stats, **options)
+    seconds = time.perf_counter() - start
+    bytes_read = sum(counters['bytes_read'] for counters in stats.values())
+    return {
+        'seconds': seconds,
+        'files_per_second': stats['size']['files'] / seconds,
+        'mb_per_second': bytes_read / seconds / 1e6,
+        'peak_rss_mb': peak_rss_mb(),
+        'groups': len(duplicates),
+        'stages': {stage: round(counters['seconds'], 4) for stage, counters in stats.items()},
+    }
+
+
+def run_scenario(name: str, scale: int, options: dict) -> dict:
+    """
+    Generates the tree of the scenario and scans it in a spawned process
+
+    :param name: name of the scenario, one of SCENARIOS
+    :param scale: multiplier of the tree size
+    :param options: options of check_for_duplicates
+    :return: dict -- measurements
+    """
+    with TemporaryDirectory() as temp_dir:
+        SCENARIOS[name](temp_dir, random.Random(SEED), scale)
+        with ProcessPoolExecutor(max_workers=1,
+                                 mp_context=multiprocessing.get_context('spawn')) as executor:
+            return executor.submit(scan, temp_dir, options).result()
+
+
+def report(name: str, result: dict) -> None:
+    """
+    Displays the measurements of a scenario
+
+    :param name: name of the scenario
+    :param result: measurements
+    :return: None
+    """
+    stages = ', '.join(f'{stage} {seconds:.3f}s' for stage, seconds in result['stages'].items())
+    print(f'{name:<12}{result["seconds"]:>8.3f} s{result["files_per_second"]:>12.0f} files/s'
+          f'{result["mb_per_second"]:>10.1f} MB/s{result["peak_rss_mb"]:>8.1f} MB RSS'
+          f'  [{stages}]')
+
+
+def compare_with_baseline(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Finds scenarios that became slower than the baseline
+
+    :param results: measurements by scenario
+    :param baseline: baseline measurements by scenario
+    :param tolerance: allowed relative slowdown
+    :return: list of messages about regressions
+    """
+    regressions = []
+    for name, result in results.items():
+        if name in baseline and result['seconds'] > baseline[name]['seconds'] * (1 + tolerance):
+            regressions.append(f'{name}: {result["seconds"]:.3f} s, '
+                               f'baseline {baseline[name]["seconds"]:.3f} s')
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark of the duplicates search')
+    parser.add_argument('--scale', help='multiplier of the tree sizes', type=int, default=1)
+    parser.add_argument('--scenario', help='scenario to run, all by default',
+                        choices=sorted(SCENARIOS), action='append')
+    parser.add_argument('--jobs', '-j', help='number of hashing workers', type=int, default=1)
+    parser.add_argument('--json', help='save the measurements to a file')
+    parser.add_argument('--baseline', help='fail if slower than the measurements in the file')
+    parser.add_argument('--tolerance', help='allowed relative slowdown', type=float, default=0.2)
+    args = parser.parse_args()
+
+    results = {}
+    for scenario in args.scenario or SCENARIOS:
+        results[scenario] = run_scenario(scenario, args.scale, {'workers': args.jobs})
+        report(scenario, results[scenario])
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as file:
+            messages = compare_with_baseline(results, json.load(file), args.tolerance)
+        if messages:
+            print('Regressions:\n' + '\n'.join(messages))
+            sys.exit(1)
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the reading paths of similar_files_finder.get_hash
+
+Usage: python benchmarks/hash_throughput.py [size in MiB] [repeats]
+"""
+import hashlib
+import os
+import sys
+import time
+from tempfile import TemporaryDirectory
+
+from supertool import similar_files_finder
+
+
+def legacy_hash(filename: str) -> str:
+    """
+    Hashes a file like get_hash did before the reusable buffer:
+    1 KiB chunks, a new bytes object per chunk
+
+    :param filename: filename
+    :return: str -- hash value
+    """
+    hash_obj = hashlib.md5()
+    with open(filename, 'rb') as file_object:
+        for chunk in similar_files_finder.chunk_reader(file_object):
+            hash_obj.update(chunk)
+    return hash_obj.hexdigest()
+
+
+def measure(hash_function, filename: str, repeats: int) -> float:
+    """
+    Measures the best throughput of a hash function
+
+    :param hash_function: function that hashes a file
+    :param filename: filename
+    :param repeats: number of repeats
+    :return: float -- throughput in MB/s
+    """
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        hash_function(filename)
+        best = min(best, time.perf_counter() - start)
+    return os.path.getsize(filename) / best / 1e6
+
+
+def main(size_mib: int = 256, repeats: int = 3) -> None:
+    """
+    Creates a file of size_mib MiB and reports the throughput of each reading path
+
+    :param size_mib: size of the file in MiB
+    :param repeats: number of repeats
+    :return: None
+    """
+    cases = (
+        ('legacy 1 KiB chunks', legacy_hash),
+        ('buffer 64 KiB', lambda name: similar_files_finder.get_hash(name, block_size=64 * 1024,
+                                                                     mmap_threshold=None)),
+        ('buffer 1 MiB', lambda name: similar_files_finder.get_hash(name, mmap_threshold=None)),
+        ('mmap', lambda name: similar_files_finder.get_hash(name, mmap_threshold=1)),
+    )
+    with TemporaryDirectory() as temp_dir:
+        filename = os.path.join(temp_dir, 'data')
+        with open(filename, 'wb') as file_object:
+            for _ in range(size_mib):
+                file_object.write(os.urandom(1024 * 1024))
+        for name, hash_function in cases:
+            print(f'{name:<24}{measure(hash_function, filename, repeats):>10.1f} MB/s')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
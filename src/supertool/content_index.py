@@ -0,0 +1,245 @@
+"""Persistent index of the contents of a file store."""
+
+import os
+import sqlite3
+from typing import Iterable
+
+from supertool.path_filter import PathFilter
+from supertool.similar_files_finder import (PARTIAL_SAMPLE_SIZE, as_roots, get_hash,
+                                            get_hash_function, get_partial_hash, scan_files)
+
+COMMIT_INTERVAL = 1000
+
+
+class ContentIndex:
+    """
+    SQLite index of files by size, partial hash and full hash
+
+    Files are hashed tier by tier like the duplicates search does:
+    a partial hash is calculated only for files that share their size,
+    and a full hash only for files that share their partial hash.
+    A lookup reads only the file being looked up and the indexed files
+    that can still be its copies, so it costs a few indexed queries
+    and does not depend on the size of the store.
+    Missing hashes of indexed files are calculated on demand and stored.
+    An indexed file whose size or modification time changed is rehashed,
+    a removed file is dropped from the index.
+    """
+
+    def __init__(self, filename: str, algorithm: str = 'md5',
+                 sample_size: int = PARTIAL_SAMPLE_SIZE):
+        """
+        Opens (or creates) the index
+
+        :param filename: path to the index file
+        :param algorithm: name of the hash algorithm, see similar_files_finder.HASH_ALGORITHMS
+        :param sample_size: size of each sample of the partial hash
+        """
+        self.hash_func = get_hash_function(algorithm)
+        self.sample_size = sample_size
+        self._pending = 0
+        self._connection = sqlite3.connect(filename)
+        self._connection.execute('CREATE TABLE IF NOT EXISTS settings (name TEXT PRIMARY KEY, value TEXT)')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS files ('
+                                 'path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, '
+                                 'partial TEXT, full TEXT)')
+        self._connection.execute('CREATE INDEX IF NOT EXISTS files_size ON files (size, partial)')
+        self._connection.execute('CREATE INDEX IF NOT EXISTS files_full ON files (full)')
+        settings = (('algorithm', algorithm), ('sample_size', str(sample_size)))
+        for name, value in settings:
+            self._connection.execute('INSERT OR IGNORE INTO settings VALUES (?, ?)', (name, value))
+            stored = self._connection.execute('SELECT value FROM settings WHERE name = ?',
+                                              (name,)).fetchone()[0]
+            if stored != value:
+                self._connection.close()
+                raise ValueError(f"The index was built with {name} {stored}, not {value}")
+        self._connection.commit()
+
+    def __enter__(self):
+        """Returns the index itself."""
+        return self
+
+    def __exit__(self, *args):
+        """Closes the index."""
+        self.close()
+
+    def __len__(self) -> int:
+        """Returns the number of indexed files."""
+        return self._connection.execute('SELECT COUNT(*) FROM files').fetchone()[0]
+
+    def _partial_hash(self, filename: str) -> str:
+        """
+        Calculates the partial hash of a file
+
+        :param filename: filename
+        :return: str -- hash value
+        """
+        return get_partial_hash(filename, self.sample_size, hash_func=self.hash_func)
+
+    def _execute(self, query: str, params: tuple) -> None:
+        """
+        Executes a modifying query, committing every COMMIT_INTERVAL queries
+
+        :param query: sql query
+        :param params: query parameters
+        :return: None
+        """
+        self._connection.execute(query, params)
+        self._pending += 1
+        if self._pending >= COMMIT_INTERVAL:
+            self.flush()
+
+    def _fresh(self, path: str, size: int, mtime_ns: int) -> (bool, None):
+        """
+        Checks whether an indexed file is unchanged, a removed file is dropped,
+        and a changed file gets its new size and modification time and loses its hashes
+
+        :param path: path to the indexed file
+        :param size: indexed size
+        :param mtime_ns: indexed modification time
+        :return: bool -- True if the file is unchanged, False if it changed,
+        None if it is removed
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self.remove(path)
+            return None
+        if (stat.st_size, stat.st_mtime_ns) != (size, mtime_ns):
+            self._execute('UPDATE files SET size = ?, mtime_ns = ?, partial = NULL, full = NULL '
+                          'WHERE path = ?', (stat.st_size, stat.st_mtime_ns, path))
+            return False
+        return True
+
+    def _tier_rows(self, tier: str, query: str, params: tuple) -> list:
+        """
+        Returns the rows selected by a query, with the hashes of a tier filled in
+
+        Changed files are rehashed and stay in the result, removed files are dropped.
+
+        :param tier: 'partial' or 'full'
+        :param query: sql query that selects path, size, mtime_ns and the hash of the tier
+        :param params: query parameters
+        :return: list of pairs (path, hash)
+        """
+        rows = []
+        for path, size, mtime_ns, digest in self._connection.execute(query, params).fetchall():
+            fresh = self._fresh(path, size, mtime_ns)
+            if fresh is None:
+                continue
+            if digest is None or not fresh:
+                try:
+                    digest = (self._partial_hash(path) if tier == 'partial'
+                              else get_hash(path, self.hash_func))
+                except OSError:
+                    continue
+                self._execute(f'UPDATE files SET {tier} = ? WHERE path = ?', (digest, path))
+            rows.append((path, digest))
+        return rows
+
+    def _upsert(self, path: str, stat: os.stat_result) -> None:
+        """
+        Adds a file to the index, the hashes of a changed file are reset
+
+        :param path: absolute path to the file
+        :param stat: result of os.stat for the file
+        :return: None
+        """
+        self._execute('INSERT INTO files VALUES (?, ?, ?, NULL, NULL) ON CONFLICT (path) DO UPDATE '
+                      'SET size = excluded.size, mtime_ns = excluded.mtime_ns, '
+                      'partial = NULL, full = NULL '
+                      'WHERE size != excluded.size OR mtime_ns != excluded.mtime_ns',
+                      (path, stat.st_size, stat.st_mtime_ns))
+
+    def add(self, filename: str) -> list:
+        """
+        Adds a file to the index, or updates it
+
+        The hashes of the file are calculated only when another file
+        has the same size, and then the same partial hash.
+
+        :param filename: path to the file
+        :return: list of paths to the indexed copies of the file, see lookup
+        """
+        path = os.path.abspath(filename)
+        self._upsert(path, os.stat(path))
+        return self.lookup(path)
+
+    def remove(self, filename: str) -> None:
+        """
+        Removes a file from the index
+
+        :param filename: path to the file
+        :return: None
+        """
+        self._execute('DELETE FROM files WHERE path = ?', (os.path.abspath(filename),))
+
+    def build(self, path: (str, Iterable), path_filter: PathFilter = None) -> int:
+        """
+        Indexes the regular files of the directory trees
+
+        Unchanged files keep their hashes, so a rebuild reads only new
+        and changed files. Files removed from the trees are dropped
+        from the index when a lookup comes across them.
+
+        :param path: path to the directory, or an iterable of paths
+        :param path_filter: filter of the files by their paths and sizes
+        :return: int -- number of indexed files
+        """
+        count = 0
+        for root in as_roots(path):
+            for entry in scan_files(root, path_filter=path_filter):
+                stat = entry.stat(follow_symlinks=False)
+                if path_filter is None or path_filter.allows_size(stat.st_size):
+                    self._upsert(os.path.abspath(entry.path), stat)
+                    count += 1
+        self._tier_rows('partial', 'SELECT path, size, mtime_ns, partial FROM files '
+                                   'WHERE partial IS NULL AND size IN '
+                                   '(SELECT size FROM files GROUP BY size HAVING COUNT(*) > 1)', ())
+        self._tier_rows('full', 'SELECT path, size, mtime_ns, full FROM files '
+                                'WHERE full IS NULL AND (size, partial) IN '
+                                '(SELECT size, partial FROM files WHERE partial IS NOT NULL '
+                                'GROUP BY size, partial HAVING COUNT(*) > 1)', ())
+        self.flush()
+        return count
+
+    def lookup(self, filename: str) -> list:
+        """
+        Finds the indexed copies of a file
+
+        :param filename: path to the file
+        :return: list of paths to the indexed files with the same content,
+        except the file itself
+        """
+        path = os.path.abspath(filename)
+        size = os.stat(path).st_size
+        if self._connection.execute('SELECT 1 FROM files WHERE size = ? AND path != ? LIMIT 1',
+                                    (size, path)).fetchone() is None:
+            return []
+        # only the files with the same partial hash, or without one yet, are checked
+        partial = self._partial_hash(path)
+        others = [other for other, digest in self._tier_rows(
+            'partial', 'SELECT path, size, mtime_ns, partial FROM files '
+                       'WHERE size = ? AND (partial = ? OR partial IS NULL) AND path != ?',
+            (size, partial, path)) if digest == partial]
+        if not others:
+            return []
+        full = get_hash(path, self.hash_func)
+        # the partial hashes of the candidates are stored by now, so they are selected
+        # by the indexed columns instead of a list of paths, that has no size limit
+        copies = [other for other, digest in self._tier_rows(
+            'full', 'SELECT path, size, mtime_ns, full FROM files '
+                    'WHERE size = ? AND partial = ? AND path != ?',
+            (size, partial, path)) if digest == full]
+        self._execute('UPDATE files SET partial = ?, full = ? WHERE path = ?', (partial, full, path))
+        return sorted(copies)
+
+    def flush(self) -> None:
+        """Writes pending changes to the disk."""
+        self._connection.commit()
+        self._pending = 0
+
+    def close(self) -> None:
+        """Writes pending changes and closes the index."""
+        self.flush()
+        self._connection.close()
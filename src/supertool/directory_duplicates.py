@@ -0,0 +1,217 @@
+"""Duplicated directory trees, found by Merkle hashes of directories."""
+
+import hashlib
+import os
+from typing import Callable, Iterable
+
+from supertool.hash_cache import HashCache
+from supertool.path_filter import PathFilter
+from supertool.similar_files_finder import as_roots, get_hash, get_hash_function, hash_kind
+
+
+class DirectoryNode:
+    """
+    Directory of a scanned tree
+
+    A node keeps the names of its subdirectories and the metadata
+    of its regular files, the total size of the tree, and two signatures
+    of the tree that are calculated without reading files:
+    the shape (names and sizes) and the state (the shape, modification times
+    and inodes). Trees with the same content have the same shape,
+    and a tree with the same state as before has the same content as before.
+    """
+
+    __slots__ = ('path', 'parent', 'name', 'stat', 'dirs', 'files', 'size', 'shape', 'state')
+
+    def __init__(self, path: str, parent: str, name: str, stat: os.stat_result):
+        """
+        Init a node
+
+        :param path: path to the directory
+        :param parent: path to the parent directory, None for a root
+        :param name: name of the directory
+        :param stat: result of os.stat for the directory
+        """
+        self.path = path
+        self.parent = parent
+        self.name = name
+        self.stat = stat
+        self.dirs = []
+        self.files = []
+        self.size = 0
+        self.shape = None
+        self.state = None
+
+
+def scan_tree(path: (str, Iterable), hash_func: Callable = hashlib.md5,
+              path_filter: PathFilter = None) -> list:
+    """
+    Walks the directory trees and calculates the signatures of their directories
+
+    Symbolic links and special files are skipped,
+    directories that can not be read are ignored.
+
+    :param path: path to the directory, or an iterable of paths, see as_roots
+    :param hash_func: hash function of the signatures
+    :param path_filter: filter of the files by their paths and sizes
+    :return: list of DirectoryNode, every directory before its subdirectories
+    """
+    nodes = []
+    pending = [(root, None, os.path.basename(os.path.normpath(root))) for root in as_roots(path)]
+    while pending:
+        directory, parent, name = pending.pop()
+        try:
+            node = DirectoryNode(directory, parent, name, os.stat(directory))
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if path_filter is None or path_filter.allows_directory(entry.path,
+                                                                                   entry.name):
+                                node.dirs.append(entry.name)
+                        elif entry.is_file(follow_symlinks=False):
+                            if (path_filter is not None
+                                    and not path_filter.allows_file(entry.path, entry.name)):
+                                continue
+                            stat = entry.stat(follow_symlinks=False)
+                            if path_filter is None or path_filter.allows_size(stat.st_size):
+                                node.files.append((entry.name, stat))
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+        nodes.append(node)
+        pending.extend((os.path.join(directory, child), directory, child) for child in node.dirs)
+
+    by_path = {node.path: node for node in nodes}
+    for node in reversed(nodes):
+        node.dirs = sorted(child for child in node.dirs
+                           if os.path.join(node.path, child) in by_path)
+        node.files.sort(key=lambda file: file[0])
+        shape, state = hash_func(), hash_func()
+        for name, stat in node.files:
+            node.size += stat.st_size
+            entry = b'f' + os.fsencode(name) + b'\0' + str(stat.st_size).encode() + b'\0'
+            shape.update(entry)
+            state.update(entry + f'{stat.st_mtime_ns}:{stat.st_dev}:{stat.st_ino}\0'.encode())
+        for child in node.dirs:
+            child_node = by_path[os.path.join(node.path, child)]
+            node.size += child_node.size
+            entry = b'd' + os.fsencode(child) + b'\0'
+            shape.update(entry + child_node.shape.encode() + b'\0')
+            state.update(entry + child_node.state.encode() + b'\0')
+        node.shape, node.state = shape.hexdigest(), state.hexdigest()
+    return nodes
+
+
+def merkle_hashes(nodes: list, candidates: set, hash_func: Callable = hashlib.md5,
+                  cache: HashCache = None) -> dict:
+    """
+    Calculates Merkle hashes of the candidate directories
+
+    The hash of a directory is a hash of the names of its entries,
+    the hashes of its files (see get_hash) and the hashes of its subdirectories.
+    The hash of a directory is cached under the state of its tree,
+    so a cached hash is valid while nothing in the tree has changed,
+    and the files of such a tree are not hashed at all.
+
+    :param nodes: directories of the trees, see scan_tree
+    :param candidates: paths to the directories whose hashes are needed
+    :param hash_func: hash function
+    :param cache: hash cache of the files and of the directories
+    :return: dict -- dictionary where the key is a path to a directory
+    and the value is its hash
+    """
+    hashes, needed = {}, set()
+    for node in nodes:
+        if node.path not in candidates and (node.parent not in needed or node.parent in hashes):
+            continue
+        needed.add(node.path)
+        if cache is not None:
+            digest = cache.get(node.path, hash_kind('merkle', hash_func, node.state), node.stat)
+            if digest is not None:
+                hashes[node.path] = digest
+
+    for node in reversed(nodes):
+        if node.path not in needed or node.path in hashes:
+            continue
+        hash_obj = hash_func()
+        try:
+            for name, _ in node.files:
+                digest = get_hash(os.path.join(node.path, name), hash_func, cache)
+                hash_obj.update(b'f' + os.fsencode(name) + b'\0' + digest.encode() + b'\0')
+        except OSError:
+            continue
+        for child in node.dirs:
+            digest = hashes.get(os.path.join(node.path, child))
+            if digest is None:
+                break
+            hash_obj.update(b'd' + os.fsencode(child) + b'\0' + digest.encode() + b'\0')
+        else:
+            hashes[node.path] = hash_obj.hexdigest()
+            if cache is not None:
+                cache.set(node.path, hash_kind('merkle', hash_func, node.state),
+                          hashes[node.path], node.stat)
+    if cache is not None:
+        cache.flush()
+    return hashes
+
+
+def check_for_duplicate_directories(path: (str, Iterable), algorithm: str = 'md5',
+                                    cache: HashCache = None,
+                                    path_filter: PathFilter = None) -> dict:
+    """
+    Find duplicated directory trees
+
+    Directories are first grouped by the shape of their trees
+    (names and sizes of all the entries), and only directories
+    with the same shape are hashed, see merkle_hashes.
+    Groups are ordered by the size of their trees, the largest first.
+    Subdirectories of reported duplicates are collapsed: of the subdirectories
+    with the same name, whose parents are duplicates of each other,
+    only one is reported, so a group that follows from a reported group
+    is not reported at all. Directories without files are not reported.
+
+    :param path: path to the directory, with directories to check,
+    or an iterable of paths
+    :param algorithm: name of the hash algorithm, see similar_files_finder.HASH_ALGORITHMS
+    :param cache: hash cache of the files and of the directories
+    :param path_filter: filter of the files by their paths and sizes
+    :return: dict -- dictionary where the key is the hash of the directories,
+    and the value is the list of paths to the identical directories
+    """
+    paths = [path] if isinstance(path, (str, bytes, os.PathLike)) else list(path)
+    if not paths or not all(map(os.path.isdir, paths)):
+        raise ValueError("Directory does non exist")
+    hash_func = get_hash_function(algorithm)
+    nodes = scan_tree(paths, hash_func, path_filter)
+    by_shape = {}
+    for node in nodes:
+        if node.size or node.files:
+            by_shape.setdefault(node.shape, []).append(node)
+    candidates = {node.path for group in by_shape.values() if len(group) > 1 for node in group}
+    hashes = merkle_hashes(nodes, candidates, hash_func, cache)
+
+    by_hash = {}
+    for node in nodes:
+        if node.path in candidates and node.path in hashes:
+            by_hash.setdefault(hashes[node.path], []).append(node)
+    groups = sorted((group for group in by_hash.values() if len(group) > 1),
+                    key=lambda group: (-group[0].size, group[0].path))
+
+    duplicates, reported = {}, {}
+    for group in groups:
+        # Of the subdirectories with the same name of the duplicates
+        # of a reported group, one represents all of them
+        kept, origins = [], set()
+        for node in sorted(group, key=lambda node: node.path):
+            origin = (reported.get(node.parent), node.name)
+            if origin[0] is None or origin not in origins:
+                origins.add(origin)
+                kept.append(node)
+        digest = hashes[group[0].path] if len(kept) > 1 else reported[kept[0].parent]
+        if len(kept) > 1:
+            duplicates[digest] = sorted(node.path for node in kept)
+        for node in group:
+            reported[node.path] = digest
+    return duplicates
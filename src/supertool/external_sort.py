@@ -0,0 +1,138 @@
+"""External sort of file records, for trees that do not fit in memory."""
+
+import heapq
+import itertools
+import os
+import struct
+import tempfile
+from typing import BinaryIO, Iterable, Iterator
+
+RECORD_HEADER = struct.Struct('<QQQI')
+RECORD_OVERHEAD = 200
+MAX_MERGE_FAN_IN = 64
+READ_BUFFER_SIZE = 64 * 1024
+
+
+def write_run(records: list, directory: str) -> str:
+    """
+    Sorts records and writes them to a new run file
+
+    A record is a tuple (size, st_dev, st_ino, path),
+    it is written as a fixed header followed by the encoded path.
+
+    :param records: list of records
+    :param directory: directory for the run file
+    :return: str -- path to the run file
+    """
+    records.sort()
+    descriptor, run_path = tempfile.mkstemp(prefix='run-', dir=directory)
+    with os.fdopen(descriptor, 'wb') as run_file:
+        for size, device, inode, path in records:
+            encoded_path = os.fsencode(path)
+            run_file.write(RECORD_HEADER.pack(size, device, inode, len(encoded_path)))
+            run_file.write(encoded_path)
+    return run_path
+
+
+def read_run(run_file: BinaryIO) -> Iterator:
+    """
+    Generator of the records of a run file
+
+    :param run_file: run file opened for reading
+    :return: tuple(int, int, int, str) -- record (size, st_dev, st_ino, path)
+    """
+    while True:
+        header = run_file.read(RECORD_HEADER.size)
+        if not header:
+            return
+        size, device, inode, length = RECORD_HEADER.unpack(header)
+        yield size, device, inode, os.fsdecode(run_file.read(length))
+
+
+def write_sorted_runs(records: Iterable, memory_budget: int, directory: str) -> list:
+    """
+    Splits records into sorted run files, keeping at most memory_budget bytes of records
+
+    :param records: iterable of records (size, st_dev, st_ino, path)
+    :param memory_budget: approximate memory for the records in bytes
+    :param directory: directory for the run files
+    :return: list of paths to the run files
+    """
+    runs, chunk, chunk_bytes = [], [], 0
+    for record in records:
+        chunk.append(record)
+        chunk_bytes += RECORD_OVERHEAD + len(record[3])
+        if chunk_bytes >= memory_budget:
+            runs.append(write_run(chunk, directory))
+            chunk, chunk_bytes = [], 0
+    if chunk:
+        runs.append(write_run(chunk, directory))
+    return runs
+
+
+def merge_runs(runs: list, directory: str) -> Iterator:
+    """
+    Generator of the records of all the run files in sorted order
+
+    Runs are merged at most MAX_MERGE_FAN_IN at a time,
+    intermediate runs are written to the directory. Run files are removed.
+
+    :param runs: list of paths to the run files
+    :param directory: directory for intermediate runs
+    :return: tuple(int, int, int, str) -- record (size, st_dev, st_ino, path)
+    """
+    runs = list(runs)
+    while len(runs) > MAX_MERGE_FAN_IN:
+        batch, runs = runs[:MAX_MERGE_FAN_IN], runs[MAX_MERGE_FAN_IN:]
+        descriptor, merged_path = tempfile.mkstemp(prefix='run-', dir=directory)
+        with os.fdopen(descriptor, 'wb') as merged_file:
+            for size, device, inode, path in merge_runs(batch, directory):
+                encoded_path = os.fsencode(path)
+                merged_file.write(RECORD_HEADER.pack(size, device, inode, len(encoded_path)))
+                merged_file.write(encoded_path)
+        runs.append(merged_path)
+
+    run_files = [open(run, 'rb', buffering=READ_BUFFER_SIZE) for run in runs]
+    try:
+        yield from heapq.merge(*map(read_run, run_files))
+    finally:
+        for run_file, run in zip(run_files, runs):
+            run_file.close()
+            os.remove(run)
+
+
+def external_size_groups(records: Iterable, memory_budget: int, directory: str = None,
+                         stats: dict = None, hardlinks: dict = None) -> Iterator:
+    """
+    Generator of groups of paths to the files with the same size,
+    found by an external sort of the records
+
+    Hard links are collapsed like similar_files_finder.check_for_duplicates_by_size does.
+    Only the records of one size are held in memory at a time.
+
+    :param records: iterable of records (size, st_dev, st_ino, path)
+    :param memory_budget: approximate memory for the records in bytes
+    :param directory: directory for the run files, the system temporary directory by default
+    :param stats: statistics table, see similar_files_finder.create_statistics
+    :param hardlinks: dictionary that will be filled with groups of hard links
+    :return: list -- paths to the files of the same size
+    """
+    with tempfile.TemporaryDirectory(prefix='supertool-', dir=directory) as run_directory:
+        runs = write_sorted_runs(records, memory_budget, run_directory)
+        for size, size_records in itertools.groupby(merge_runs(runs, run_directory),
+                                                    key=lambda record: record[0]):
+            links_by_inode = {}
+            for _, device, inode, path in size_records:
+                links_by_inode.setdefault((device, inode), []).append(path)
+            links_count = sum(map(len, links_by_inode.values()))
+            if stats is not None:
+                stats['size']['files'] += links_count
+            if hardlinks is not None:
+                hardlinks.update((links[0], links) for links in links_by_inode.values()
+                                 if len(links) > 1)
+            if len(links_by_inode) < 2:
+                if stats is not None:
+                    stats['size']['eliminated_files'] += links_count
+                    stats['size']['eliminated_bytes'] += size
+                continue
+            yield [links[0] for links in links_by_inode.values()]
@@ -0,0 +1,131 @@
+"""Resource governor that throttles file reads and hashing."""
+
+import ctypes
+import platform
+import threading
+import time
+
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_CLASS_IDLE = 3
+IOPRIO_CLASS_SHIFT = 13
+SYS_IOPRIO_SET = {'x86_64': 251, 'i386': 289, 'i686': 289, 'aarch64': 30, 'armv7l': 314}
+
+
+def set_idle_io_priority() -> bool:
+    """
+    Moves the calling process into the idle I/O scheduling class (Linux only)
+
+    :return: bool -- True if the priority was changed
+    """
+    syscall_number = SYS_IOPRIO_SET.get(platform.machine())
+    if platform.system() != 'Linux' or syscall_number is None:
+        return False
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+    except OSError:  # pragma: no cover
+        return False
+    return libc.syscall(syscall_number, IOPRIO_WHO_PROCESS, 0,
+                        IOPRIO_CLASS_IDLE << IOPRIO_CLASS_SHIFT) == 0
+
+
+class IOGovernor:
+    """
+    Governor of the resources used by hashing
+
+    Reads are limited by two token buckets, bytes per second and reads per second,
+    shared by all the threads that use the governor. Hashing is limited
+    to a share of a CPU by a third bucket of CPU time, also shared:
+    after a block is hashed, its CPU time is charged to the bucket,
+    and the thread sleeps while the bucket is in debt, so that all the threads
+    together spend at most cpu_share of the elapsed time hashing.
+    """
+
+    def __init__(self, bytes_per_second: float = None, iops: float = None,
+                 cpu_share: float = None, burst: float = 1.0):
+        """
+        Init the governor
+
+        :param bytes_per_second: maximal read rate, None for no limit
+        :param iops: maximal number of reads per second, None for no limit
+        :param cpu_share: share of a CPU for hashing, from 0 to 1, None for no limit
+        :param burst: capacity of the token buckets, in seconds of the rate
+        """
+        if cpu_share is not None and not 0 < cpu_share <= 1:
+            raise ValueError(f"Wrong cpu share: {cpu_share}")
+        if bytes_per_second is not None and not bytes_per_second > 0:
+            raise ValueError(f"Wrong read rate: {bytes_per_second}")
+        if iops is not None and not iops > 0:
+            raise ValueError(f"Wrong number of reads per second: {iops}")
+        self.bytes_per_second = bytes_per_second
+        self.iops = iops
+        self.cpu_share = cpu_share
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._updated = time.monotonic()
+        self._byte_tokens = (bytes_per_second or 0) * burst
+        self._read_tokens = (iops or 0) * burst
+        self._cpu_updated = self._updated
+        self._cpu_tokens = 0.0
+
+    def throttle(self, size: int) -> float:
+        """
+        Charges a read of size bytes, and waits while the budget is in debt
+
+        The readers charge the bytes that a read returned, after the read,
+        so a short read at the end of a file costs only its bytes.
+
+        :param size: number of bytes read
+        :return: float -- seconds spent waiting
+        """
+        if self.bytes_per_second is None and self.iops is None:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            elapsed, self._updated = now - self._updated, now
+            delay = 0.0
+            if self.bytes_per_second is not None:
+                self._byte_tokens = min(self._byte_tokens + elapsed * self.bytes_per_second,
+                                        self.bytes_per_second * self.burst) - size
+                delay = max(delay, -self._byte_tokens / self.bytes_per_second)
+            if self.iops is not None:
+                self._read_tokens = min(self._read_tokens + elapsed * self.iops,
+                                        self.iops * self.burst) - 1
+                delay = max(delay, -self._read_tokens / self.iops)
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    def account_cpu(self, seconds: float) -> float:
+        """
+        Charges seconds of hashing to the CPU budget shared by all the threads,
+        and sleeps while the budget is in debt
+
+        :param seconds: CPU time spent hashing
+        :return: float -- seconds spent sleeping
+        """
+        if self.cpu_share is None or self.cpu_share >= 1:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            elapsed, self._cpu_updated = now - self._cpu_updated, now
+            self._cpu_tokens = min(self._cpu_tokens + elapsed * self.cpu_share,
+                                   self.cpu_share * self.burst) - seconds
+            delay = -self._cpu_tokens / self.cpu_share
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    def update(self, hash_obj, block) -> None:
+        """
+        Feeds a block to a hash object, keeping to the CPU share
+
+        :param hash_obj: hash object
+        :param block: block of bytes
+        :return: None
+        """
+        if self.cpu_share is None:
+            hash_obj.update(block)
+            return
+        start = time.thread_time()
+        hash_obj.update(block)
+        self.account_cpu(time.thread_time() - start)
@@ -0,0 +1,135 @@
+"""Persistent cache of file hashes."""
+
+import os
+import sqlite3
+import time
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'supertool')
+CACHE_FILE_NAME = 'hashes.sqlite3'
+DEFAULT_MAX_ENTRIES = 10_000_000
+DEFAULT_MAX_AGE = 30 * 24 * 60 * 60
+COMMIT_INTERVAL = 1000
+
+
+class HashCache:
+    """
+    SQLite cache of file hashes
+
+    A hash is stored under the (st_dev, st_ino) of the file and
+    the kind of the hash (algorithm and tier), together with
+    the size and the modification time of the file.
+    A stored hash is valid only while the size and the modification time
+    of the file are unchanged, otherwise it is considered missing.
+    """
+
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR,
+                 max_entries: int = DEFAULT_MAX_ENTRIES,
+                 max_age: float = DEFAULT_MAX_AGE):
+        """
+        Opens (or creates) the cache in the directory
+
+        :param directory: directory with the cache file
+        :param max_entries: maximum number of entries kept by evict
+        :param max_age: entries that were not used for max_age seconds
+        are removed by evict
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, CACHE_FILE_NAME)
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._pending = 0
+        self._now = int(time.time())
+        self._connection = sqlite3.connect(self.path)
+        self._connection.execute('CREATE TABLE IF NOT EXISTS hashes ('
+                                 'dev INTEGER, ino INTEGER, kind TEXT, '
+                                 'size INTEGER, mtime_ns INTEGER, '
+                                 'digest TEXT, used INTEGER, '
+                                 'PRIMARY KEY (dev, ino, kind))')
+        self._connection.execute('CREATE INDEX IF NOT EXISTS hashes_used ON hashes (used)')
+
+    def __enter__(self):
+        """Returns the cache itself."""
+        return self
+
+    def __exit__(self, *args):
+        """Evicts the stale entries and closes the cache."""
+        self.close()
+
+    def get(self, filename: str, kind: str, stat: os.stat_result = None) -> (str, None):
+        """
+        Returns the cached hash of a file
+
+        :param filename: filename
+        :param kind: kind of the hash
+        :param stat: result of os.stat for the file, if it is already known
+        :return: str -- hash value, or None if the hash is not cached or is stale
+        """
+        stat = stat or os.stat(filename)
+        row = self._connection.execute('SELECT size, mtime_ns, digest FROM hashes '
+                                       'WHERE dev = ? AND ino = ? AND kind = ?',
+                                       (stat.st_dev, stat.st_ino, kind)).fetchone()
+        if row is None or row[0] != stat.st_size or row[1] != stat.st_mtime_ns:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._execute('UPDATE hashes SET used = ? WHERE dev = ? AND ino = ? AND kind = ?',
+                      (self._now, stat.st_dev, stat.st_ino, kind))
+        return row[2]
+
+    def set(self, filename: str, kind: str, digest: str,
+            stat: os.stat_result = None) -> None:
+        """
+        Stores the hash of a file
+
+        :param filename: filename
+        :param kind: kind of the hash
+        :param digest: hash value
+        :param stat: result of os.stat for the file, taken before hashing
+        :return: None
+        """
+        stat = stat or os.stat(filename)
+        self._execute('INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?, ?, ?)',
+                      (stat.st_dev, stat.st_ino, kind, stat.st_size,
+                       stat.st_mtime_ns, digest, self._now))
+
+    def evict(self) -> int:
+        """
+        Removes entries that were not used for max_age seconds,
+        and the least recently used entries above max_entries
+
+        :return: int -- number of removed entries
+        """
+        removed = self._connection.execute('DELETE FROM hashes WHERE used < ?',
+                                           (self._now - self.max_age,)).rowcount
+        count = self._connection.execute('SELECT COUNT(*) FROM hashes').fetchone()[0]
+        if count > self.max_entries:
+            removed += self._connection.execute('DELETE FROM hashes WHERE rowid IN '
+                                                '(SELECT rowid FROM hashes ORDER BY used LIMIT ?)',
+                                                (count - self.max_entries,)).rowcount
+        self.flush()
+        return removed
+
+    def flush(self) -> None:
+        """Writes pending changes to the disk."""
+        self._connection.commit()
+        self._pending = 0
+
+    def close(self) -> None:
+        """Evicts the stale entries and closes the cache."""
+        self.evict()
+        self._connection.close()
+
+    def _execute(self, query: str, params: tuple) -> None:
+        """
+        Executes a modifying query, committing every COMMIT_INTERVAL queries
+
+        :param query: sql query
+        :param params: query parameters
+        :return: None
+        """
+        self._connection.execute(query, params)
+        self._pending += 1
+        if self._pending >= COMMIT_INTERVAL:
+            self.flush()
@@ -0,0 +1,121 @@
+"""Ordering and limiting of file reads by their physical location."""
+
+import os
+import struct
+import threading
+from typing import Callable
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+FS_IOC_FIEMAP = 0xC020660B
+FIEMAP_HEADER = struct.Struct('=QQLLLL')
+FIEMAP_EXTENT = struct.Struct('=QQQQQLLLL')
+IO_ORDERS = ('inode', 'physical')
+
+
+def physical_offset(filename: str) -> (int, None):
+    """
+    Returns the physical offset of the first extent of a file, using the FIEMAP ioctl
+
+    :param filename: filename
+    :return: int -- offset on the device in bytes, or None if it is not available
+    """
+    if fcntl is None:  # pragma: no cover
+        return None
+    request = bytearray(FIEMAP_HEADER.size + FIEMAP_EXTENT.size)
+    FIEMAP_HEADER.pack_into(request, 0, 0, 0xFFFFFFFFFFFFFFFF, 0, 0, 1, 0)
+    try:
+        with open(filename, 'rb') as file_object:
+            fcntl.ioctl(file_object.fileno(), FS_IOC_FIEMAP, request)
+    except OSError:
+        return None
+    if not FIEMAP_HEADER.unpack_from(request)[3]:
+        return None
+    return FIEMAP_EXTENT.unpack_from(request, FIEMAP_HEADER.size)[1]
+
+
+def locality_key(filename: str, order: str = 'inode') -> tuple:
+    """
+    Calculates a key that sorts files by their location on the devices
+
+    :param filename: filename
+    :param order: 'inode' sorts by inode number,
+    'physical' sorts by physical offset where FIEMAP is available, by inode otherwise
+    :return: tuple -- sort key
+    """
+    if order not in IO_ORDERS:
+        raise ValueError(f"Unknown io order: {order}")
+    stat = os.stat(filename)
+    offset = physical_offset(filename) if order == 'physical' else None
+    return stat.st_dev, offset if offset is not None else -1, stat.st_ino
+
+
+def is_rotational(device: int) -> bool:
+    """
+    Checks whether a device is a spinning disk, using sysfs
+
+    :param device: st_dev of a file on the device
+    :return: bool -- True for a rotational device, False if it is not or it is unknown
+    """
+    if not hasattr(os, 'major'):  # pragma: no cover
+        return False
+    block = f'/sys/dev/block/{os.major(device)}:{os.minor(device)}'
+    for queue_path in (os.path.join(block, 'queue', 'rotational'),
+                       os.path.join(block, '..', 'queue', 'rotational')):
+        try:
+            with open(queue_path) as queue_file:
+                return queue_file.read().strip() == '1'
+        except OSError:
+            continue
+    return False
+
+
+class DeviceLimitedKey:
+    """
+    Wrapper of a key function that limits the number of concurrent calls per device
+
+    Files on rotational devices are read by at most rotational_workers threads
+    at a time, files on other devices are not limited.
+    It limits threads of a single process, so it is useless with a process pool.
+    """
+
+    def __init__(self, key_func: Callable, rotational_workers: int = 1):
+        """
+        Init the wrapper
+
+        :param key_func: function that calculates a key for a path
+        :param rotational_workers: maximal number of concurrent calls per rotational device
+        """
+        self.key_func = key_func
+        self.rotational_workers = rotational_workers
+        self._lock = threading.Lock()
+        self._semaphores = {}
+
+    def _semaphore(self, device: int) -> (threading.Semaphore, None):
+        """
+        Returns the semaphore of a device
+
+        :param device: st_dev of the device
+        :return: Semaphore -- semaphore, or None if the device is not limited
+        """
+        with self._lock:
+            if device not in self._semaphores:
+                self._semaphores[device] = (threading.Semaphore(self.rotational_workers)
+                                            if is_rotational(device) else None)
+            return self._semaphores[device]
+
+    def __call__(self, filename: str):
+        """
+        Calls the key function, waiting for a free slot of the device of the file
+
+        :param filename: filename
+        :return: key of the file
+        """
+        semaphore = self._semaphore(os.stat(filename).st_dev)
+        if semaphore is None:
+            return self.key_func(filename)
+        with semaphore:
+            return self.key_func(filename)
@@ -0,0 +1,290 @@
+"""Near-duplicate text files, found by MinHash signatures and locality-sensitive hashing."""
+
+import collections
+import hashlib
+import itertools
+import re
+from typing import Iterable, Iterator, TextIO
+
+from supertool.path_filter import PathFilter
+from supertool.similar_files_finder import scan_records
+
+SHINGLE_SIZE = 5
+NUM_PERMUTATIONS = 128
+DEFAULT_THRESHOLD = 0.8
+DEFAULT_MAX_BUCKET_SIZE = 64
+BINARY_SNIFF_SIZE = 8192
+SHINGLE_HASH_BITS = 64
+WORD_RE = re.compile(r'\w+')
+
+
+def iter_shingles(f_obj: TextIO, size: int = SHINGLE_SIZE) -> Iterator:
+    """
+    Generator of the hashes of the shingles of a text
+
+    A shingle is a run of size consecutive words, words are
+    lowercased and split by anything but letters and digits,
+    so reformatted lines and rewrapped paragraphs give the same shingles.
+    A text shorter than size words is a single shingle.
+
+    :param f_obj: text file for reading
+    :param size: number of words in a shingle
+    :return: int -- 64-bit hash of a shingle
+    """
+    words = collections.deque(maxlen=size)
+    complete = False
+    for line in f_obj:
+        for word in WORD_RE.findall(line.lower()):
+            words.append(word)
+            if len(words) == size:
+                complete = True
+                yield _shingle_hash(words)
+    if words and not complete:
+        yield _shingle_hash(words)
+
+
+def _shingle_hash(words: Iterable) -> int:
+    """
+    Hashes the words of a shingle
+
+    :param words: words of the shingle
+    :return: int -- 64-bit hash
+    """
+    return int.from_bytes(hashlib.blake2b(' '.join(words).encode(), digest_size=8).digest(), 'little')
+
+
+def is_text_file(filename: str) -> bool:
+    """
+    Checks that a file looks like text: its first bytes have no NUL byte
+
+    :param filename: filename
+    :return: bool -- True for a text file
+    """
+    with open(filename, 'rb') as file_object:
+        return b'\0' not in file_object.read(BINARY_SNIFF_SIZE)
+
+
+def lsh_parameters(threshold: float, num_permutations: int = NUM_PERMUTATIONS) -> tuple:
+    """
+    Chooses the banding of signatures for a similarity threshold
+
+    Two files with the Jaccard similarity s share a bucket with
+    the probability 1 - (1 - s ** rows) ** bands, that rises most steeply
+    around (1 / bands) ** (1 / rows); the banding that puts this point
+    closest to the threshold, slightly below it to miss fewer pairs, is chosen.
+
+    :param threshold: similarity threshold, from 0 to 1
+    :param num_permutations: length of the signatures
+    :return: tuple(int, int) -- number of bands and number of rows in a band
+    """
+    if not 0 < threshold <= 1:
+        raise ValueError("Threshold must be above 0 and at most 1")
+    candidates = [(num_permutations // rows, rows) for rows in range(1, num_permutations + 1)
+                  if num_permutations % rows == 0]
+    return min(candidates, key=lambda banding: abs((1 / banding[0]) ** (1 / banding[1])
+                                                   - threshold * 0.9))
+
+
+class MinHasher:
+    """
+    MinHash signatures of the shingles of text files, by one-permutation hashing
+
+    Every shingle is hashed once: the hash picks one of num_permutations bins,
+    and the bin keeps the minimum of the rest of the hash. The share of equal
+    bins of two signatures estimates the Jaccard similarity of the sets
+    of shingles, like num_permutations independent hash functions would,
+    at the cost of one hash per shingle. An empty bin of a short text
+    takes the value of the next filled bin (densification), marked
+    with the distance to it, so that signatures of short texts stay comparable.
+    Shingles are taken as the file is read, only the bins are kept in memory.
+    """
+
+    def __init__(self, num_permutations: int = NUM_PERMUTATIONS,
+                 shingle_size: int = SHINGLE_SIZE):
+        """
+        Creates the hasher
+
+        :param num_permutations: length of the signatures, the number of bins
+        :param shingle_size: number of words in a shingle
+        """
+        if num_permutations <= 0 or shingle_size <= 0:
+            raise ValueError("Number of permutations and shingle size must be positive")
+        self.num_permutations = num_permutations
+        self.shingle_size = shingle_size
+
+    def signature(self, filename: str) -> (tuple, None):
+        """
+        Calculates the signature of a text file
+
+        :param filename: filename
+        :return: tuple of int -- signature, or None for an empty or binary file
+        """
+        if not is_text_file(filename):
+            return None
+        bins = self.num_permutations
+        minimums = [None] * bins
+        with open(filename, 'r', encoding='utf-8', errors='replace') as file_object:
+            for shingle in iter_shingles(file_object, self.shingle_size):
+                value, index = divmod(shingle, bins)
+                if minimums[index] is None or value < minimums[index]:
+                    minimums[index] = value
+        if all(value is None for value in minimums):
+            return None
+        signature = list(minimums)
+        for index in range(bins):
+            if signature[index] is None:
+                distance = next(distance for distance in range(1, bins)
+                                if minimums[(index + distance) % bins] is not None)
+                signature[index] = minimums[(index + distance) % bins] + (distance << SHINGLE_HASH_BITS)
+        return tuple(signature)
+
+
+def estimate_similarity(first: tuple, second: tuple) -> float:
+    """
+    Estimates the Jaccard similarity of two files by their signatures
+
+    :param first: signature of the first file
+    :param second: signature of the second file
+    :return: float -- share of equal values
+    """
+    return sum(x == y for x, y in zip(first, second)) / len(first)
+
+
+class LSHIndex:
+    """
+    Index of the MinHash signatures of text files in banded buckets
+
+    A signature is cut into bands, and a file is put into
+    one bucket per band by the values of the band. Files that share
+    a bucket are the candidate pairs, so only files that are likely
+    similar are compared, instead of all the pairs.
+    Files with the same signature are collapsed first: only the first
+    of them is put into the buckets, the others are kept as its copies.
+    Buckets of more than max_bucket_size files (boilerplate texts)
+    are ignored when the pairs are counted, so that they do not make it quadratic,
+    see crowded_buckets.
+    """
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD,
+                 num_permutations: int = NUM_PERMUTATIONS, shingle_size: int = SHINGLE_SIZE,
+                 max_bucket_size: int = DEFAULT_MAX_BUCKET_SIZE):
+        """
+        Creates an empty index
+
+        :param threshold: minimal estimated similarity of the reported pairs, from 0 to 1
+        :param num_permutations: length of the signatures
+        :param shingle_size: number of words in a shingle
+        :param max_bucket_size: maximal number of files of a bucket counted in candidate_pairs
+        """
+        self.hasher = MinHasher(num_permutations, shingle_size)
+        self.threshold = threshold
+        self.max_bucket_size = max_bucket_size
+        self.bands, self.rows = lsh_parameters(threshold, num_permutations)
+        self.paths = []
+        self.signatures = []
+        self.buckets = [collections.defaultdict(list) for _ in range(self.bands)]
+        self.copies = collections.defaultdict(list)
+        self._file_ids = {}
+        self._inodes = set()
+
+    def __len__(self) -> int:
+        """Returns the number of indexed files, with the copies."""
+        return len(self.paths) + sum(map(len, self.copies.values()))
+
+    def add(self, filename: str) -> bool:
+        """
+        Adds a text file to the index
+
+        A file with the signature of an indexed file is only recorded as its copy.
+
+        :param filename: path to the file
+        :return: bool -- True if the file was added, False for an empty or binary file
+        """
+        signature = self.hasher.signature(filename)
+        if signature is None:
+            return False
+        if signature in self._file_ids:
+            self.copies[self._file_ids[signature]].append(filename)
+            return True
+        file_id = len(self.paths)
+        self._file_ids[signature] = file_id
+        for band, buckets in enumerate(self.buckets):
+            buckets[signature[band * self.rows:(band + 1) * self.rows]].append(file_id)
+        self.paths.append(filename)
+        self.signatures.append(signature)
+        return True
+
+    def build(self, path: (str, Iterable), path_filter: PathFilter = None) -> int:
+        """
+        Indexes the text files of the directory trees,
+        files that can not be read and hardlinks to indexed files are skipped
+
+        :param path: path to the directory, or an iterable of paths, see similar_files_finder.as_roots
+        :param path_filter: filter of the files by their paths and sizes
+        :return: int -- number of indexed files
+        """
+        count = 0
+        for _, device, inode, file_path in scan_records(path, path_filter=path_filter):
+            if (device, inode) in self._inodes:
+                continue
+            self._inodes.add((device, inode))
+            try:
+                count += self.add(file_path)
+            except OSError:
+                continue
+        return count
+
+    def candidate_pairs(self) -> set:
+        """
+        Finds the pairs of files that share a bucket
+
+        :return: set of pairs of file ids
+        """
+        pairs = set()
+        for buckets in self.buckets:
+            for file_ids in buckets.values():
+                if len(file_ids) <= self.max_bucket_size:
+                    pairs.update(itertools.combinations(file_ids, 2))
+        return pairs
+
+    def crowded_buckets(self) -> int:
+        """
+        Counts the buckets that candidate_pairs ignores, as they hold too many files
+
+        :return: int -- number of the buckets
+        """
+        return sum(len(file_ids) > self.max_bucket_size
+                   for buckets in self.buckets for file_ids in buckets.values())
+
+    def near_duplicates(self) -> list:
+        """
+        Finds the pairs of near-duplicate files
+
+        Every copy of a file with the same signature is paired with the first file.
+
+        :return: list of tuples (estimated similarity, path, path), the most similar pairs first
+        """
+        pairs = [(1.0, self.paths[file_id], copy)
+                 for file_id, copies in self.copies.items() for copy in copies]
+        for first, second in self.candidate_pairs():
+            similarity = estimate_similarity(self.signatures[first], self.signatures[second])
+            if similarity >= self.threshold:
+                pairs.append((similarity, self.paths[first], self.paths[second]))
+        pairs.sort(key=lambda pair: (-pair[0], pair[1], pair[2]))
+        return pairs
+
+
+def near_duplicates_printer(pairs: list) -> None:
+    """
+    Displays pairs of near-duplicate files on the screen
+
+    :param pairs: list of tuples (similarity, path, path), see LSHIndex.near_duplicates
+    :return: None
+    """
+    if not pairs:
+        print('Near duplicates not found!')
+        return
+    print('Near duplicates found:')
+    for similarity, first, second in pairs:
+        print(f'---\n{similarity:.0%} similar')
+        print(f'{first}\n{second}', flush=True)
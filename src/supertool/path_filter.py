@@ -0,0 +1,112 @@
+"""Filters of the files and the directories found by a walk."""
+
+import fnmatch
+import os
+import re
+from typing import Iterable
+
+REGEX_PREFIX = 're:'
+
+
+def compile_patterns(patterns: Iterable) -> tuple:
+    """
+    Compiles patterns into a matcher of names and a matcher of paths
+
+    A glob without a slash is matched against the name, a glob with a slash
+    is matched against the whole path, and a regular expression
+    (with the REGEX_PREFIX) is searched in the whole path.
+
+    :param patterns: globs or regular expressions
+    :return: tuple -- compiled regular expressions of names and of paths,
+    None if there are no patterns of the kind
+    """
+    name_patterns, path_patterns = [], []
+    for pattern in patterns:
+        if pattern.startswith(REGEX_PREFIX):
+            path_patterns.append(pattern[len(REGEX_PREFIX):])
+        elif '/' in pattern or os.sep in pattern:
+            path_patterns.append(r'\A' + fnmatch.translate(pattern))
+        else:
+            name_patterns.append(fnmatch.translate(pattern))
+    try:
+        return tuple(re.compile('|'.join(f'(?:{pattern})' for pattern in patterns))
+                     if patterns else None
+                     for patterns in (name_patterns, path_patterns))
+    except re.error as error:
+        raise ValueError(f"Wrong pattern: {error}")
+
+
+class PathFilter:
+    """
+    Filter of the files and the directories found by a walk
+
+    Patterns are globs (see fnmatch), or regular expressions
+    with the 're:' prefix, see compile_patterns.
+    Directories that match an exclude pattern are not descended into.
+    Files are taken if they match no exclude pattern and,
+    when include patterns are given, at least one include pattern;
+    include patterns do not prune directories.
+    Files are also filtered by size, before they are grouped.
+    """
+
+    def __init__(self, include: Iterable = (), exclude: Iterable = (),
+                 min_size: int = 0, max_size: int = None):
+        """
+        Init the filter
+
+        :param include: patterns of the files to take, all the files by default
+        :param exclude: patterns of the files and the directories to skip
+        :param min_size: minimal size of a file in bytes
+        :param max_size: maximal size of a file in bytes, None for no limit
+        """
+        if max_size is not None and max_size < (min_size or 0):
+            raise ValueError(f"Wrong size range: {min_size}-{max_size}")
+        self.include = compile_patterns(include)
+        self.exclude = compile_patterns(exclude)
+        self.min_size = min_size or 0
+        self.max_size = max_size
+
+    @staticmethod
+    def _matches(matchers: tuple, path: str, name: str) -> bool:
+        """
+        Checks whether a path matches compiled patterns
+
+        :param matchers: compiled patterns, see compile_patterns
+        :param path: path to the file or the directory
+        :param name: name of the file or the directory
+        :return: bool -- True if any pattern matches
+        """
+        names, paths = matchers
+        return bool(names is not None and names.match(name)
+                    or paths is not None and paths.search(path))
+
+    def allows_directory(self, path: str, name: str) -> bool:
+        """
+        Checks whether the walk descends into a directory
+
+        :param path: path to the directory
+        :param name: name of the directory
+        :return: bool -- True if the directory is not excluded
+        """
+        return not self._matches(self.exclude, path, name)
+
+    def allows_file(self, path: str, name: str) -> bool:
+        """
+        Checks whether the walk takes a file, by its path
+
+        :param path: path to the file
+        :param name: name of the file
+        :return: bool -- True if the file is included and not excluded
+        """
+        if self._matches(self.exclude, path, name):
+            return False
+        return self.include == (None, None) or self._matches(self.include, path, name)
+
+    def allows_size(self, size: int) -> bool:
+        """
+        Checks whether the walk takes a file, by its size
+
+        :param size: size of the file
+        :return: bool -- True if the size is within the limits
+        """
+        return size >= self.min_size and (self.max_size is None or size <= self.max_size)
@@ -0,0 +1,224 @@
+"""Compact result files of the duplicates search."""
+
+import contextlib
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from typing import Iterable, Iterator, TextIO
+
+MAGIC = b'SFDR'
+VERSION = 1
+# magic, version, number of groups, number of paths,
+# offsets of the groups table and of the paths table
+HEADER = struct.Struct('<4sIQQQQ')
+# offset and length of the key in the string table, index of the first path, number of paths
+GROUP_ENTRY = struct.Struct('<QQQQ')
+# offset and length of the path in the string table
+PATH_ENTRY = struct.Struct('<QQ')
+
+
+@contextlib.contextmanager
+def replacing_file(filename: str, mode: str = 'w') -> Iterator:
+    """
+    Opens a temporary file next to filename, that replaces it only when the writing succeeds,
+    so an error or an interrupted search leaves the previous file intact
+
+    :param filename: path to the file
+    :param mode: mode of open, 'w' or 'wb'
+    :return: file object for writing
+    """
+    temp_filename = f'{filename}.tmp'
+    try:
+        with open(temp_filename, mode) as file_object:
+            yield file_object
+        os.replace(temp_filename, filename)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(temp_filename)
+        raise
+
+
+def write_binary_report(duplicates: (dict, Iterable), filename: str) -> int:
+    """
+    Writes groups of duplicates into a binary report file
+
+    The file consists of a header, a string table with the keys and the paths,
+    a table of groups and a table of paths, see DuplicateReport.
+    Groups are written as soon as they are taken from duplicates,
+    only the tables (32 bytes per group and 16 bytes per path) are kept in memory.
+    The file is replaced only when all the groups are written, see replacing_file.
+
+    :param duplicates: a dictionary of duplicates, or an iterable of pairs (hash, list of paths)
+    :param filename: path to the report file
+    :return: int -- number of written groups
+    """
+    if isinstance(duplicates, dict):
+        duplicates = duplicates.items()
+    groups, paths = array('Q'), array('Q')
+    with replacing_file(filename, 'wb') as report_file:
+        report_file.write(HEADER.pack(MAGIC, VERSION, 0, 0, 0, 0))
+        offset = HEADER.size
+        for key, values in duplicates:
+            encoded_key = str(key).encode()
+            report_file.write(encoded_key)
+            groups.extend((offset, len(encoded_key), len(paths) // 2, len(values)))
+            offset += len(encoded_key)
+            for path in values:
+                encoded_path = os.fsencode(path)
+                report_file.write(encoded_path)
+                paths.extend((offset, len(encoded_path)))
+                offset += len(encoded_path)
+        groups_offset = offset
+        report_file.write(_little_endian(groups))
+        paths_offset = groups_offset + len(groups) * groups.itemsize
+        report_file.write(_little_endian(paths))
+        report_file.seek(0)
+        report_file.write(HEADER.pack(MAGIC, VERSION, len(groups) // 4, len(paths) // 2,
+                                      groups_offset, paths_offset))
+    return len(groups) // 4
+
+
+def _little_endian(values: array) -> bytes:
+    """
+    Converts an array of native integers into little-endian bytes
+
+    :param values: array of integers
+    :return: bytes -- little-endian representation
+    """
+    if sys.byteorder == 'little':
+        return values.tobytes()
+    swapped = array(values.typecode, values)
+    swapped.byteswap()
+    return swapped.tobytes()
+
+
+class DuplicateReport:
+    """
+    Binary report of duplicates, read through a memory map
+
+    Nothing is parsed when the report is opened: a group is located
+    by its fixed-size entry, and its key and paths are decoded only when
+    they are accessed, so a report of millions of paths is opened
+    in constant time and memory. raw_path returns a view of the mapped
+    bytes without copying.
+    """
+
+    def __init__(self, filename: str):
+        """
+        Opens the report
+
+        :param filename: path to the report file
+        """
+        with open(filename, 'rb') as report_file:
+            try:
+                self._map = mmap.mmap(report_file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise ValueError(f"Wrong report file: {filename}")
+        if len(self._map) < HEADER.size:
+            self.close()
+            raise ValueError(f"Wrong report file: {filename}")
+        magic, version, self.groups, self.paths, self._groups_offset, self._paths_offset = \
+            HEADER.unpack_from(self._map)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"Wrong report file: {filename}")
+        self._view = memoryview(self._map)
+
+    def __enter__(self):
+        """Returns the report itself."""
+        return self
+
+    def __exit__(self, *args):
+        """Closes the report."""
+        self.close()
+
+    def __len__(self) -> int:
+        """Returns the number of groups."""
+        return self.groups
+
+    def __getitem__(self, index: int) -> tuple:
+        """
+        Returns a group of duplicates
+
+        :param index: index of the group
+        :return: tuple(str, list) -- hash and the list of paths to the same files
+        """
+        return self.key(index), list(self.group_paths(index))
+
+    def __iter__(self) -> Iterator:
+        """Iterates over the groups, like similar_files_finder.iter_duplicates."""
+        return (self[index] for index in range(len(self)))
+
+    def _group(self, index: int) -> tuple:
+        """
+        Returns the entry of a group
+
+        :param index: index of the group
+        :return: tuple(int, int, int, int) -- offset and length of the key,
+        index of the first path and the number of paths
+        """
+        if not 0 <= index < self.groups:
+            raise IndexError(index)
+        return GROUP_ENTRY.unpack_from(self._map, self._groups_offset + index * GROUP_ENTRY.size)
+
+    def key(self, index: int) -> str:
+        """
+        Returns the hash of a group
+
+        :param index: index of the group
+        :return: str -- hash value
+        """
+        offset, length, _, _ = self._group(index)
+        return self._map[offset:offset + length].decode()
+
+    def raw_path(self, index: int) -> memoryview:
+        """
+        Returns the bytes of a path without copying them
+
+        :param index: index of the path in the paths table
+        :return: memoryview -- view of the encoded path, valid while the report is open
+        """
+        if not 0 <= index < self.paths:
+            raise IndexError(index)
+        offset, length = PATH_ENTRY.unpack_from(self._map, self._paths_offset + index * PATH_ENTRY.size)
+        return self._view[offset:offset + length]
+
+    def group_paths(self, index: int) -> Iterator:
+        """
+        Generator of the paths of a group
+
+        :param index: index of the group
+        :return: str -- path to a file
+        """
+        _, _, first, count = self._group(index)
+        for path_index in range(first, first + count):
+            yield os.fsdecode(bytes(self.raw_path(path_index)))
+
+    def close(self) -> None:
+        """Closes the report, views returned by raw_path must be released before."""
+        if getattr(self, '_view', None) is not None:
+            self._view.release()
+        self._map.close()
+
+
+def write_json_lines(duplicates: (dict, Iterable), file_object: TextIO) -> int:
+    """
+    Writes groups of duplicates as JSON Lines, one object per group:
+    {"hash": "...", "paths": ["...", ...]}
+
+    Groups are written as soon as they are taken from duplicates.
+
+    :param duplicates: a dictionary of duplicates, or an iterable of pairs (hash, list of paths)
+    :param file_object: text file for writing
+    :return: int -- number of written groups
+    """
+    if isinstance(duplicates, dict):
+        duplicates = duplicates.items()
+    count = 0
+    for key, values in duplicates:
+        file_object.write(json.dumps({'hash': key, 'paths': list(values)}) + '\n')
+        count += 1
+    return count
@@ -0,0 +1,237 @@
+"""Snapshots of scans, for incremental rescans of mostly static trees."""
+
+import gzip
+import json
+import os
+import stat as stat_module
+import tempfile
+import time
+from typing import Iterable, Iterator
+
+SNAPSHOT_VERSION = 1
+# File systems take timestamps from a coarse clock, so directories modified
+# shortly before a scan started are listed again by the next scan
+MTIME_SLACK_NS = 1_000_000_000
+
+
+class ScanSnapshot:
+    """
+    Snapshot of a scan of a directory tree
+
+    For each directory, the snapshot keeps its modification time,
+    the names of its subdirectories and the metadata of its regular files
+    (name, size, st_dev, st_ino, mtime_ns), and for hashed files it keeps
+    their hashes, like HashCache does.
+
+    A rescan with the previous snapshot lists only the directories whose
+    modification time changed: creating, removing or renaming an entry
+    changes the modification time of its directory, so the listing
+    of an unchanged directory is taken from the snapshot.
+    Subdirectories are still visited, because a change deep in the tree
+    does not change the modification time of the ancestors.
+    A file rewritten in place does not change its directory either:
+    its hash is recalculated, since hashes are checked against the current
+    size and modification time, but a new size of the file is noticed
+    only if stat_files is set, which stats the files of unchanged directories.
+    Directories modified around the start of the previous scan are always listed.
+    """
+
+    def __init__(self, previous: 'ScanSnapshot' = None, stat_files: bool = False):
+        """
+        Init an empty snapshot
+
+        :param previous: snapshot of the previous scan, whose directories
+        and hashes are reused
+        :param stat_files: stat the files of unchanged directories
+        """
+        self.previous = previous
+        self.stat_files = stat_files
+        self.started_ns = int(time.time() * 1e9)
+        self.directories = {}
+        self.hashes = {}
+        self.listed_directories = 0
+        self.reused_directories = 0
+
+    @classmethod
+    def load(cls, filename: str, stat_files: bool = False) -> 'ScanSnapshot':
+        """
+        Loads a saved snapshot and returns a new snapshot that reuses it
+
+        A missing file is treated as an empty previous snapshot.
+
+        :param filename: path to the snapshot file
+        :param stat_files: stat the files of unchanged directories
+        :return: ScanSnapshot -- empty snapshot for the next scan
+        """
+        previous = cls()
+        try:
+            with gzip.open(filename, 'rt', encoding='utf-8') as snapshot_file:
+                data = json.load(snapshot_file)
+        except FileNotFoundError:
+            return cls(previous, stat_files)
+        except (OSError, ValueError) as error:
+            raise ValueError(f"Wrong snapshot file {filename}: {error}")
+        if data.get('version') != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported snapshot version: {data.get('version')}")
+        previous.started_ns = data['started_ns']
+        previous.directories = {path: (mtime_ns, dirs, [tuple(record) for record in files])
+                                for path, mtime_ns, dirs, files in data['directories']}
+        previous.hashes = {(device, inode, kind): (size, mtime_ns, digest)
+                           for device, inode, kind, size, mtime_ns, digest in data['hashes']}
+        return cls(previous, stat_files)
+
+    def save(self, filename: str) -> None:
+        """
+        Saves the snapshot, replacing the file atomically
+
+        :param filename: path to the snapshot file
+        :return: None
+        """
+        data = {
+            'version': SNAPSHOT_VERSION,
+            'started_ns': self.started_ns,
+            'directories': [[path, mtime_ns, dirs, files]
+                            for path, (mtime_ns, dirs, files) in self.directories.items()],
+            'hashes': [[*key, *value] for key, value in self.hashes.items()],
+        }
+        directory = os.path.dirname(os.path.abspath(filename))
+        descriptor, temp_path = tempfile.mkstemp(prefix='snapshot-', dir=directory)
+        try:
+            with os.fdopen(descriptor, 'wb') as raw_file, \
+                    gzip.open(raw_file, 'wt', encoding='utf-8') as snapshot_file:
+                json.dump(data, snapshot_file, separators=(',', ':'))
+            os.replace(temp_path, filename)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    def _reusable_listing(self, path: str, mtime_ns: int) -> (tuple, None):
+        """
+        Returns the listing of a directory from the previous snapshot
+
+        :param path: path to the directory
+        :param mtime_ns: current modification time of the directory
+        :return: tuple(list, list) -- names of subdirectories and file records,
+        or None if the directory changed
+        """
+        if self.previous is None:
+            return None
+        listing = self.previous.directories.get(path)
+        if listing is None or listing[0] != mtime_ns:
+            return None
+        if mtime_ns >= self.previous.started_ns - MTIME_SLACK_NS:
+            return None
+        dirs, files = listing[1], listing[2]
+        if self.stat_files:
+            refreshed = []
+            for name, *_ in files:
+                try:
+                    stat = os.lstat(os.path.join(path, name))
+                except OSError:
+                    continue
+                if stat_module.S_ISREG(stat.st_mode):
+                    refreshed.append((name, stat.st_size, stat.st_dev, stat.st_ino,
+                                      stat.st_mtime_ns))
+            files = refreshed
+        return dirs, files
+
+    def scan(self, path: (str, Iterable), progress=None, path_filter=None) -> Iterator:
+        """
+        Generator of records of the regular files of the directory trees,
+        that fills the snapshot
+
+        Symbolic links and special files are skipped,
+        directories that can not be read are ignored,
+        like similar_files_finder.scan_files does.
+        The snapshot keeps the directories unfiltered, so that it can be reused
+        with another filter, but excluded directories are not descended into.
+
+        :param path: path to the directory, or an iterable of paths
+        :param progress: progress of the scan, see similar_files_finder.ScanProgress
+        :param path_filter: filter of the files by their paths and sizes,
+        see path_filter.PathFilter
+        :return: tuple(int, int, int, str) -- record (size, st_dev, st_ino, path)
+        """
+        directories = [path] if isinstance(path, str) else list(reversed(list(path)))
+        roots = set(directories)
+        while directories:
+            directory = directories.pop()
+            if progress is not None:
+                progress.walked(directories=1)
+            try:
+                # a root may be a symbolic link, whose own mtime never changes
+                mtime_ns = (os.stat(directory) if directory in roots
+                            else os.lstat(directory)).st_mtime_ns
+            except OSError:
+                continue
+            listing = self._reusable_listing(directory, mtime_ns)
+            if listing is not None:
+                self.reused_directories += 1
+                dirs, files = listing
+            else:
+                dirs, files = [], []
+                try:
+                    with os.scandir(directory) as entries:
+                        for entry in entries:
+                            try:
+                                if entry.is_dir(follow_symlinks=False):
+                                    dirs.append(entry.name)
+                                elif entry.is_file(follow_symlinks=False):
+                                    stat = entry.stat(follow_symlinks=False)
+                                    files.append((entry.name, stat.st_size, stat.st_dev,
+                                                  stat.st_ino, stat.st_mtime_ns))
+                            except OSError:
+                                continue
+                except OSError:
+                    continue
+                self.listed_directories += 1
+            self.directories[directory] = (mtime_ns, dirs, files)
+            for name in dirs:
+                subdirectory = os.path.join(directory, name)
+                if path_filter is None or path_filter.allows_directory(subdirectory, name):
+                    directories.append(subdirectory)
+            for name, size, device, inode, _ in files:
+                filename = os.path.join(directory, name)
+                if path_filter is not None and not (path_filter.allows_file(filename, name)
+                                                    and path_filter.allows_size(size)):
+                    continue
+                if progress is not None:
+                    progress.walked(files=1)
+                yield size, device, inode, filename
+
+    def get(self, filename: str, kind: str, stat: os.stat_result = None) -> (str, None):
+        """
+        Returns the hash of a file from this or the previous snapshot
+
+        :param filename: filename
+        :param kind: kind of the hash, see similar_files_finder.hash_kind
+        :param stat: result of os.stat for the file, if it is already known
+        :return: str -- hash value, or None if the hash is not known or is stale
+        """
+        stat = stat or os.stat(filename)
+        key = (stat.st_dev, stat.st_ino, kind)
+        for snapshot in (self, self.previous):
+            if snapshot is None or key not in snapshot.hashes:
+                continue
+            size, mtime_ns, digest = snapshot.hashes[key]
+            if size == stat.st_size and mtime_ns == stat.st_mtime_ns:
+                self.hashes[key] = size, mtime_ns, digest
+                return digest
+        return None
+
+    def set(self, filename: str, kind: str, digest: str,
+            stat: os.stat_result = None) -> None:
+        """
+        Stores the hash of a file
+
+        :param filename: filename
+        :param kind: kind of the hash
+        :param digest: hash value
+        :param stat: result of os.stat for the file, taken before hashing
+        :return: None
+        """
+        stat = stat or os.stat(filename)
+        self.hashes[stat.st_dev, stat.st_ino, kind] = stat.st_size, stat.st_mtime_ns, digest
+
+    def flush(self) -> None:
+        """Does nothing, the snapshot is written by save."""
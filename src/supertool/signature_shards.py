@@ -0,0 +1,156 @@
+"""Signature shards of storage nodes, merged offline to find duplicates across the nodes."""
+
+import functools
+import gzip
+import hashlib
+import heapq
+import itertools
+import json
+import os
+import socket
+from typing import Callable, Iterable, Iterator
+
+from supertool.path_filter import PathFilter
+from supertool.similar_files_finder import (MAP_CHUNK_SIZE, PARTIAL_SAMPLE_SIZE,
+                                            create_executor, get_hash, get_hash_function,
+                                            get_partial_hash, scan_records)
+
+SHARD_VERSION = 1
+
+
+def file_signature(filename: str, hash_func: Callable = hashlib.md5,
+                   sample_size: int = PARTIAL_SAMPLE_SIZE,
+                   with_middle: bool = False) -> (tuple, None):
+    """
+    Calculates the partial and the full hash of a file
+
+    :param filename: filename
+    :param hash_func: hash function
+    :param sample_size: size of each sample of the partial hash
+    :param with_middle: also sample the middle of the file
+    :return: tuple(str, str) -- partial and full hash, or None if the file can not be read
+    """
+    try:
+        return (get_partial_hash(filename, sample_size, with_middle, hash_func),
+                get_hash(filename, hash_func))
+    except OSError:
+        return None
+
+
+def write_shard(path: (str, Iterable), filename: str, node_id: str = None,
+                algorithm: str = 'md5', sample_size: int = PARTIAL_SAMPLE_SIZE,
+                with_middle: bool = False, workers: int = 1, pool: str = 'thread',
+                path_filter: PathFilter = None) -> int:
+    """
+    Writes the signature shard of the files of a node
+
+    The shard is a gzipped text file: a JSON header with the node id
+    and the hash settings, followed by a JSON line [size, partial hash, full hash, path]
+    for every file, sorted by size and hashes, so that shards of
+    all the nodes are joined by merge_shards in a single pass.
+    Sizes of the files on other nodes are not known here,
+    so every file gets both hashes; hardlinks are hashed once.
+
+    :param path: path to the directory, or an iterable of paths, see similar_files_finder.as_roots
+    :param filename: path to the shard file
+    :param node_id: name of the node, the host name by default
+    :param algorithm: name of the hash algorithm, see similar_files_finder.HASH_ALGORITHMS
+    :param sample_size: size of each sample of the partial hash
+    :param with_middle: also sample the middle of files
+    :param workers: number of workers that hash files in parallel
+    :param pool: kind of workers: 'thread' or 'process'
+    :param path_filter: filter of the files by their paths and sizes
+    :return: int -- number of files in the shard
+    """
+    hash_func = get_hash_function(algorithm)
+    records = list(scan_records(path, path_filter=path_filter))
+    inodes = {}
+    for size, device, inode, file_path in records:
+        inodes.setdefault((device, inode), file_path)
+    signature_func = functools.partial(file_signature, hash_func=hash_func,
+                                       sample_size=sample_size, with_middle=with_middle)
+    executor = create_executor(workers, pool)
+    try:
+        if executor is None:
+            signatures = map(signature_func, inodes.values())
+        else:
+            signatures = executor.map(signature_func, inodes.values(), chunksize=MAP_CHUNK_SIZE)
+        signatures = dict(zip(inodes, signatures))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    rows = sorted((size, *signatures[device, inode], file_path)
+                  for size, device, inode, file_path in records
+                  if signatures[device, inode] is not None)
+    header = {'version': SHARD_VERSION, 'node': node_id or socket.gethostname(),
+              'algorithm': algorithm, 'sample_size': sample_size, 'with_middle': with_middle}
+    temp_filename = f'{filename}.tmp'
+    with gzip.open(temp_filename, 'wt', encoding='utf-8') as shard_file:
+        shard_file.write(json.dumps(header) + '\n')
+        for row in rows:
+            shard_file.write(json.dumps(row) + '\n')
+    os.replace(temp_filename, filename)
+    return len(rows)
+
+
+def read_shard_header(filename: str) -> dict:
+    """
+    Reads the header of a shard
+
+    :param filename: path to the shard file
+    :return: dict -- node id and hash settings of the shard
+    """
+    try:
+        with gzip.open(filename, 'rt', encoding='utf-8') as shard_file:
+            header = json.loads(shard_file.readline())
+    except (OSError, EOFError, ValueError):
+        raise ValueError(f"Wrong shard file: {filename}")
+    if not isinstance(header, dict) or header.get('version') != SHARD_VERSION:
+        raise ValueError(f"Wrong shard file: {filename}")
+    return header
+
+
+def read_shard(filename: str) -> Iterator:
+    """
+    Generator of the signatures of a shard
+
+    :param filename: path to the shard file
+    :return: tuple(int, str, str, str, str) -- size, partial hash, full hash, node id and path
+    """
+    node = read_shard_header(filename)['node']
+    with gzip.open(filename, 'rt', encoding='utf-8') as shard_file:
+        shard_file.readline()
+        for line in shard_file:
+            size, partial, full, path = json.loads(line)
+            yield size, partial, full, node, path
+
+
+def merge_shards(filenames: Iterable, cross_node_only: bool = True) -> Iterator:
+    """
+    Generator of duplicates found in the shards of several nodes
+
+    The shards are sorted, so they are joined by a k-way merge:
+    besides the current group, only one signature per shard is kept
+    in memory, and no file content leaves the nodes.
+
+    :param filenames: paths to the shard files
+    :param cross_node_only: report only groups of files on more than one node
+    :return: tuple(str, list) -- full hash and the sorted list of 'node:path' of the same files
+    """
+    filenames = list(filenames)
+    headers = [read_shard_header(filename) for filename in filenames]
+    nodes = [header['node'] for header in headers]
+    if len(set(nodes)) != len(nodes):
+        raise ValueError("Every shard must come from another node")
+    settings = {(header['algorithm'], header['sample_size'], header['with_middle'])
+                for header in headers}
+    if len(settings) > 1:
+        raise ValueError("Shards were written with different hash settings")
+
+    signatures = heapq.merge(*(read_shard(filename) for filename in filenames))
+    for (_, _, full), group in itertools.groupby(signatures, key=lambda row: row[:3]):
+        group = list(group)
+        if len(group) < 2 or (cross_node_only and len({row[3] for row in group}) < 2):
+            continue
+        yield full, sorted(f'{node}:{path}' for _, _, _, node, path in group)
@@ -1,28 +1,210 @@
 """Find similar files in directory."""
 
+import contextlib
 import os
+import functools
 import hashlib
-from typing import AnyStr, BinaryIO, Callable
+import itertools
+import mmap
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import AnyStr, BinaryIO, Callable, Iterable, Iterator
 
+from supertool.external_sort import external_size_groups
+from supertool.file_table import FileTable
+from supertool.governor import IOGovernor
+from supertool.hash_cache import HashCache
+from supertool.io_scheduling import DeviceLimitedKey, locality_key
+from supertool.path_filter import PathFilter
+from supertool.scan_snapshot import ScanSnapshot
 
-def duplicates_printer(duplicates: dict) -> None:
+try:
+    import xxhash
+except ImportError:  # pragma: no cover
+    xxhash = None
+
+PARTIAL_SAMPLE_SIZE = 4096
+DEFAULT_BLOCK_SIZE = 1024 * 1024
+# suggested value of mmap_threshold, mapping is off by default
+MMAP_THRESHOLD = 64 * 1024 * 1024
+LOCKSTEP_BLOCK_SIZE = 256 * 1024
+MAX_LOCKSTEP_FILES = 256
+STREAM_BATCH_FILES = 256
+PROGRESS_INTERVAL = 0.5
+PIPELINE_QUEUE_SIZE = 1024
+STAGES = ('size', 'lockstep', 'partial', 'full', 'verify')
+LOCKSTEP_MAX_GROUP = 3
+HASH_ALGORITHMS = {
+    'md5': hashlib.md5,
+    'sha1': hashlib.sha1,
+    'blake2b': functools.partial(hashlib.blake2b, digest_size=16),
+}
+if xxhash is not None:  # pragma: no cover
+    HASH_ALGORITHMS['xxh64'] = xxhash.xxh64
+    HASH_ALGORITHMS['xxh128'] = xxhash.xxh3_128
+POOLS = {'thread': ThreadPoolExecutor, 'process': ProcessPoolExecutor}
+MAP_CHUNK_SIZE = 16
+
+
+def duplicates_printer(duplicates: (dict, Iterable)) -> None:
     """
     Displays duplicates on the screen
 
+    Groups of duplicates are displayed as soon as they are taken from duplicates,
+    so that the output of iter_duplicates appears incrementally.
+
     :param duplicates: a dictionary of duplicates,
     where the key is a hash,
-    and the value is a list of paths to the duplicate files
+    and the value is a list of paths to the duplicate files,
+    or an iterable of pairs (hash, list of paths)
     :return: None
     """
-    if not duplicates:
+    if isinstance(duplicates, dict):
+        duplicates = duplicates.items()
+    found = False
+    for key, values in duplicates:
+        if not found:
+            print('Duplicates found:')
+            found = True
+        print(f'---\nWith hash {key}')
+        print('\n'.join(values), flush=True)
+    if not found:
         print('Duplicates not found!')
-    else:
-        print('Duplicates found:')
-        for key, values in duplicates.items():
-            print(f'---\nWith hash {key}')
+
+
+def hardlinks_printer(hardlinks: dict) -> None:
+    """
+    Displays groups of hard links on the screen
+
+    :param hardlinks: a dictionary of hard links,
+    where the key is the first found path of an inode,
+    and the value is a list of all its paths
+    :return: None
+    """
+    if hardlinks:
+        print('Hard links found:')
+        for values in hardlinks.values():
+            print('---')
             print('\n'.join(values))
 
 
+def progress_printer(event: str, info: dict) -> None:
+    """
+    Displays progress events of a scan on a single line of stderr
+
+    :param event: name of the event, see ScanProgress
+    :param info: counters of the event
+    :return: None
+    """
+    counters = ', '.join(f'{key} {value:.1f}' if isinstance(value, float) else f'{key} {value}'
+                         for key, value in info.items())
+    print(f'\r\033[K{event}: {counters}', end='' if event in ('walk', 'hash') else '\n',
+          file=sys.stderr, flush=True)
+
+
+class ScanProgress:
+    """
+    Progress of a scan, reported to an observer
+
+    The observer is called with the name of an event and a dictionary of counters:
+
+    - 'walk': directories and files found so far;
+    - 'candidates': groups, files and bytes that may need to be read after the walk;
+    - 'hash': stage, files and bytes read so far, throughput (MB/s) and eta (seconds);
+    - 'done': files and bytes read, elapsed seconds.
+
+    'walk' and 'hash' events are reported at most once per interval seconds.
+    """
+
+    def __init__(self, observer: Callable, interval: float = None):
+        """
+        Init progress of a scan
+
+        :param observer: function called with the name of an event and its counters
+        :param interval: minimal interval between 'walk' or 'hash' events in seconds,
+        PROGRESS_INTERVAL by default
+        """
+        self.observer = observer
+        self.interval = PROGRESS_INTERVAL if interval is None else interval
+        self.directories = 0
+        self.files = 0
+        self.total_bytes = 0
+        self.files_read = 0
+        self.bytes_read = 0
+        self.start = time.monotonic()
+        self._reported = self.start
+
+    def _due(self) -> bool:
+        """
+        Checks whether interval seconds have passed since the last event
+
+        :return: bool -- True if an event should be reported
+        """
+        now = time.monotonic()
+        if now - self._reported < self.interval:
+            return False
+        self._reported = now
+        return True
+
+    def walked(self, directories: int = 0, files: int = 0) -> None:
+        """
+        Accounts directories and files found by the walk
+
+        :param directories: number of new directories
+        :param files: number of new files
+        :return: None
+        """
+        self.directories += directories
+        self.files += files
+        if self._due():
+            self.observer('walk', {'directories': self.directories, 'files': self.files})
+
+    def candidates(self, groups: int, files: int, total_bytes: int) -> None:
+        """
+        Accounts groups of files of the same size found by the walk
+
+        :param groups: number of groups of files of the same size
+        :param files: number of files in the groups
+        :param total_bytes: total size of the files in the groups
+        :return: None
+        """
+        self.total_bytes = total_bytes
+        self.observer('walk', {'directories': self.directories, 'files': self.files})
+        self.observer('candidates', {'groups': groups, 'files': files,
+                                     'bytes': self.total_bytes})
+
+    def hashed(self, stage: str, bytes_read: int, files: int = 1) -> None:
+        """
+        Accounts files read by a stage
+
+        :param stage: name of the stage
+        :param bytes_read: number of bytes read
+        :param files: number of files read
+        :return: None
+        """
+        self.files_read += files
+        self.bytes_read += bytes_read
+        if self._due():
+            elapsed = max(time.monotonic() - self.start, 1e-9)
+            throughput = self.bytes_read / elapsed
+            eta = max(self.total_bytes - self.bytes_read, 0) / throughput if throughput else 0.0
+            self.observer('hash', {'stage': stage, 'files': self.files_read,
+                                   'bytes': self.bytes_read,
+                                   'throughput': throughput / 1e6, 'eta': eta})
+
+    def finished(self) -> None:
+        """
+        Reports the end of the scan
+
+        :return: None
+        """
+        self.observer('done', {'files': self.files_read, 'bytes': self.bytes_read,
+                               'seconds': time.monotonic() - self.start})
+
+
 def chunk_reader(f_obj: BinaryIO, chunk_size: int = 1024) -> AnyStr:
     """
     Generator that reads a file in chunks of bytes
@@ -38,18 +220,105 @@ def chunk_reader(f_obj: BinaryIO, chunk_size: int = 1024) -> AnyStr:
         yield chunk
 
 
-def get_hash(filename: str, hash_func: Callable = hashlib.md5) -> str:
+def buffer_reader(f_obj: BinaryIO, block_size: int = DEFAULT_BLOCK_SIZE,
+                  governor: IOGovernor = None) -> Iterator:
+    """
+    Generator that reads a file in blocks into a single reusable buffer
+
+    Unlike chunk_reader, no bytes object is allocated per block:
+    each yielded memoryview refers to the same buffer,
+    so it is valid only until the next block is read.
+
+    :param f_obj: file object for reading, preferably unbuffered
+    :param block_size: size of the buffer
+    :param governor: governor that throttles the reads
+    :return: memoryview -- view of the read part of the buffer
+    """
+    buffer = bytearray(block_size)
+    view = memoryview(buffer)
+    while True:
+        size = f_obj.readinto(buffer)
+        if not size:
+            return
+        if governor is not None:
+            governor.throttle(size)
+        yield view[:size]
+
+
+def advise_sequential(f_obj: BinaryIO) -> None:
+    """
+    Hints the kernel that the file will be read sequentially, if possible
+
+    :param f_obj: file object
+    :return: None
+    """
+    if hasattr(os, 'posix_fadvise'):
+        try:
+            os.posix_fadvise(f_obj.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        except OSError:
+            pass
+
+
+def hash_kind(tier: str, hash_func: Callable, *params) -> str:
+    """
+    Creates a name of a kind of hashes, that is used as a key of the hash cache
+
+    :param tier: name of the tier that calculates the hash
+    :param hash_func: hash function
+    :param params: parameters of the tier that affect the hash value
+    :return: str -- name of the kind of hashes
+    """
+    hash_obj = hash_func()
+    return ':'.join([tier, f'{hash_obj.name}-{hash_obj.digest_size}'] +
+                    [str(param) for param in params])
+
+
+def get_hash(filename: str, hash_func: Callable = hashlib.md5,
+             cache: HashCache = None, block_size: int = DEFAULT_BLOCK_SIZE,
+             mmap_threshold: int = None, governor: IOGovernor = None) -> str:
     """
     Estimate a hash of a file named filename, using hash_func as hash function
 
+    The file is read with buffer_reader. When mmap_threshold is given,
+    files of at least mmap_threshold bytes are mapped into memory
+    and hashed without copying, unless the governor throttles the reading;
+    a mapped file that is truncated by another process while it is hashed
+    kills the process with SIGBUS, so mapping is off by default.
+
     :param filename: filename
     :param hash_func: hash function
+    :param cache: hash cache, that is consulted before reading the file
+    :param block_size: size of the read buffer
+    :param mmap_threshold: minimal size of a file that is mapped into memory,
+    None disables mapping, see MMAP_THRESHOLD
+    :param governor: governor that throttles the reads and the hashing
     :return: str -- hash value
     """
+    if cache is not None:
+        kind = hash_kind('full', hash_func)
+        stat = os.stat(filename)
+        digest = cache.get(filename, kind, stat)
+        if digest is None:
+            digest = get_hash(filename, hash_func, block_size=block_size,
+                              mmap_threshold=mmap_threshold, governor=governor)
+            cache.set(filename, kind, digest, stat)
+        return digest
+
     hash_obj = hash_func()
-    with open(filename, 'rb') as file_object:
-        for chunk in chunk_reader(file_object):
-            hash_obj.update(chunk)
+    with open(filename, 'rb', buffering=0) as file_object:
+        size = os.fstat(file_object.fileno()).st_size
+        if governor is None and mmap_threshold is not None and size and size >= mmap_threshold:
+            with mmap.mmap(file_object.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                if hasattr(mapped, 'madvise'):
+                    mapped.madvise(mmap.MADV_SEQUENTIAL)
+                hash_obj.update(mapped)
+        else:
+            advise_sequential(file_object)
+            for block in buffer_reader(file_object, block_size, governor):
+                if governor is None:
+                    hash_obj.update(block)
+                else:
+                    governor.update(hash_obj, block)
     return hash_obj.hexdigest()
 
 
@@ -72,50 +341,1034 @@ def append_value_in_hash_table(table: dict, value: str,
         table[key].append(value)
 
 
-def check_for_duplicates_by_size(path: str) -> tuple:
+def as_roots(path: (str, Iterable)) -> list:
+    """
+    Creates the list of the roots of a scan
+
+    Roots that repeat another root or lie inside it are dropped,
+    so that no file is found twice.
+
+    :param path: path to the directory, or an iterable of paths
+    :return: list of paths to the directories
+    """
+    paths = [path] if isinstance(path, (str, bytes, os.PathLike)) else list(path)
+    real_paths = [os.path.realpath(root) for root in paths]
+    roots = []
+    for index, real_path in enumerate(real_paths):
+        inside = any(other == real_path and other_index < index
+                     or real_path.startswith(os.path.join(other, ''))
+                     for other_index, other in enumerate(real_paths) if other_index != index)
+        if not inside:
+            roots.append(paths[index])
+    return roots
+
+
+def scan_files(path: str, progress: ScanProgress = None,
+               path_filter: PathFilter = None) -> Iterator:
+    """
+    Generator that walks the directory tree and yields its regular files
+
+    Symbolic links and special files are skipped,
+    directories that can not be read are ignored like os.walk does.
+    The type of an entry comes from the directory listing, so walking
+    costs no stat call per entry. On Linux, entry.stat(follow_symlinks=False)
+    still makes one lstat call per file (it is cached on the entry afterwards),
+    only entry.inode() and the is_dir/is_file checks are free.
+
+    :param path: path to the directory
+    :param progress: progress of the scan
+    :param path_filter: filter that prunes directories and skips files by their paths
+    :return: os.DirEntry -- entry of a regular file
+    """
+    directories = [path]
+    while directories:
+        if progress is not None:
+            progress.walked(directories=1)
+        try:
+            with os.scandir(directories.pop()) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if path_filter is None or path_filter.allows_directory(entry.path,
+                                                                                   entry.name):
+                                directories.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            if path_filter is None or path_filter.allows_file(entry.path,
+                                                                              entry.name):
+                                yield entry
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+
+
+def scan_records(path: (str, Iterable), progress: ScanProgress = None,
+                 path_filter: PathFilter = None) -> Iterator:
+    """
+    Generator of records of the regular files of the directory trees
+
+    :param path: path to the directory, or an iterable of paths, see as_roots
+    :param progress: progress of the scan
+    :param path_filter: filter of the files by their paths and sizes
+    :return: tuple(int, int, int, str) -- record (size, st_dev, st_ino, path)
+    """
+    for root in as_roots(path):
+        for entry in scan_files(root, progress, path_filter):
+            stat = entry.stat(follow_symlinks=False)
+            if path_filter is not None and not path_filter.allows_size(stat.st_size):
+                continue
+            if progress is not None:
+                progress.walked(files=1)
+            yield stat.st_size, stat.st_dev, stat.st_ino, entry.path
+
+
+def group_records_by_size(records: Iterable, stats: dict = None,
+                          hardlinks: dict = None,
+                          progress: ScanProgress = None) -> tuple:
     """
     Creates a tuple that contains paths to files with the same size
 
-    :param path: path to the directory, with files to check
+    Hard links to the same inode are collapsed: only the first found path
+    of an inode is placed in the tuple, and all the paths of the inode
+    are added to hardlinks under that first path.
+
+    :param records: iterable of records (size, st_dev, st_ino, path), see scan_records
+    :param stats: statistics table, see create_statistics
+    :param hardlinks: dictionary that will be filled with groups of hard links,
+    where the key is the first found path of an inode,
+    and the value is a list of all its paths
+    :param progress: progress of the scan
     :return: tuple that contains paths to files
     """
+    start = time.perf_counter()
+    inodes_by_size = {}
+    for size, device, inode, filename in records:
+        inodes = inodes_by_size.setdefault(size, {})
+        append_value_in_hash_table(inodes, filename, (device, inode))
+
     hashes_by_size = {}
-    for dir_path, _, file_names in os.walk(path):
-        for filename in file_names:
-            full_path = os.path.join(dir_path, filename)
-            append_value_in_hash_table(hashes_by_size, full_path,
-                                       os.path.getsize(full_path))
+    for size, inodes in inodes_by_size.items():
+        hashes_by_size[size] = [links[0] for links in inodes.values()]
+        if hardlinks is not None:
+            hardlinks.update((links[0], links) for links in inodes.values()
+                             if len(links) > 1)
+        if stats is not None:
+            counters = stats['size']
+            links_count = sum(map(len, inodes.values()))
+            counters['files'] += links_count
+            if len(inodes) < 2:
+                counters['eliminated_files'] += links_count
+                counters['eliminated_bytes'] += size
+
+    if stats is not None:
+        stats['size']['seconds'] += time.perf_counter() - start
 
     # We are interested only in those elements of the dictionary,
     # the length of which is more than 1
-    return tuple(filter(lambda entry: len(entry) > 1,
-                        hashes_by_size.values()))
+    groups = tuple(filter(lambda entry: len(entry) > 1,
+                          hashes_by_size.values()))
+    if progress is not None:
+        progress.candidates(len(groups), sum(map(len, groups)),
+                            sum(len(files) * size for size, files in hashes_by_size.items()
+                                if len(files) > 1))
+    return groups
+
+
+def check_for_duplicates_by_size(path: str, stats: dict = None,
+                                 hardlinks: dict = None,
+                                 progress: ScanProgress = None) -> tuple:
+    """
+    Creates a tuple that contains paths to files with the same size,
+    see group_records_by_size
+
+    :param path: path to the directory, with files to check
+    :param stats: statistics table, see create_statistics
+    :param hardlinks: dictionary that will be filled with groups of hard links
+    :param progress: progress of the scan
+    :return: tuple that contains paths to files
+    """
+    return group_records_by_size(scan_records(path, progress), stats, hardlinks, progress)
+
+
+def get_partial_hash(filename: str, sample_size: int = PARTIAL_SAMPLE_SIZE,
+                     with_middle: bool = False,
+                     hash_func: Callable = hashlib.md5,
+                     governor: IOGovernor = None) -> str:
+    """
+    Estimate a hash of the head, the tail and (optionally) the middle of a file
+
+    Only 2 or 3 samples of sample_size bytes are read,
+    so the result is cheap even for huge files.
+    The size of the file is mixed into the hash,
+    so that files of different size never collide.
+
+    :param filename: filename
+    :param sample_size: size of each sample in bytes
+    :param with_middle: also hash a sample from the middle of the file
+    :param hash_func: hash function
+    :param governor: governor that throttles the reads
+    :return: str -- hash value
+    """
+    hash_obj = hash_func()
+    size = os.path.getsize(filename)
+    hash_obj.update(str(size).encode())
+    offsets = [0]
+    if with_middle:
+        offsets.append(max(0, size // 2 - sample_size // 2))
+    offsets.append(max(0, size - sample_size))
+    with open(filename, 'rb') as file_object:
+        for offset in offsets:
+            file_object.seek(offset)
+            sample = file_object.read(sample_size)
+            if governor is not None and sample:
+                governor.throttle(len(sample))
+            hash_obj.update(sample)
+    return hash_obj.hexdigest()
+
+
+def get_hash_function(algorithm: str) -> Callable:
+    """
+    Returns a hash function by the name of the algorithm
+
+    :param algorithm: name of the algorithm, one of HASH_ALGORITHMS
+    :return: Callable -- hash function
+    """
+    try:
+        return HASH_ALGORITHMS[algorithm]
+    except KeyError:
+        raise ValueError(f"Unknown hash algorithm: {algorithm}")
+
 
+def compare_files(filenames: list, block_size: int = LOCKSTEP_BLOCK_SIZE,
+                  governor: IOGovernor = None) -> list:
+    """
+    Splits files into groups of byte-for-byte identical files
+
+    All the files are read block by block in lockstep,
+    a file is closed as soon as its content differs from all the other files.
+    Groups of more than MAX_LOCKSTEP_FILES files are compared in batches:
+    each batch contains a representative of every distinct content found so far,
+    so that the number of open files is limited.
 
-def check_for_duplicates(path: str) -> (dict, None):
+    :param filenames: list of paths to the files of the same size
+    :param block_size: size of the blocks that are compared
+    :param governor: governor that throttles the reads
+    :return: list of lists of paths to identical files,
+    files that have no identical file are not included
+    """
+    if len(filenames) <= MAX_LOCKSTEP_FILES:
+        return compare_files_in_lockstep(filenames, block_size, governor)
+
+    groups = []  # every distinct content found so far, the first path represents it
+    pending = list(filenames)
+    while pending:
+        batch_size = max(1, MAX_LOCKSTEP_FILES - len(groups))
+        batch, pending = pending[:batch_size], pending[batch_size:]
+        representatives = {group[0]: group for group in groups}
+        grouped = set()
+        for members in compare_files_in_lockstep(list(representatives) + batch, block_size,
+                                                 governor):
+            grouped.update(members)
+            group = next((representatives[member] for member in members
+                          if member in representatives), None)
+            if group is None:
+                groups.append(members)
+            else:
+                group.extend(member for member in members if member not in representatives)
+        groups.extend([filename] for filename in batch if filename not in grouped)
+    return [group for group in groups if len(group) > 1]
+
+
+def compare_files_in_lockstep(filenames: list, block_size: int = LOCKSTEP_BLOCK_SIZE,
+                              governor: IOGovernor = None) -> list:
+    """
+    Splits files into groups of byte-for-byte identical files,
+    keeping all the files open at once
+
+    :param filenames: list of paths to the files of the same size
+    :param block_size: size of the blocks that are compared
+    :param governor: governor that throttles the reads
+    :return: list of lists of paths to identical files,
+    files that have no identical file are not included
+    """
+    return [members for _, members in
+            partition_in_lockstep(filenames, block_size, governor=governor)[0]]
+
+
+def hash_files_in_lockstep(filenames: list, hash_func: Callable = hashlib.md5,
+                           block_size: int = LOCKSTEP_BLOCK_SIZE,
+                           governor: IOGovernor = None) -> tuple:
+    """
+    Finds groups of identical files by comparing them in lockstep,
+    and calculates the hash of each group along the way
+
+    Reading stops at the first block where a file differs from all the others,
+    so groups of mostly different files are resolved almost for free,
+    and the files of a group are never read twice.
+
+    :param filenames: list of paths to the files of the same size
+    :param hash_func: hash function
+    :param block_size: size of the blocks that are compared
+    :param governor: governor that throttles the reads
+    :return: tuple(dict, int) -- dictionary where the key is the hash of the files,
+    and the value is the list of paths to identical files,
+    and the number of bytes read
+    """
+    groups, bytes_read = partition_in_lockstep(filenames, block_size, hash_func, governor)
+    return {hash_obj.hexdigest(): members for hash_obj, members in groups}, bytes_read
+
+
+def partition_in_lockstep(filenames: list, block_size: int,
+                          hash_func: Callable = None, governor: IOGovernor = None) -> tuple:
+    """
+    Splits files into groups of identical files by reading them in lockstep
+
+    If hash_func is given, each group carries a hash object fed with its content:
+    when a group splits, the hash object is copied for each part.
+
+    :param filenames: list of paths to the files of the same size
+    :param block_size: size of the blocks that are compared
+    :param hash_func: hash function, or None
+    :param governor: governor that throttles the reads
+    :return: tuple(list, int) -- list of pairs (hash object or None, list of paths)
+    for groups of at least two files, and the number of bytes read
+    """
+    result = []
+    bytes_read = 0
+    with contextlib.ExitStack() as stack:
+        files = {filename: stack.enter_context(open(filename, 'rb', buffering=0))
+                 for filename in filenames}
+        groups = [(hash_func() if hash_func else None, list(filenames))]
+        while groups:
+            next_groups = []
+            for hash_obj, group in groups:
+                blocks = []
+                for filename in group:
+                    block = files[filename].read(block_size)
+                    if governor is not None and block:
+                        governor.throttle(len(block))
+                    bytes_read += len(block)
+                    for other_block, members in blocks:
+                        if other_block == block:
+                            members.append(filename)
+                            break
+                    else:
+                        blocks.append((block, [filename]))
+                parts = []
+                for block, members in blocks:
+                    if len(members) < 2:
+                        files.pop(members[0]).close()
+                    else:
+                        parts.append((block, members))
+                for block, members in parts:
+                    part_hash = hash_obj.copy() if hash_obj is not None and len(parts) > 1 else hash_obj
+                    if not block:
+                        result.append((part_hash, members))
+                        continue
+                    if part_hash is not None and governor is not None:
+                        governor.update(part_hash, block)
+                    elif part_hash is not None:
+                        part_hash.update(block)
+                    next_groups.append((part_hash, members))
+            groups = next_groups
+    return result, bytes_read
+
+
+def create_statistics() -> dict:
+    """
+    Creates an empty statistics table for the duplicates search
+
+    For each stage of the search ('size', 'lockstep', 'partial', 'full', 'verify')
+    the table contains the number of files that entered the stage,
+    the number of files (and their bytes) that were eliminated
+    as unique by the stage, the number of bytes read by the stage,
+    the number of files whose hashes were taken from the hash cache
+    and the time spent in the stage.
+
+    :return: dict -- statistics table
+    """
+    return {stage: {'files': 0, 'eliminated_files': 0,
+                    'eliminated_bytes': 0, 'bytes_read': 0, 'cached_files': 0,
+                    'seconds': 0.0}
+            for stage in STAGES}
+
+
+def statistics_printer(stats: dict) -> None:
+    """
+    Displays statistics of the duplicates search on the screen
+
+    :param stats: statistics table, see create_statistics
+    :return: None
+    """
+    print('Statistics:')
+    for stage in STAGES:
+        counters = stats[stage]
+        print(f'{stage:>8}: {counters["files"]} files, '
+              f'{counters["eliminated_files"]} eliminated '
+              f'({counters["eliminated_bytes"]} bytes), '
+              f'{counters["bytes_read"]} bytes read, '
+              f'{counters["cached_files"]} cached, '
+              f'{counters["seconds"]:.3f} s')
+
+
+def create_executor(workers: int = 1, pool: str = 'thread') -> (Executor, None):
+    """
+    Creates an executor for hashing files in parallel
+
+    Threads are enough in most cases, since hashlib releases the GIL
+    while hashing large buffers. Processes may help when
+    the hashing is dominated by python overhead (a lot of small files).
+
+    :param workers: number of workers, 1 means hashing in the calling thread
+    :param pool: kind of workers: 'thread' or 'process'
+    :return: Executor -- executor, or None if workers are not needed
+    """
+    if pool not in POOLS:
+        raise ValueError(f"Unknown pool: {pool}")
+    if workers is None or workers <= 1:
+        return None
+    return POOLS[pool](max_workers=workers)
+
+
+def calculate_keys(filenames: list, key_func: Callable,
+                   executor: Executor = None, cache: HashCache = None,
+                   kind: str = None) -> Iterator:
+    """
+    Calculates key_func for each file
+
+    Cached keys are taken from the cache in the calling thread,
+    the rest are calculated by the executor and stored in the cache.
+
+    :param filenames: list of paths to the files
+    :param key_func: function that calculates a key for a path
+    :param executor: executor that calculates the keys in parallel
+    :param cache: hash cache
+    :param kind: kind of the keys in the hash cache, see hash_kind
+    :return: iterator over the pairs (key, True if the key was taken from the cache),
+    in the order of filenames
+    """
+    def mapper(filenames_to_map):
+        if executor is None:
+            return map(key_func, filenames_to_map)
+        return executor.map(key_func, filenames_to_map, chunksize=MAP_CHUNK_SIZE)
+
+    if cache is None:
+        return ((key, False) for key in mapper(filenames))
+
+    stats = [os.stat(filename) for filename in filenames]
+    keys = [cache.get(filename, kind, stat)
+            for filename, stat in zip(filenames, stats)]
+    cached = [key is not None for key in keys]
+    missing = [index for index, key in enumerate(keys) if key is None]
+    for index, key in zip(missing, mapper([filenames[index] for index in missing])):
+        keys[index] = key
+        cache.set(filenames[index], kind, key, stats[index])
+    cache.flush()
+    return zip(keys, cached)
+
+
+def regroup(groups: Iterable, key_func: Callable, stage: str,
+            stats: dict, read_limit: int = None,
+            executor: Executor = None, cache: HashCache = None,
+            kind: str = None, progress: ScanProgress = None,
+            io_order: str = None) -> list:
+    """
+    Splits each group of files into subgroups by key_func
+
+    Subgroups that contain only one file are dropped
+    and accounted in the statistics as eliminated by the stage.
+    All the groups must contain files of the same size.
+
+    :param groups: iterable of lists of paths to the files
+    :param key_func: function that calculates a key for a path,
+    it must be picklable if the executor is a process pool
+    :param stage: name of the stage, for the statistics
+    :param stats: statistics table
+    :param read_limit: number of bytes that key_func reads from a file,
+    None if key_func reads the entire file
+    :param executor: executor that calculates the keys in parallel
+    :param cache: hash cache, that is consulted before calculating a key
+    :param kind: kind of the keys in the hash cache, see hash_kind
+    :param progress: progress of the scan
+    :param io_order: order of reading the files, see io_scheduling.locality_key,
+    None keeps the order of the walk
+    :return: list of dictionaries, where the key is the value of key_func,
+    and the value is a list of paths with this key
+    """
+    start = time.perf_counter()
+    groups = list(groups)
+    filenames = [filename for files in groups for filename in files]
+    if io_order is None:
+        keys = calculate_keys(filenames, key_func, executor, cache, kind)
+    else:
+        ordered = sorted(filenames, key=functools.partial(locality_key, order=io_order))
+        keys_by_filename = dict(zip(ordered, calculate_keys(ordered, key_func, executor,
+                                                            cache, kind)))
+        keys = (keys_by_filename[filename] for filename in filenames)
+
+    result = []
+    counters = stats[stage]
+    for files in groups:
+        size = os.path.getsize(files[0])
+        table = {}
+        for filename in files:
+            key, cached = next(keys)
+            append_value_in_hash_table(table, filename, key)
+            bytes_read = 0
+            if cached:
+                counters['cached_files'] += 1
+            else:
+                bytes_read = size if read_limit is None else min(size, read_limit)
+                counters['bytes_read'] += bytes_read
+            if progress is not None:
+                progress.hashed(stage, bytes_read)
+        counters['files'] += len(files)
+        for key, values in tuple(table.items()):
+            if len(values) < 2:
+                counters['eliminated_files'] += 1
+                counters['eliminated_bytes'] += size
+                del table[key]
+        if table:
+            result.append(table)
+    counters['seconds'] += time.perf_counter() - start
+    return result
+
+
+def lockstep_regroup(groups: list, key_func: Callable, stats: dict,
+                     executor: Executor = None, progress: ScanProgress = None) -> dict:
+    """
+    Resolves groups of files of the same size by comparing them in lockstep
+
+    :param groups: list of lists of paths to the files of the same size
+    :param key_func: function that resolves a group, see hash_files_in_lockstep
+    :param stats: statistics table
+    :param executor: executor that resolves groups in parallel
+    :param progress: progress of the scan
+    :return: dictionary of duplicates, where the key is a hash
+    and the value is a list of paths to the files
+    """
+    start = time.perf_counter()
+    mapper = map if executor is None else executor.map
+    counters = stats['lockstep']
+    result = {}
+    for files, (hashes, bytes_read) in zip(groups, mapper(key_func, groups)):
+        eliminated = len(files) - sum(map(len, hashes.values()))
+        counters['files'] += len(files)
+        counters['bytes_read'] += bytes_read
+        counters['eliminated_files'] += eliminated
+        counters['eliminated_bytes'] += eliminated * os.path.getsize(files[0])
+        result.update(hashes)
+        if progress is not None:
+            progress.hashed('lockstep', bytes_read, len(files))
+    counters['seconds'] += time.perf_counter() - start
+    return result
+
+
+def verify_duplicates(hashes: dict, stats: dict,
+                      executor: Executor = None, progress: ScanProgress = None,
+                      governor: IOGovernor = None) -> dict:
+    """
+    Compares files with the same hash byte-for-byte
+
+    If files with the same hash turn out to be different (a hash collision),
+    each group of identical files gets its own key: the hash with a suffix.
+
+    :param hashes: dictionary of duplicates, where the key is a hash
+    and the value is a list of paths to the files
+    :param stats: statistics table
+    :param executor: executor that compares groups in parallel
+    :param progress: progress of the scan
+    :param governor: governor that throttles the reads
+    :return: dictionary of verified duplicates
+    """
+    start = time.perf_counter()
+    mapper = map if executor is None else executor.map
+    counters = stats['verify']
+    result = {}
+    compare = functools.partial(compare_files, governor=governor)
+    for (key, files), groups in zip(hashes.items(), mapper(compare, hashes.values())):
+        size = os.path.getsize(files[0])
+        counters['files'] += len(files)
+        counters['bytes_read'] += len(files) * size
+        eliminated = len(files) - sum(map(len, groups))
+        counters['eliminated_files'] += eliminated
+        counters['eliminated_bytes'] += eliminated * size
+        for index, group in enumerate(groups):
+            result[key if index == 0 else f'{key}-{index}'] = group
+        if progress is not None:
+            progress.hashed('verify', len(files) * size, len(files))
+    counters['seconds'] += time.perf_counter() - start
+    return result
+
+
+class HashingPipeline:
+    """
+    Duplicates search where the walk, the size bucketing and the hashing
+    run concurrently
+
+    A walker thread puts the found files into a bounded queue.
+    The calling thread takes them, buckets them by size, and as soon as
+    a size is shared by two inodes, submits their hashing to the executor;
+    files of the same size found later are submitted right away.
+    The same happens between the partial-content tier and the full hashing.
+    When too many hashes are in flight, the calling thread stops taking files,
+    the queue fills up, and the walker waits.
+    """
+
+    def __init__(self, executor: Executor, partial_key: Callable, full_key: Callable,
+                 read_limit: int = None, stats: dict = None, cache: HashCache = None,
+                 kinds: tuple = (None, None), progress: ScanProgress = None,
+                 queue_size: int = None):
+        """
+        Init the pipeline
+
+        :param executor: executor that hashes files
+        :param partial_key: function that calculates a partial hash, None to skip the tier
+        :param full_key: function that calculates a full hash
+        :param read_limit: files of at most read_limit bytes skip the partial tier
+        :param stats: statistics table, see create_statistics
+        :param cache: hash cache, that is consulted in the calling thread
+        :param kinds: kinds of the partial and the full hashes in the cache
+        :param progress: progress of the scan
+        :param queue_size: capacity of the queue of found files,
+        and the maximal number of hashes in flight, PIPELINE_QUEUE_SIZE by default
+        """
+        self.executor = executor
+        self.keys = {'partial': partial_key, 'full': full_key}
+        self.kinds = dict(zip(('partial', 'full'), kinds))
+        self.read_limit = read_limit
+        self.stats = stats if stats is not None else create_statistics()
+        self.cache = cache
+        self.progress = progress
+        self.queue_size = PIPELINE_QUEUE_SIZE if queue_size is None else queue_size
+        self.inodes_by_size = {}
+        self.tables = {'partial': {}, 'full': {}}
+        self.results = queue.Queue()
+        self.in_flight = 0
+
+    def run(self, path: (str, Iterable), hardlinks: dict = None,
+            path_filter: PathFilter = None) -> dict:
+        """
+        Runs the search
+
+        :param path: path to the directory, with files to check, or an iterable of paths
+        :param hardlinks: dictionary that will be filled with groups of hard links,
+        see check_for_duplicates_by_size
+        :param path_filter: filter of the files by their paths and sizes
+        :return: dictionary of duplicates, where the key is a hash
+        and the value is a list of paths to the files (one path per inode)
+        """
+        start = time.perf_counter()
+        entries = queue.Queue(maxsize=self.queue_size)
+        walker = threading.Thread(target=self._walk, args=(path, entries, path_filter),
+                                  daemon=True)
+        walker.start()
+        while True:
+            entry = entries.get()
+            if entry is None:
+                break
+            self._bucket(*entry)
+            self._drain(block=False)
+        while self.in_flight:
+            self._drain(block=True)
+        walker.join()
+        self._account(hardlinks, time.perf_counter() - start)
+        return {digest: files for (_, digest), files in self.tables['full'].items()
+                if len(files) > 1}
+
+    def _walk(self, path: (str, Iterable), entries: queue.Queue,
+              path_filter: PathFilter = None) -> None:
+        """
+        Puts the regular files of the trees into the queue, then None
+
+        :param path: path to the directory, or an iterable of paths
+        :param entries: queue of tuples (path, size, (st_dev, st_ino))
+        :param path_filter: filter of the files by their paths and sizes
+        :return: None
+        """
+        try:
+            for root in as_roots(path):
+                for entry in scan_files(root, self.progress, path_filter):
+                    stat = entry.stat(follow_symlinks=False)
+                    if path_filter is None or path_filter.allows_size(stat.st_size):
+                        entries.put((entry.path, stat.st_size, (stat.st_dev, stat.st_ino)))
+        finally:
+            entries.put(None)
+
+    def _bucket(self, filename: str, size: int, inode: tuple) -> None:
+        """
+        Adds a found file to its size bucket and submits the hashing if needed
+
+        :param filename: path to the file
+        :param size: size of the file
+        :param inode: (st_dev, st_ino) of the file
+        :return: None
+        """
+        if self.progress is not None:
+            self.progress.walked(files=1)
+        inodes = self.inodes_by_size.setdefault(size, {})
+        if inode in inodes:
+            inodes[inode].append(filename)
+            return
+        inodes[inode] = [filename]
+        tier = 'partial' if self.keys['partial'] and size > self.read_limit else 'full'
+        if len(inodes) == 2:
+            self._submit(tier, size, next(iter(inodes.values()))[0])
+        if len(inodes) >= 2:
+            self._submit(tier, size, filename)
+
+    def _submit(self, tier: str, size: int, filename: str) -> None:
+        """
+        Takes the hash of a file from the cache or submits its calculation
+
+        :param tier: 'partial' or 'full'
+        :param size: size of the file
+        :param filename: path to the file
+        :return: None
+        """
+        stat = None
+        if self.cache is not None:
+            # the stat is taken before hashing, so that a file changed
+            # while it is hashed is not cached under its new modification time
+            stat = os.stat(filename)
+            digest = self.cache.get(filename, self.kinds[tier], stat)
+            if digest is not None:
+                self.stats[tier]['cached_files'] += 1
+                self._collect(tier, size, filename, digest)
+                return
+        self.in_flight += 1
+        future = self.executor.submit(self.keys[tier], filename)
+        future.add_done_callback(lambda done: self.results.put((tier, size, filename, stat, done)))
+
+    def _drain(self, block: bool) -> None:
+        """
+        Collects calculated hashes
+
+        :param block: wait for at least one hash
+        :return: None
+        """
+        while self.in_flight:
+            must_wait = block or self.in_flight >= self.queue_size
+            try:
+                tier, size, filename, stat, future = self.results.get(block=must_wait)
+            except queue.Empty:
+                return
+            self.in_flight -= 1
+            digest = future.result()
+            counters = self.stats[tier]
+            bytes_read = size if tier == 'full' else min(size, self.read_limit)
+            counters['bytes_read'] += bytes_read
+            if self.progress is not None:
+                self.progress.hashed(tier, bytes_read)
+            if self.cache is not None:
+                self.cache.set(filename, self.kinds[tier], digest, stat)
+            self._collect(tier, size, filename, digest)
+            if block:
+                return
+
+    def _collect(self, tier: str, size: int, filename: str, digest: str) -> None:
+        """
+        Adds a hash to the table of the tier, and submits the full hashing if needed
+
+        :param tier: 'partial' or 'full'
+        :param size: size of the file
+        :param filename: path to the file
+        :param digest: hash of the file
+        :return: None
+        """
+        files = self.tables[tier].setdefault((size, digest), [])
+        files.append(filename)
+        if tier == 'partial':
+            if len(files) == 2:
+                self._submit('full', size, files[0])
+            if len(files) >= 2:
+                self._submit('full', size, filename)
+
+    def _account(self, hardlinks: dict, seconds: float) -> None:
+        """
+        Fills the statistics and the hard links after the search
+
+        :param hardlinks: dictionary of hard links, or None
+        :param seconds: duration of the search
+        :return: None
+        """
+        counters = self.stats['size']
+        counters['seconds'] += seconds
+        for size, inodes in self.inodes_by_size.items():
+            links_count = sum(map(len, inodes.values()))
+            counters['files'] += links_count
+            if len(inodes) < 2:
+                counters['eliminated_files'] += links_count
+                counters['eliminated_bytes'] += size
+            if hardlinks is not None:
+                hardlinks.update((links[0], links) for links in inodes.values()
+                                 if len(links) > 1)
+        for tier, table in self.tables.items():
+            counters = self.stats[tier]
+            for (size, _), files in table.items():
+                counters['files'] += len(files)
+                if len(files) < 2:
+                    counters['eliminated_files'] += 1
+                    counters['eliminated_bytes'] += size
+
+
+def iter_pipelined_duplicates(path: (str, Iterable), workers: int, pool: str,
+                              partial_key: Callable, full_key: Callable, read_limit: int,
+                              stats: dict, cache: HashCache, kinds: tuple,
+                              progress: ScanProgress, hardlinks: dict, verify: bool,
+                              governor: IOGovernor = None,
+                              path_filter: PathFilter = None) -> Iterator:
+    """
+    Generator that finds duplicated files with HashingPipeline
+
+    :param path: path to the directory, with files to check, or an iterable of paths
+    :param workers: number of workers that hash files in parallel
+    :param pool: kind of workers: 'thread' or 'process'
+    :param partial_key: function that calculates a partial hash, None to skip the tier
+    :param full_key: function that calculates a full hash
+    :param read_limit: files of at most read_limit bytes skip the partial tier
+    :param stats: statistics table
+    :param cache: hash cache
+    :param kinds: kinds of the partial and the full hashes in the cache
+    :param progress: progress of the scan
+    :param hardlinks: dictionary that will be filled with groups of hard links
+    :param verify: compare files with the same hash byte-for-byte
+    :param governor: governor that throttles the reads of the verification
+    :param path_filter: filter of the files by their paths and sizes
+    :return: tuple(str, list) -- hash and the list of paths to the same files
+    """
+    if pool not in POOLS:
+        raise ValueError(f"Unknown pool: {pool}")
+    with POOLS[pool](max_workers=max(workers or 1, 1)) as executor:
+        hashes = HashingPipeline(executor, partial_key, full_key, read_limit, stats,
+                                 cache, kinds, progress).run(path, hardlinks, path_filter)
+        if cache is not None:
+            cache.flush()
+        if verify:
+            hashes = verify_duplicates(hashes, stats, executor, progress, governor)
+    for key, duplicates in hashes.items():
+        yield key, [link for filename in duplicates
+                    for link in hardlinks.get(filename, [filename])]
+    if progress is not None:
+        progress.finished()
+
+
+def iter_duplicates(path: (str, Iterable), partial_hash: bool = True,
+                    sample_size: int = PARTIAL_SAMPLE_SIZE,
+                    with_middle: bool = False,
+                    stats: dict = None, workers: int = 1,
+                    pool: str = 'thread',
+                    cache: HashCache = None,
+                    hardlinks: dict = None,
+                    block_size: int = DEFAULT_BLOCK_SIZE,
+                    mmap_threshold: int = None,
+                    algorithm: str = 'md5',
+                    verify: bool = False,
+                    lockstep_max_group: int = LOCKSTEP_MAX_GROUP,
+                    observer: Callable = None,
+                    compact: bool = False,
+                    pipeline: bool = False,
+                    memory_budget: int = None,
+                    spill_dir: str = None,
+                    io_order: str = None,
+                    rotational_workers: int = None,
+                    governor: IOGovernor = None,
+                    snapshot: ScanSnapshot = None,
+                    path_filter: PathFilter = None) -> Iterator:
+    """
+    Generator that finds duplicated files
+
+    Yields pairs of the hash of the files and the list of the paths
+    to the files whose hash matches, as soon as a group is resolved:
+    the groups of files of the same size are resolved in batches
+    of at least STREAM_BATCH_FILES files.
+
+    The search is done in tiers: files are grouped by size,
+    then files of the same size are grouped by a hash of small samples
+    of their content (see get_partial_hash),
+    and only files that still collide are hashed entirely.
+    Hard links to the same inode are hashed once, and they are reported
+    as duplicates only if there is another inode with the same content.
+    Optionally, files with the same hash are compared byte-for-byte
+    (see compare_files), so that a fast non-cryptographic hash can be used safely.
+    Groups of at most lockstep_max_group files that survive the partial tier
+    are not hashed entirely, but compared in lockstep (see hash_files_in_lockstep),
+    unless the hash cache is used.
+
+    :param path: path to the directory, with files to check,
+    or an iterable of paths, see as_roots
+    :param partial_hash: use the partial-content tier
+    :param sample_size: size of each sample of the partial-content tier
+    :param with_middle: the partial-content tier also samples the middle of files
+    :param stats: statistics table, see create_statistics,
+    which will be filled with the counters of each tier
+    :param workers: number of workers that hash files in parallel
+    :param pool: kind of workers: 'thread' or 'process'
+    :param cache: hash cache, that is consulted before hashing a file
+    :param hardlinks: dictionary that will be filled with groups of hard links,
+    see check_for_duplicates_by_size
+    :param block_size: size of the read buffer of the full hashing, see get_hash
+    :param mmap_threshold: minimal size of a file that is mapped into memory
+    by the full hashing, None disables mapping
+    :param algorithm: name of the hash algorithm, one of HASH_ALGORITHMS
+    :param verify: compare files with the same hash byte-for-byte
+    :param lockstep_max_group: maximal size of a group that is compared in lockstep,
+    0 disables the lockstep comparison
+    :param observer: function that receives progress events, see ScanProgress
+    :param compact: keep the walked files in a compact FileTable
+    instead of a dictionary of paths, for trees of millions of files
+    :param pipeline: walk the tree and hash files concurrently, see HashingPipeline;
+    the groups are yielded after the walk, and the lockstep comparison is not used;
+    it can not be used with the compact table, the memory budget or the I/O order
+    :param memory_budget: find files of the same size by an external sort,
+    keeping about memory_budget bytes of file records in memory, see external_sort
+    :param spill_dir: directory for the sorted runs of the external sort
+    :param io_order: hash files in the order of their location on the devices:
+    'inode' or 'physical', see io_scheduling.locality_key
+    :param rotational_workers: maximal number of workers reading
+    from the same rotational device, see io_scheduling.DeviceLimitedKey;
+    it requires the thread pool
+    :param governor: governor that throttles the reads and the hashing,
+    shared by all the workers; it requires the thread pool
+    :param snapshot: snapshot that is filled by the scan, and whose previous
+    snapshot is reused: only changed directories are listed, and only changed
+    files are hashed, see ScanSnapshot; the snapshot keeps the hashes
+    instead of the hash cache, so they can not be used together,
+    and it can not be used with the compact table or the pipeline
+    :param path_filter: filter that prunes directories and skips files
+    by their paths and sizes, before they are grouped, see PathFilter
+    :return: tuple(str, list) -- hash and the list of paths to the same files
+    """
+    paths = [path] if isinstance(path, (str, bytes, os.PathLike)) else list(path)
+    if not paths or not all(map(os.path.exists, paths)):
+        raise ValueError("Directory does non exist")
+    roots = as_roots(paths)
+    if snapshot is not None:
+        if cache is not None:
+            raise ValueError("The snapshot can not be used with the hash cache")
+        if compact or pipeline:
+            raise ValueError("The snapshot can not be used with the compact table or the pipeline")
+        cache = snapshot
+    if stats is None:
+        stats = create_statistics()
+    if hardlinks is None:
+        hardlinks = {}
+    hash_func = get_hash_function(algorithm)
+    read_limit = (3 if with_middle else 2) * sample_size
+    if governor is not None and pool != 'thread':
+        raise ValueError("The governor can be used only in the thread pool")
+    partial_key = functools.partial(get_partial_hash, sample_size=sample_size,
+                                    with_middle=with_middle, hash_func=hash_func,
+                                    governor=governor)
+    full_key = functools.partial(get_hash, hash_func=hash_func, block_size=block_size,
+                                 mmap_threshold=mmap_threshold, governor=governor)
+    if rotational_workers:
+        if pool != 'thread':
+            raise ValueError("Rotational workers can be limited only in the thread pool")
+        partial_key = DeviceLimitedKey(partial_key, rotational_workers)
+        full_key = DeviceLimitedKey(full_key, rotational_workers)
+    lockstep_key = functools.partial(hash_files_in_lockstep, hash_func=hash_func,
+                                     governor=governor)
+    progress = ScanProgress(observer) if observer is not None else None
+    executor = None
+
+    def resolve(size_groups: list) -> dict:
+        candidates = size_groups
+        if partial_hash:
+            # Files that are not larger than the samples are read entirely
+            # by the partial tier, so they skip it
+            small, large = [], []
+            for files in size_groups:
+                is_small = os.path.getsize(files[0]) <= read_limit
+                (small if is_small else large).append(files)
+
+            partial_groups = regroup(large, partial_key, 'partial', stats,
+                                     read_limit, executor, cache,
+                                     hash_kind('partial', hash_func, sample_size, with_middle),
+                                     progress, io_order)
+            candidates = small + [files for table in partial_groups
+                                  for files in table.values()]
+
+        lockstep_hashes = {}
+        if cache is None and lockstep_max_group:
+            # Small groups that survived the partial tier are compared in lockstep,
+            # which reads every file at most once instead of hashing it
+            lockstep_groups = [files for files in candidates if len(files) <= lockstep_max_group]
+            candidates = [files for files in candidates if len(files) > lockstep_max_group]
+            lockstep_hashes = lockstep_regroup(lockstep_groups, lockstep_key, stats,
+                                               executor, progress)
+
+        hashes = {}
+        for table in regroup(candidates, full_key, 'full', stats,
+                             executor=executor, cache=cache,
+                             kind=hash_kind('full', hash_func), progress=progress,
+                             io_order=io_order):
+            hashes.update(table)
+        if verify:
+            hashes = verify_duplicates(hashes, stats, executor, progress, governor)
+        hashes.update(lockstep_hashes)
+        return hashes
+
+    if pipeline:
+        if compact or memory_budget or io_order:
+            raise ValueError("The pipeline can not be used with the compact table, "
+                             "the memory budget or the I/O order")
+        yield from iter_pipelined_duplicates(roots, workers, pool, partial_key if partial_hash else None,
+                                             full_key, read_limit, stats, cache,
+                                             (hash_kind('partial', hash_func, sample_size, with_middle),
+                                              hash_kind('full', hash_func)),
+                                             progress, hardlinks, verify, governor, path_filter)
+        return
+
+    executor = create_executor(workers, pool)
+    try:
+        if compact:
+            table = FileTable()
+            for root in roots:
+                table.add_tree(root, progress, path_filter)
+            table.prune(stats, hardlinks)
+            if progress is not None:
+                progress.candidates(len(set(table.sizes)), len(table), sum(table.sizes))
+            size_groups = table.size_groups(hardlinks)
+        else:
+            records = (snapshot.scan(roots, progress, path_filter) if snapshot is not None
+                       else scan_records(roots, progress, path_filter))
+            if memory_budget:
+                size_groups = external_size_groups(records, memory_budget,
+                                                   spill_dir, stats, hardlinks)
+            else:
+                size_groups = group_records_by_size(records, stats, hardlinks, progress)
+
+        batch, batch_files = [], 0
+        for files in itertools.chain(size_groups, [None]):
+            if files is not None:
+                batch.append(files)
+                batch_files += len(files)
+                if batch_files < STREAM_BATCH_FILES:
+                    continue
+            for key, duplicates in resolve(batch).items():
+                yield key, [link for filename in duplicates
+                            for link in hardlinks.get(filename, [filename])]
+            batch, batch_files = [], 0
+        if progress is not None:
+            progress.finished()
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+
+def check_for_duplicates(path: (str, Iterable), **options) -> (dict, None):
     """
     Find duplicated files
 
     Creates a dictionary where the key is the hash of the files,
     and the values ​​are lists of the paths to the files whose hash matches the key
 
-    :param path: path to the directory, with files to check
+    :param path: path to the directory, with files to check, or an iterable of paths
+    :param options: options of the search, see iter_duplicates
     :return: dictionary that contains a list of paths to the same files
     """
-    if not os.path.exists(path):
-        raise ValueError("Directory does non exist")
-
-    hashes = {}
-    # For all files with the same file size, get their hash
-    for files in check_for_duplicates_by_size(path):
-        for filename in files:
-            append_value_in_hash_table(hashes, filename,
-                                       get_hash(filename))
-
-    # We are interested only in those elements of the dictionary,
-    # the length of which is more than 1
-    return dict(filter(lambda entry: len(entry[1]) > 1,
-                       hashes.items()))
+    return dict(iter_duplicates(path, **options))
 
 
 if __name__ == '__main__':  # pragma: no cover
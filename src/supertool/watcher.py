@@ -0,0 +1,460 @@
+"""Watch mode that keeps a live index of duplicates up to date from inotify events."""
+
+import ctypes
+import errno
+import hashlib
+import os
+import select
+import stat as stat_module
+import struct
+import time
+from typing import Callable, Iterable
+
+from supertool.path_filter import PathFilter
+from supertool.similar_files_finder import get_hash, scan_files, scan_records
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE
+              | IN_DELETE | IN_DELETE_SELF | IN_ONLYDIR)
+EVENT_HEADER = struct.Struct('iIII')
+READ_SIZE = 64 * 1024
+DEFAULT_RECONCILE_INTERVAL = 600.0
+# directories that vanish or can not be read while they are being watched are skipped
+SKIPPED_WATCH_ERRORS = (errno.ENOENT, errno.ENOTDIR, errno.EACCES)
+
+
+def inotify_available() -> bool:
+    """
+    Checks whether inotify can be used (Linux only)
+
+    :return: bool -- True if the C library provides inotify
+    """
+    try:
+        return hasattr(ctypes.CDLL(None, use_errno=True), 'inotify_init1')
+    except OSError:  # pragma: no cover
+        return False
+
+
+class Inotify:
+    """Thin wrapper of an inotify instance of the C library."""
+
+    def __init__(self):
+        """Creates a non-blocking inotify instance."""
+        if not inotify_available():
+            raise ValueError("inotify is not supported on this system")
+        self._libc = ctypes.CDLL(None, use_errno=True)
+        self._libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+
+    def add_watch(self, path: str, mask: int = WATCH_MASK) -> int:
+        """
+        Watches a directory, watching it again only updates the mask
+
+        :param path: path to the directory
+        :param mask: mask of the events
+        :return: int -- watch descriptor
+        """
+        descriptor = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if descriptor < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), path)
+        return descriptor
+
+    def remove_watch(self, descriptor: int) -> None:
+        """
+        Stops watching, errors of watches that are already removed are ignored
+
+        :param descriptor: watch descriptor
+        :return: None
+        """
+        self._libc.inotify_rm_watch(self.fd, descriptor)
+
+    def read(self, timeout: float = None) -> list:
+        """
+        Reads the pending events, waiting at most timeout seconds for the first one
+
+        :param timeout: timeout in seconds, None to wait forever
+        :return: list of tuples (watch descriptor, mask, cookie, name)
+        """
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        try:
+            data = os.read(self.fd, READ_SIZE)
+        except BlockingIOError:
+            return []
+        events, offset = [], 0
+        while offset < len(data):
+            descriptor, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            events.append((descriptor, mask, cookie, name))
+        return events
+
+    def close(self) -> None:
+        """Closes the inotify instance."""
+        os.close(self.fd)
+
+
+class DuplicateIndex:
+    """
+    In-memory index of files by size and by hash
+
+    A file is hashed only when another file has the same size,
+    so files of unique sizes cost a single stat.
+    Hard links to the same inode are not reported as duplicates of each other.
+    Files rejected by the path filter are not indexed.
+    """
+
+    def __init__(self, hash_func: Callable = hashlib.md5, path_filter: PathFilter = None):
+        """
+        Init an empty index
+
+        :param hash_func: hash function
+        :param path_filter: filter of the files by their paths and sizes
+        """
+        self.hash_func = hash_func
+        self.path_filter = path_filter
+        self.files = {}
+        self.by_size = {}
+        self.hashes = {}
+        self.by_hash = {}
+
+    def __len__(self) -> int:
+        """Returns the number of files in the index."""
+        return len(self.files)
+
+    def _hash(self, path: str) -> (str, None):
+        """
+        Hashes an indexed file and adds it to the hash table
+
+        :param path: path to the file
+        :return: str -- hash value, or None if the file can not be read
+        """
+        try:
+            digest = get_hash(path, self.hash_func)
+        except OSError:
+            self.remove(path)
+            return None
+        self.hashes[path] = digest
+        self.by_hash.setdefault(digest, set()).add(path)
+        return digest
+
+    def _group(self, digest: str) -> (list, None):
+        """
+        Returns the files with a hash, if they are duplicates
+
+        :param digest: hash value
+        :return: list -- sorted paths, or None if there are less than two inodes
+        """
+        paths = self.by_hash.get(digest, ())
+        inodes = {self.files[path][1:3] for path in paths}
+        return sorted(paths) if len(inodes) > 1 else None
+
+    def add(self, path: str) -> list:
+        """
+        Adds a new or changed file to the index
+
+        :param path: path to the file
+        :return: list of pairs (hash, paths) of the groups of duplicates
+        that the file joined
+        """
+        try:
+            stat = os.lstat(path)
+        except OSError:
+            self.remove(path)
+            return []
+        if not stat_module.S_ISREG(stat.st_mode):
+            return []
+        if self.path_filter is not None and not (
+                self.path_filter.allows_file(path, os.path.basename(path))
+                and self.path_filter.allows_size(stat.st_size)):
+            # a file that grew or shrank out of the size range leaves the index
+            self.remove(path)
+            return []
+        record = (stat.st_size, stat.st_dev, stat.st_ino, stat.st_mtime_ns)
+        if self.files.get(path) == record:
+            return []
+        self.remove(path)
+        self.files[path] = record
+        same_size = self.by_size.setdefault(stat.st_size, set())
+        same_size.add(path)
+        if len(same_size) < 2:
+            return []
+        # Files of the size are hashed when the second one arrives
+        for other in [other for other in same_size if other not in self.hashes]:
+            self._hash(other)
+        digest = self.hashes.get(path)
+        group = self._group(digest) if digest is not None else None
+        return [(digest, group)] if group else []
+
+    def remove(self, path: str) -> None:
+        """
+        Removes a file from the index
+
+        :param path: path to the file
+        :return: None
+        """
+        record = self.files.pop(path, None)
+        if record is None:
+            return
+        self.by_size[record[0]].discard(path)
+        if not self.by_size[record[0]]:
+            del self.by_size[record[0]]
+        digest = self.hashes.pop(path, None)
+        if digest is not None:
+            self.by_hash[digest].discard(path)
+            if not self.by_hash[digest]:
+                del self.by_hash[digest]
+
+    def remove_tree(self, directory: str) -> None:
+        """
+        Removes all the files of a directory tree from the index
+
+        :param directory: path to the directory
+        :return: None
+        """
+        prefix = os.path.join(directory, '')
+        for path in [path for path in self.files if path.startswith(prefix)]:
+            self.remove(path)
+
+    def reconcile(self, roots: Iterable) -> list:
+        """
+        Brings the index in line with the directory trees
+
+        :param roots: paths to the watched directories
+        :return: list of pairs (hash, paths) of the groups of duplicates
+        that got new files
+        """
+        seen, digests = set(), set()
+        for root in roots:
+            for _, _, _, path in scan_records(root, path_filter=self.path_filter):
+                seen.add(path)
+                digests.update(digest for digest, _ in self.add(path))
+        for path in [path for path in self.files if path not in seen]:
+            self.remove(path)
+        groups = [(digest, self._group(digest)) for digest in sorted(digests)]
+        return [(digest, group) for digest, group in groups if group]
+
+    def duplicates(self) -> dict:
+        """
+        Returns all the groups of duplicates in the index
+
+        :return: dict -- dictionary where the key is a hash,
+        and the value is the list of paths to the duplicate files
+        """
+        groups = {digest: self._group(digest) for digest in self.by_hash}
+        return {digest: group for digest, group in groups.items() if group}
+
+
+class DuplicateWatcher:
+    """
+    Watcher of directory trees that reports new duplicates as soon as files land
+
+    Files are indexed when they are closed after writing or moved into the trees.
+    Files that appear without such an event (for example, new hard links),
+    and all the changes lost by an overflow of the event queue,
+    are found by a reconciliation pass, which rescans the trees
+    every reconcile_interval seconds and after an overflow.
+    """
+
+    def __init__(self, roots: Iterable, on_duplicates: Callable,
+                 hash_func: Callable = hashlib.md5,
+                 reconcile_interval: float = DEFAULT_RECONCILE_INTERVAL,
+                 path_filter: PathFilter = None):
+        """
+        Init the watcher
+
+        :param roots: paths to the directories to watch
+        :param on_duplicates: function that is called with a hash and the sorted list
+        of paths to the duplicate files, whenever a group of duplicates gets a new file
+        :param hash_func: hash function
+        :param reconcile_interval: interval between reconciliation passes in seconds
+        :param path_filter: filter of the files by their paths and sizes,
+        excluded directories are not watched
+        """
+        self.roots = [os.path.abspath(root) for root in roots]
+        for root in self.roots:
+            if not os.path.isdir(root):
+                raise ValueError(f"Directory does not exist: {root}")
+        self.on_duplicates = on_duplicates
+        self.reconcile_interval = reconcile_interval
+        self.path_filter = path_filter
+        self.index = DuplicateIndex(hash_func, path_filter)
+        self.inotify = Inotify()
+        self.directories = {}
+        self._reconciled = time.monotonic()
+
+    def __enter__(self):
+        """Starts the watcher."""
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        """Closes the watcher."""
+        self.close()
+
+    def _report(self, groups: list) -> None:
+        """
+        Passes groups of duplicates to on_duplicates
+
+        :param groups: list of pairs (hash, paths)
+        :return: None
+        """
+        for digest, paths in groups:
+            self.on_duplicates(digest, paths)
+
+    def _watch_tree(self, root: str) -> None:
+        """
+        Watches a directory and all its subdirectories
+
+        Directories that vanish or can not be read are skipped,
+        other errors, like the limit of inotify watches, are raised.
+
+        :param root: path to the directory
+        :return: None
+        """
+        directories = [root]
+        while directories:
+            directory = directories.pop()
+            try:
+                self.directories[self.inotify.add_watch(directory)] = directory
+                with os.scandir(directory) as entries:
+                    directories.extend(entry.path for entry in entries
+                                       if entry.is_dir(follow_symlinks=False)
+                                       and self._allows_directory(entry.path))
+            except OSError as e:
+                if e.errno == errno.ENOSPC:
+                    raise ValueError("The limit of inotify watches is reached, "
+                                     "raise fs.inotify.max_user_watches") from e
+                if e.errno not in SKIPPED_WATCH_ERRORS:
+                    raise
+
+    def _allows_directory(self, path: str) -> bool:
+        """
+        Checks whether a directory is watched and scanned
+
+        :param path: path to the directory
+        :return: bool -- True if the directory is not excluded
+        """
+        return (self.path_filter is None
+                or self.path_filter.allows_directory(path, os.path.basename(path)))
+
+    def _unwatch_tree(self, root: str) -> None:
+        """
+        Stops watching a directory and all its subdirectories
+
+        :param root: path to the directory
+        :return: None
+        """
+        prefix = os.path.join(root, '')
+        for descriptor, directory in list(self.directories.items()):
+            if directory == root or directory.startswith(prefix):
+                self.inotify.remove_watch(descriptor)
+                del self.directories[descriptor]
+
+    def reconcile(self) -> None:
+        """
+        Watches new directories and rescans the trees, reporting new duplicates
+
+        :return: None
+        """
+        for root in self.roots:
+            self._watch_tree(root)
+        self._report(self.index.reconcile(self.roots))
+        self._reconciled = time.monotonic()
+
+    def start(self) -> None:
+        """
+        Watches the trees, then indexes them, reporting the existing duplicates
+
+        :return: None
+        """
+        self.reconcile()
+
+    def handle(self, descriptor: int, mask: int, name: str) -> None:
+        """
+        Updates the index by an inotify event
+
+        :param descriptor: watch descriptor
+        :param mask: mask of the event
+        :param name: name of the file in the watched directory
+        :return: None
+        """
+        if mask & IN_Q_OVERFLOW:
+            self.reconcile()
+            return
+        if mask & IN_IGNORED:
+            self.directories.pop(descriptor, None)
+            return
+        directory = self.directories.get(descriptor)
+        if directory is None or not name:
+            return
+        path = os.path.join(directory, name)
+        if mask & IN_ISDIR:
+            if mask & (IN_MOVED_FROM | IN_DELETE):
+                self._unwatch_tree(path)
+                self.index.remove_tree(path)
+            elif mask & (IN_CREATE | IN_MOVED_TO) and self._allows_directory(path):
+                # Files may land before the new directory is watched
+                self._watch_tree(path)
+                for entry in scan_files(path, path_filter=self.path_filter):
+                    self._report(self.index.add(entry.path))
+        elif mask & (IN_MOVED_FROM | IN_DELETE):
+            self.index.remove(path)
+        elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+            self._report(self.index.add(path))
+
+    def poll(self, timeout: float = None) -> int:
+        """
+        Handles the events that arrive within timeout seconds,
+        and reconciles the index when it is due
+
+        :param timeout: timeout in seconds, None to wait until the next reconciliation
+        :return: int -- number of handled events
+        """
+        due = self._reconciled + self.reconcile_interval - time.monotonic()
+        timeout = max(0.0, due if timeout is None else min(timeout, due))
+        events = self.inotify.read(timeout)
+        for descriptor, mask, _, name in events:
+            self.handle(descriptor, mask, name)
+        if time.monotonic() >= self._reconciled + self.reconcile_interval:
+            self.reconcile()
+        return len(events)
+
+    def run(self) -> None:
+        """
+        Handles the events forever
+
+        :return: None
+        """
+        while True:
+            self.poll()
+
+    def close(self) -> None:
+        """Stops watching."""
+        self.inotify.close()
+
+
+def new_duplicates_printer(key: str, paths: list) -> None:
+    """
+    Displays a group of duplicates that got a new file
+
+    :param key: hash of the files
+    :param paths: list of paths to the duplicate files
+    :return: None
+    """
+    print(f'---\n{time.strftime("%H:%M:%S")} with hash {key}')
+    print('\n'.join(paths), flush=True)
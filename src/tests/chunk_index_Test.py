@@ -0,0 +1,100 @@
+from tempfile import TemporaryDirectory
+import io
+import os
+import random
+import unittest
+
+from supertool import chunk_index
+from helpers import create_file_with_content
+
+
+def random_bytes(size: int, seed: int) -> bytes:
+    """
+    Generates reproducible random content
+
+    :param size: number of bytes
+    :param seed: seed of the generator
+    :return: bytes -- content
+    """
+
+    return random.Random(seed).getrandbits(8 * size).to_bytes(size, 'little')
+
+
+class ChunkIndexTestsCase(unittest.TestCase):
+    """TestCase for testing the search of files that share a part of their content"""
+
+    def test_chunks_survive_insertion(self):
+        """
+        verifies that chunks cover the content within the size limits,
+        and that an insertion at the start changes only the first chunk
+        """
+
+        content = random_bytes(200000, 1)
+        chunks = list(chunk_index.iter_chunks(io.BytesIO(content), block_size=10000))
+        self.assertEqual(b''.join(chunks), content)
+        self.assertTrue(all(chunk_index.MIN_CHUNK_SIZE <= len(chunk) <= chunk_index.MAX_CHUNK_SIZE
+                            for chunk in chunks[:-1]))
+        shifted = list(chunk_index.iter_chunks(io.BytesIO(b'header' + content)))
+        self.assertEqual(shifted[1:], chunks[1:])
+
+    def test_similar_pairs(self):
+        """
+        verifies that an edited copy is reported with the shared bytes,
+        and that a different file is not
+        """
+
+        content = random_bytes(400000, 2)
+        with TemporaryDirectory() as temp_dir:
+            create_file_with_content(os.path.join(temp_dir, 'a'), content)
+            create_file_with_content(os.path.join(temp_dir, 'b'), b'header' + content + b'footer')
+            create_file_with_content(os.path.join(temp_dir, 'c'), random_bytes(100000, 3))
+            os.link(os.path.join(temp_dir, 'a'), os.path.join(temp_dir, 'd'))
+            index = chunk_index.ChunkIndex()
+            self.assertEqual(index.build(temp_dir), 3)
+
+            pairs = index.similar_pairs(0.8)
+            self.assertEqual(len(pairs), 1)
+            similarity, reclaimable, first, second = pairs[0]
+            self.assertIn({os.path.basename(first), os.path.basename(second)}, ({'a', 'b'}, {'b', 'd'}))
+            self.assertGreater(similarity, 0.8)
+            self.assertGreater(reclaimable, 300000)
+            self.assertEqual(index.similar_pairs(1.0), [])
+
+    def test_identical_copies(self):
+        """
+        verifies that every copy of a file is reported, even when
+        the copies outnumber the files counted per chunk, and that
+        chunks of too many different files are counted as ignored
+        """
+
+        content = random_bytes(50000, 4)
+        with TemporaryDirectory() as temp_dir:
+            for index in range(70):
+                create_file_with_content(os.path.join(temp_dir, f'copy{index}'), content)
+            for index in range(3):
+                create_file_with_content(os.path.join(temp_dir, f'edited{index}'),
+                                         content + str(index).encode())
+            index = chunk_index.ChunkIndex(max_postings=2)
+            self.assertEqual(index.build(temp_dir), 73)
+            self.assertEqual(len(index), 73)
+
+            pairs = index.similar_pairs(0.9)
+            self.assertEqual(len(pairs), 69)
+            self.assertTrue(all(pair[:2] == (1.0, 50000) for pair in pairs))
+            skipped, skipped_bytes = index.common_chunks()
+            self.assertGreater(skipped, 0)
+            self.assertLess(skipped_bytes, 50000)
+
+    def test_wrong_chunk_sizes(self):
+        """
+        verifies that wrong chunk sizes are rejected
+        """
+
+        with self.assertRaises(ValueError):
+            chunk_index.ChunkIndex(average_size=5000)
+        with self.assertRaises(ValueError):
+            chunk_index.ChunkIndex(min_size=16384, average_size=8192)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+from tempfile import TemporaryDirectory
+from unittest import mock
+import os
+import unittest
+
+from supertool import content_index
+from helpers import create_file_with_content
+
+
+class ContentIndexTestsCase(unittest.TestCase):
+    """TestCase for testing the persistent index of a file store"""
+
+    def test_build_hashes_only_collisions(self):
+        """
+        verifies that only files of shared sizes are hashed when the index is built
+        """
+
+        with TemporaryDirectory() as store_dir, TemporaryDirectory() as index_dir:
+            create_file_with_content(os.path.join(store_dir, 'a'), 'same')
+            create_file_with_content(os.path.join(store_dir, 'b'), 'same')
+            create_file_with_content(os.path.join(store_dir, 'c'), 'unique size')
+            with content_index.ContentIndex(os.path.join(index_dir, 'index.db')) as index:
+                with mock.patch.object(content_index, 'get_partial_hash',
+                                       wraps=content_index.get_partial_hash) as partial_hash:
+                    self.assertEqual(index.build(store_dir), 3)
+                self.assertEqual(sorted(call[0][0] for call in partial_hash.call_args_list),
+                                 [os.path.join(store_dir, 'a'), os.path.join(store_dir, 'b')])
+                self.assertEqual(len(index), 3)
+
+    def test_lookup(self):
+        """
+        verifies that copies are found after reopening the index,
+        and that changed and removed files are not reported
+        """
+
+        with TemporaryDirectory() as store_dir, TemporaryDirectory() as upload_dir:
+            index_path = os.path.join(upload_dir, 'index.db')
+            create_file_with_content(os.path.join(store_dir, 'a'), 'content')
+            create_file_with_content(os.path.join(store_dir, 'b'), 'content')
+            create_file_with_content(os.path.join(store_dir, 'c'), 'unique size')
+            with content_index.ContentIndex(index_path) as index:
+                index.build(store_dir)
+
+            upload = os.path.join(upload_dir, 'upload')
+            create_file_with_content(upload, 'unique size')
+            with content_index.ContentIndex(index_path) as index:
+                self.assertEqual(index.lookup(upload), [os.path.join(store_dir, 'c')])
+                create_file_with_content(upload, 'content')
+                self.assertEqual(index.lookup(upload), [os.path.join(store_dir, 'a'),
+                                                        os.path.join(store_dir, 'b')])
+                os.remove(os.path.join(store_dir, 'a'))
+                create_file_with_content(os.path.join(store_dir, 'b'), 'CONTENT')
+                self.assertEqual(index.lookup(upload), [])
+                self.assertEqual(len(index), 2)
+
+                self.assertEqual(index.add(upload), [])
+                create_file_with_content(os.path.join(store_dir, 'd'), 'content')
+                self.assertEqual(index.add(os.path.join(store_dir, 'd')), [upload])
+
+    def test_touched_copies_are_found(self):
+        """
+        verifies that indexed files touched without a change of content
+        are rehashed and still found by the first lookup
+        """
+
+        with TemporaryDirectory() as store_dir, TemporaryDirectory() as upload_dir:
+            copies = [os.path.join(store_dir, name) for name in ('a', 'b')]
+            for copy in copies:
+                create_file_with_content(copy, 'content')
+            upload = os.path.join(upload_dir, 'upload')
+            create_file_with_content(upload, 'content')
+            with content_index.ContentIndex(os.path.join(upload_dir, 'index.db')) as index:
+                index.build(store_dir)
+                for copy in copies:
+                    os.utime(copy, ns=(10 ** 18, 10 ** 18))
+                self.assertEqual(index.lookup(upload), copies)
+                self.assertEqual(index.lookup(upload), copies)
+
+    def test_lookup_checks_only_candidates(self):
+        """
+        verifies that a lookup checks only the indexed files with the same partial hash,
+        not all the files of the same size
+        """
+
+        with TemporaryDirectory() as store_dir, TemporaryDirectory() as upload_dir:
+            for index in range(50):
+                create_file_with_content(os.path.join(store_dir, str(index)), f'{index:04}')
+            create_file_with_content(os.path.join(store_dir, 'copy'), '0007')
+            upload = os.path.join(upload_dir, 'upload')
+            create_file_with_content(upload, '0007')
+            with content_index.ContentIndex(os.path.join(upload_dir, 'index.db')) as index:
+                index.build(store_dir)
+                with mock.patch.object(content_index.os, 'stat', wraps=os.stat) as stat:
+                    self.assertEqual(index.lookup(upload), [os.path.join(store_dir, '7'),
+                                                            os.path.join(store_dir, 'copy')])
+                self.assertLess(stat.call_count, 10)
+
+    def test_wrong_settings(self):
+        """
+        verifies that an index can not be opened with another algorithm
+        """
+
+        with TemporaryDirectory() as temp_dir:
+            index_path = os.path.join(temp_dir, 'index.db')
+            content_index.ContentIndex(index_path).close()
+            with self.assertRaises(ValueError):
+                content_index.ContentIndex(index_path, algorithm='sha1')
+
+
+if __name__ == '__main__':
+    unittest.main()
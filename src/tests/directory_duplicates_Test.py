@@ -0,0 +1,77 @@
+from tempfile import TemporaryDirectory
+from unittest import mock
+import os
+import unittest
+
+from supertool import directory_duplicates, hash_cache
+from helpers import create_file_with_content
+
+
+def create_tree(root: str) -> None:
+    """
+    Creates a small tree with a nested directory
+
+    :param root: path to the root of the tree
+    """
+
+    create_file_with_content(os.path.join(root, 'readme'), 'readme')
+    create_file_with_content(os.path.join(root, 'src', 'main.py'), 'print(1)')
+    create_file_with_content(os.path.join(root, 'src', 'util.py'), 'print(2)')
+
+
+class DirectoryDuplicatesTestsCase(unittest.TestCase):
+    """TestCase for testing the search of duplicated directory trees"""
+
+    def test_largest_trees_first(self):
+        """
+        verifies that identical trees are reported once, the largest first,
+        with their subdirectories collapsed
+        """
+
+        with TemporaryDirectory() as temp_dir:
+            create_tree(os.path.join(temp_dir, 'project'))
+            create_tree(os.path.join(temp_dir, 'backup', 'project'))
+            create_file_with_content(os.path.join(temp_dir, 'other', 'lib', 'main.py'), 'print(1)')
+            create_file_with_content(os.path.join(temp_dir, 'other', 'lib', 'util.py'), 'print(2)')
+            create_file_with_content(os.path.join(temp_dir, 'changed', 'readme'), 'readme')
+            create_file_with_content(os.path.join(temp_dir, 'changed', 'src', 'main.py'), 'print(3)')
+            create_file_with_content(os.path.join(temp_dir, 'changed', 'src', 'util.py'), 'print(2)')
+
+            duplicates = directory_duplicates.check_for_duplicate_directories(temp_dir)
+            self.assertEqual(list(duplicates.values()), [
+                [os.path.join(temp_dir, 'backup', 'project'), os.path.join(temp_dir, 'project')],
+                [os.path.join(temp_dir, 'backup', 'project', 'src'), os.path.join(temp_dir, 'other', 'lib')],
+            ])
+
+    def test_cached_merkle_roots(self):
+        """
+        verifies that files of an unchanged tree are not hashed again,
+        and that a change inside the tree is noticed
+        """
+
+        with TemporaryDirectory() as temp_dir, TemporaryDirectory() as cache_dir:
+            create_tree(os.path.join(temp_dir, 'a'))
+            create_tree(os.path.join(temp_dir, 'b'))
+            with hash_cache.HashCache(cache_dir) as cache:
+                first = directory_duplicates.check_for_duplicate_directories(temp_dir, cache=cache)
+                with mock.patch.object(directory_duplicates, 'get_hash') as get_hash:
+                    second = directory_duplicates.check_for_duplicate_directories(temp_dir,
+                                                                                  cache=cache)
+                get_hash.assert_not_called()
+                self.assertEqual(first, second)
+
+                create_file_with_content(os.path.join(temp_dir, 'b', 'src', 'main.py'), 'print(3)')
+                third = directory_duplicates.check_for_duplicate_directories(temp_dir, cache=cache)
+                self.assertEqual(third, {})
+
+    def test_wrong_directory(self):
+        """
+        verifies that a missing directory is rejected
+        """
+
+        with self.assertRaises(ValueError):
+            directory_duplicates.check_for_duplicate_directories('/no/such/directory')
+
+
+if __name__ == '__main__':
+    unittest.main()
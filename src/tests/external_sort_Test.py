@@ -0,0 +1,67 @@
+from tempfile import TemporaryDirectory
+import os
+import random
+import unittest
+from unittest.mock import patch
+
+from supertool import external_sort, similar_files_finder
+from helpers import create_file_with_content
+
+
+class ExternalSortTestsCase(unittest.TestCase):
+    """TestCase for testing the external sort of file records"""
+
+    def test_merge_of_many_runs(self):
+        """
+        verifies that records split into many small runs
+        are merged in sorted order and the runs are removed
+        """
+
+        records = [(random.randint(0, 50), 1, index, f'path/{index}\n') for index in range(500)]
+        with TemporaryDirectory() as temp_dir:
+            with patch.object(external_sort, 'MAX_MERGE_FAN_IN', 4):
+                runs = external_sort.write_sorted_runs(iter(records), 2000, temp_dir)
+                self.assertGreater(len(runs), 4)
+                self.assertEqual(list(external_sort.merge_runs(runs, temp_dir)), sorted(records))
+            self.assertEqual(os.listdir(temp_dir), [])
+
+    def test_external_size_groups(self):
+        """
+        verifies that only sizes shared by two inodes are yielded,
+        and hard links are collapsed and recorded for all the sizes
+        """
+
+        records = [(1, 1, 1, 'a'), (2, 1, 2, 'b'), (1, 1, 3, 'c'), (3, 1, 4, 'd'), (3, 1, 4, 'e')]
+        hardlinks = {}
+        stats = similar_files_finder.create_statistics()
+        groups = list(external_sort.external_size_groups(records, 1, stats=stats,
+                                                         hardlinks=hardlinks))
+        self.assertEqual(groups, [['a', 'c']])
+        self.assertDictEqual(hardlinks, {'d': ['d', 'e']})
+        self.assertEqual(stats['size']['eliminated_files'], 3)
+
+    def test_external_search(self):
+        """
+        verifies that the search with a tiny memory budget
+        finds the same duplicates
+        """
+
+        with TemporaryDirectory() as temp_dir:
+            for index in range(30):
+                create_file_with_content(os.path.join(temp_dir, str(index)),
+                                         str(index % 4) * (index % 3 + 1))
+
+            def normalize(duplicates):
+                return sorted(sorted(paths) for paths in duplicates.values())
+
+            os.link(os.path.join(temp_dir, '0'), os.path.join(temp_dir, 'link'))
+            create_file_with_content(os.path.join(temp_dir, 'unique'), 'unique size')
+            os.link(os.path.join(temp_dir, 'unique'), os.path.join(temp_dir, 'unique_link'))
+
+            hardlinks, external_hardlinks = {}, {}
+            self.assertEqual(normalize(similar_files_finder.check_for_duplicates(
+                                 temp_dir, memory_budget=1000, hardlinks=external_hardlinks)),
+                             normalize(similar_files_finder.check_for_duplicates(temp_dir,
+                                                                                 hardlinks=hardlinks)))
+            self.assertEqual(len(hardlinks), 2)
+            self.assertEqual(normalize(external_hardlinks), normalize(hardlinks))
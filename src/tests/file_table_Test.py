@@ -0,0 +1,75 @@
+from tempfile import TemporaryDirectory
+import os
+import unittest
+
+from supertool import file_table, similar_files_finder
+from helpers import create_file_with_content
+
+
+class FileTableTestsCase(unittest.TestCase):
+    """TestCase for testing the compact table of files"""
+
+    def test_paths_are_restored(self):
+        """
+        verifies that the table restores the paths of nested files
+        """
+
+        with TemporaryDirectory() as temp_dir:
+            subdir = os.path.join(temp_dir, 'a', 'b')
+            os.makedirs(subdir)
+            file_paths = [os.path.join(temp_dir, '1'), os.path.join(subdir, '2')]
+            for file_path in file_paths:
+                create_file_with_content(file_path, 'hello')
+
+            table = file_table.FileTable.from_tree(temp_dir)
+            self.assertEqual(len(table), 2)
+            self.assertEqual(sorted(table.path(index) for index in range(len(table))),
+                             sorted(file_paths))
+
+    def test_prune_and_size_groups(self):
+        """
+        verifies that prune keeps only files whose size is shared with another inode,
+        and both record the hard links
+        """
+
+        with TemporaryDirectory() as temp_dir:
+            for name, content in (('1', 'aaa'), ('2', 'bbb'), ('3', 'cccc'), ('4', 'ddddd')):
+                create_file_with_content(os.path.join(temp_dir, name), content)
+            os.link(os.path.join(temp_dir, '4'), os.path.join(temp_dir, '5'))
+
+            table = file_table.FileTable.from_tree(temp_dir)
+            stats = similar_files_finder.create_statistics()
+            hardlinks = {}
+            table.prune(stats, hardlinks)
+            self.assertEqual(len(table), 2)
+            self.assertEqual(stats['size']['eliminated_files'], 3)
+            self.assertEqual([sorted(links) for links in hardlinks.values()],
+                             [[os.path.join(temp_dir, '4'), os.path.join(temp_dir, '5')]])
+
+            hardlinks = {}
+            self.assertEqual([sorted(group) for group in table.size_groups(hardlinks)],
+                             [[os.path.join(temp_dir, '1'), os.path.join(temp_dir, '2')]])
+            self.assertDictEqual(hardlinks, {})
+
+    def test_compact_search(self):
+        """
+        verifies that the compact search finds the same duplicates
+        """
+
+        with TemporaryDirectory() as temp_dir:
+            for index in range(20):
+                subdir = os.path.join(temp_dir, str(index % 3))
+                os.makedirs(subdir, exist_ok=True)
+                create_file_with_content(os.path.join(subdir, str(index)), str(index % 7))
+
+            os.link(os.path.join(temp_dir, '0', '0'), os.path.join(temp_dir, 'link'))
+            create_file_with_content(os.path.join(temp_dir, 'unique'), 'unique size')
+            os.link(os.path.join(temp_dir, 'unique'), os.path.join(temp_dir, 'unique_link'))
+
+            hardlinks, compact_hardlinks = {}, {}
+            self.assertDictEqual(similar_files_finder.check_for_duplicates(
+                                     temp_dir, compact=True, hardlinks=compact_hardlinks),
+                                 similar_files_finder.check_for_duplicates(temp_dir,
+                                                                           hardlinks=hardlinks))
+            self.assertEqual(len(hardlinks), 2)
+            self.assertDictEqual(compact_hardlinks, hardlinks)
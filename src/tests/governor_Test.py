@@ -0,0 +1,95 @@
+from tempfile import TemporaryDirectory
+import hashlib
+import os
+import time
+import unittest
+from unittest.mock import patch
+
+from supertool import governor, similar_files_finder
+from helpers import create_file_with_content
+
+
+class GovernorTestsCase(unittest.TestCase):
+    """TestCase for testing the resource governor"""
+
+    def test_throttle_bytes(self):
+        """
+        verifies that reads above the rate are delayed
+        """
+
+        io_governor = governor.IOGovernor(bytes_per_second=1000, burst=0.01)
+        start = time.monotonic()
+        for _ in range(3):
+            io_governor.throttle(50)
+        self.assertGreaterEqual(time.monotonic() - start, 0.13)
+
+    def test_throttle_iops(self):
+        """
+        verifies that reads above the number of reads per second are delayed
+        """
+
+        io_governor = governor.IOGovernor(iops=100, burst=0.01)
+        self.assertEqual(io_governor.throttle(10 ** 9), 0.0)
+        self.assertGreater(io_governor.throttle(1), 0.0)
+
+    def test_wrong_rates(self):
+        """
+        verifies that rates that are not positive are rejected
+        """
+
+        for options in ({'bytes_per_second': 0}, {'iops': 0}, {'iops': -1}):
+            with self.assertRaises(ValueError):
+                governor.IOGovernor(**options)
+
+    def test_cpu_share(self):
+        """
+        verifies the sleep after hashing and the validation of the share
+        """
+
+        io_governor = governor.IOGovernor(cpu_share=0.25)
+        self.assertAlmostEqual(io_governor.account_cpu(0.01), 0.04, delta=0.005)
+        with self.assertRaises(ValueError):
+            governor.IOGovernor(cpu_share=2)
+
+    def test_cpu_share_is_shared_by_threads(self):
+        """
+        verifies that the CPU time of all the threads is charged to the same budget
+        """
+
+        io_governor = governor.IOGovernor(cpu_share=0.5, burst=0)
+        with patch.object(governor.time, 'sleep'):
+            delays = [io_governor.account_cpu(0.1) for _ in range(4)]
+        self.assertAlmostEqual(delays[0], 0.2, delta=0.01)
+        self.assertAlmostEqual(delays[-1], 0.8, delta=0.01)
+
+    def test_governed_hash(self):
+        """
+        verifies that the governed hashing gives the same hash
+        """
+
+        io_governor = governor.IOGovernor(bytes_per_second=10 ** 9, iops=10 ** 6, cpu_share=0.5)
+        self.assertEqual(similar_files_finder.get_hash(__file__, governor=io_governor,
+                                                       block_size=100, mmap_threshold=1),
+                         similar_files_finder.get_hash(__file__))
+        with open(__file__, 'rb') as file:
+            self.assertEqual(similar_files_finder.get_hash(__file__, hashlib.sha1, governor=io_governor),
+                             hashlib.sha1(file.read()).hexdigest())
+
+    def test_small_files_are_charged_their_size(self):
+        """
+        verifies that the governor is charged the bytes actually read,
+        not whole blocks, so small files are hashed without delay
+        """
+
+        io_governor = governor.IOGovernor(bytes_per_second=1024 * 1024)
+        with TemporaryDirectory() as temp_dir:
+            paths = [os.path.join(temp_dir, str(number)) for number in range(6)]
+            for path in paths:
+                create_file_with_content(path, '0123456789')
+            start = time.monotonic()
+            for path in paths:
+                similar_files_finder.get_hash(path, governor=io_governor)
+                similar_files_finder.get_partial_hash(path, governor=io_governor)
+            self.assertEqual(similar_files_finder.compare_files(paths, governor=io_governor),
+                             [sorted(paths)])
+            self.assertLess(time.monotonic() - start, 0.5)
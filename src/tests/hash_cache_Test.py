@@ -0,0 +1,54 @@
+from tempfile import TemporaryDirectory
+import os
+import unittest
+
+from supertool import hash_cache
+from helpers import create_file_with_content
+
+
+class HashCacheTestsCase(unittest.TestCase):
+    """TestCase for testing the persistent hash cache"""
+
+    def test_get_after_set(self):
+        """
+        verifies that a stored hash survives reopening of the cache
+        """
+
+        with TemporaryDirectory() as temp_dir:
+            file_path = os.path.join(temp_dir, 'file')
+            create_file_with_content(file_path, 'text')
+            with hash_cache.HashCache(temp_dir) as cache:
+                self.assertIsNone(cache.get(file_path, 'full'))
+                cache.set(file_path, 'full', 'digest')
+            with hash_cache.HashCache(temp_dir) as cache:
+                self.assertEqual(cache.get(file_path, 'full'), 'digest')
+                self.assertIsNone(cache.get(file_path, 'partial'))
+
+    def test_invalidation_on_change(self):
+        """
+        verifies that a stored hash is stale after the file was modified
+        """
+
+        with TemporaryDirectory() as temp_dir:
+            file_path = os.path.join(temp_dir, 'file')
+            create_file_with_content(file_path, 'text')
+            with hash_cache.HashCache(temp_dir) as cache:
+                cache.set(file_path, 'full', 'digest')
+                create_file_with_content(file_path, 'longer text')
+                self.assertIsNone(cache.get(file_path, 'full'))
+
+    def test_evict(self):
+        """
+        verifies that the least recently used entries
+        above the limit are evicted
+        """
+
+        with TemporaryDirectory() as temp_dir:
+            file_paths = [os.path.join(temp_dir, str(i)) for i in range(3)]
+            with hash_cache.HashCache(temp_dir, max_entries=2) as cache:
+                for file_path in file_paths:
+                    create_file_with_content(file_path, file_path)
+                    cache.set(file_path, 'full', file_path)
+                self.assertEqual(cache.evict(), 1)
+            with hash_cache.HashCache(temp_dir, max_age=-1) as cache:
+                self.assertEqual(cache.evict(), 2)
@@ -0,0 +1,18 @@
+"""Helpers shared by the test modules."""
+
+import os
+
+
+def create_file_with_content(file_path: str, content: (str, bytes)) -> None:
+    """
+    Creates a file with the given name, and its missing directories,
+    and fills it with content
+
+    :param file_path: path to the file being created
+    :param content: content that will be filled with the file,
+    bytes are written as they are
+    """
+
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, 'wb' if isinstance(content, bytes) else 'w') as file:
+        file.write(content)
@@ -0,0 +1,74 @@
+from tempfile import TemporaryDirectory
+import os
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from supertool import io_scheduling, similar_files_finder
+from helpers import create_file_with_content
+
+
+class IoSchedulingTestsCase(unittest.TestCase):
+    """TestCase for testing the ordering and limiting of file reads"""
+
+    def test_locality_key(self):
+        """
+        verifies that files are ordered by device and inode,
+        and unknown orders are rejected
+        """
+
+        with TemporaryDirectory() as temp_dir:
+            file_path = os.path.join(temp_dir, 'file')
+            create_file_with_content(file_path, 'text')
+            stat = os.stat(file_path)
+            self.assertEqual(io_scheduling.locality_key(file_path),
+                             (stat.st_dev, -1, stat.st_ino))
+            self.assertEqual(len(io_scheduling.locality_key(file_path, 'physical')), 3)
+            with self.assertRaises(ValueError):
+                io_scheduling.locality_key(file_path, 'random')
+
+    def test_device_limited_key(self):
+        """
+        verifies that calls for a rotational device do not overlap
+        """
+
+        active, overlaps = [0], []
+        lock = threading.Lock()
+
+        def key_func(filename):
+            with lock:
+                active[0] += 1
+                overlaps.append(active[0])
+            time.sleep(0.01)
+            with lock:
+                active[0] -= 1
+            return filename
+
+        limited_key = io_scheduling.DeviceLimitedKey(key_func, 1)
+        with patch.object(io_scheduling, 'is_rotational', return_value=True):
+            threads = [threading.Thread(target=limited_key, args=(__file__,)) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(max(overlaps), 1)
+
+    def test_ordered_search(self):
+        """
+        verifies that the ordered and limited search finds the same duplicates
+        """
+
+        with TemporaryDirectory() as temp_dir:
+            for index in range(20):
+                create_file_with_content(os.path.join(temp_dir, str(index)), str(index % 5) * 10)
+
+            expected = similar_files_finder.check_for_duplicates(temp_dir)
+            for io_order in io_scheduling.IO_ORDERS:
+                self.assertDictEqual(similar_files_finder.check_for_duplicates(temp_dir, workers=4,
+                                                                               io_order=io_order,
+                                                                               rotational_workers=1),
+                                     expected)
+            with self.assertRaises(ValueError):
+                similar_files_finder.check_for_duplicates(temp_dir, pool='process',
+                                                          rotational_workers=1)
@@ -0,0 +1,117 @@
+from tempfile import TemporaryDirectory
+import io
+import os
+import random
+import unittest
+
+from supertool import near_duplicates
+from helpers import create_file_with_content
+
+
+def random_text(words: int, seed: int) -> str:
+    """
+    Generates reproducible random lines of words
+
+    :param words: number of words
+    :param seed: seed of the generator
+    :return: str -- text of 10 words per line
+    """
+
+    generator = random.Random(seed)
+    vocabulary = [f'word{index}' for index in range(500)]
+    text = [generator.choice(vocabulary) for _ in range(words)]
+    return '\n'.join(' '.join(text[start:start + 10]) for start in range(0, words, 10))
+
+
+class NearDuplicatesTestsCase(unittest.TestCase):
+    """TestCase for testing the search of near-duplicate text files"""
+
+    def test_reformatted_text(self):
+        """
+        verifies that rewrapped and recased text gives the same shingles
+        """
+
+        shingles = list(near_duplicates.iter_shingles(io.StringIO('One two three\nfour five six'), 3))
+        reformatted = list(near_duplicates.iter_shingles(io.StringIO('one,  TWO\nthree four\tfive six'), 3))
+        self.assertEqual(len(shingles), 4)
+        self.assertEqual(shingles, reformatted)
+        self.assertEqual(len(list(near_duplicates.iter_shingles(io.StringIO('short text'), 3))), 1)
+
+    def test_near_duplicates(self):
+        """
+        verifies that a copy with a changed header is found,
+        and that unrelated and binary files are not
+        """
+
+        text = random_text(3000, 1)
+        with TemporaryDirectory() as temp_dir:
+            create_file_with_content(os.path.join(temp_dir, 'log'), 'header of 2024\n' + text)
+            create_file_with_content(os.path.join(temp_dir, 'copy'), 'HEADER OF 2025\n' + text.replace('\n', ' '))
+            create_file_with_content(os.path.join(temp_dir, 'other'), random_text(3000, 2))
+            create_file_with_content(os.path.join(temp_dir, 'binary'), '\0' + text)
+            index = near_duplicates.LSHIndex(0.8)
+            self.assertEqual(index.build(temp_dir), 3)
+
+            pairs = index.near_duplicates()
+            self.assertEqual(len(pairs), 1)
+            similarity, first, second = pairs[0]
+            self.assertEqual({os.path.basename(first), os.path.basename(second)}, {'log', 'copy'})
+            self.assertGreater(similarity, 0.9)
+
+    def test_copies_and_crowded_buckets(self):
+        """
+        verifies that files with the same signature are collapsed into copies,
+        and that buckets of too many files are not paired
+        """
+
+        text = random_text(500, 3)
+        with TemporaryDirectory() as temp_dir:
+            for index in range(30):
+                create_file_with_content(os.path.join(temp_dir, f'copy{index:02}'), text)
+            for index in range(4):
+                create_file_with_content(os.path.join(temp_dir, f'edit{index}'),
+                                         text + '\n' + random_text(30, 10 + index))
+            index = near_duplicates.LSHIndex(0.8, max_bucket_size=3)
+            self.assertEqual(index.build(temp_dir), 34)
+            self.assertEqual(len(index), 34)
+            self.assertEqual(len(index.paths), 5)
+
+            pairs = index.near_duplicates()
+            copies = [pair for pair in pairs if 'copy' in pair[1] and 'copy' in pair[2]]
+            self.assertEqual(len(copies), 29)
+            self.assertEqual({similarity for similarity, _, _ in copies}, {1.0})
+            self.assertEqual(len({path for _, first, second in copies for path in (first, second)}), 30)
+            self.assertGreater(index.crowded_buckets(), 0)
+            self.assertLessEqual(len(index.candidate_pairs()),
+                                 len(index.paths) * (len(index.paths) - 1) // 2)
+
+    def test_short_texts(self):
+        """
+        verifies that texts with fewer shingles than bins get full signatures,
+        equal for the same text and different for another text
+        """
+
+        hasher = near_duplicates.MinHasher(64, 2)
+        with TemporaryDirectory() as temp_dir:
+            for name, content in (('a', 'one two three four'), ('b', 'One two\nthree four'),
+                                  ('c', 'five six seven eight')):
+                create_file_with_content(os.path.join(temp_dir, name), content)
+            signatures = [hasher.signature(os.path.join(temp_dir, name)) for name in 'abc']
+            self.assertEqual(len(signatures[0]), 64)
+            self.assertEqual(near_duplicates.estimate_similarity(signatures[0], signatures[1]), 1.0)
+            self.assertLess(near_duplicates.estimate_similarity(signatures[0], signatures[2]), 0.2)
+
+    def test_lsh_parameters(self):
+        """
+        verifies that a higher threshold gives longer bands, and that a wrong threshold is rejected
+        """
+
+        bands, rows = near_duplicates.lsh_parameters(0.5, 128)
+        self.assertEqual(bands * rows, 128)
+        self.assertLess(rows, near_duplicates.lsh_parameters(0.9, 128)[1])
+        with self.assertRaises(ValueError):
+            near_duplicates.lsh_parameters(0)
+
+
+if __name__ == '__main__':
+    unittest.main()
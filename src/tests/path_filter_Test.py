@@ -0,0 +1,77 @@
+from tempfile import TemporaryDirectory
+import os
+import unittest
+
+from supertool import file_table, path_filter, similar_files_finder
+from helpers import create_file_with_content
+
+
+class PathFilterTestsCase(unittest.TestCase):
+    """TestCase for testing filters of the walk and multiple roots"""
+
+    def test_patterns(self):
+        """
+        verifies the matching of globs by name, globs by path and regular expressions
+        """
+
+        files_filter = path_filter.PathFilter(include=['*.txt', 're:/docs/'],
+                                              exclude=['.git', '*/build/*'])
+        self.assertFalse(files_filter.allows_directory('/repo/.git', '.git'))
+        self.assertTrue(files_filter.allows_directory('/repo/src', 'src'))
+        self.assertTrue(files_filter.allows_file('/repo/a.txt', 'a.txt'))
+        self.assertTrue(files_filter.allows_file('/repo/docs/a.pdf', 'a.pdf'))
+        self.assertFalse(files_filter.allows_file('/repo/a.pdf', 'a.pdf'))
+        self.assertFalse(files_filter.allows_file('/repo/build/a.txt', 'a.txt'))
+        with self.assertRaises(ValueError):
+            path_filter.PathFilter(exclude=['re:('])
+        with self.assertRaises(ValueError):
+            path_filter.PathFilter(min_size=10, max_size=5)
+
+    def test_filtered_search(self):
+        """
+        verifies that excluded directories, excluded sizes and not included files
+        are not found, in all the walks
+        """
+
+        with TemporaryDirectory() as temp_dir:
+            for name in ('a.bin', 'b.bin', 'c.tmp', os.path.join('.git', 'd.bin'),
+                         os.path.join('node_modules', 'e.bin')):
+                create_file_with_content(os.path.join(temp_dir, name), 'same')
+            create_file_with_content(os.path.join(temp_dir, 'empty1'), '')
+            create_file_with_content(os.path.join(temp_dir, 'empty2'), '')
+            files_filter = path_filter.PathFilter(exclude=['.git', 'node_modules', '*.tmp'],
+                                                  min_size=1)
+            expected = [os.path.join(temp_dir, 'a.bin'), os.path.join(temp_dir, 'b.bin')]
+            for options in ({}, {'compact': True}, {'pipeline': True}, {'memory_budget': 1024}):
+                duplicates = similar_files_finder.check_for_duplicates(temp_dir,
+                                                                       path_filter=files_filter,
+                                                                       **options)
+                self.assertEqual([sorted(files) for files in duplicates.values()], [expected])
+
+            table = file_table.FileTable.from_tree(temp_dir, path_filter=path_filter.PathFilter(
+                include=['*.tmp']))
+            self.assertEqual(len(table), 1)
+
+    def test_multiple_roots(self):
+        """
+        verifies that duplicates are found across roots,
+        and that nested roots do not find files twice
+        """
+
+        with TemporaryDirectory() as first_dir, TemporaryDirectory() as second_dir:
+            create_file_with_content(os.path.join(first_dir, 'sub', 'a'), 'same')
+            create_file_with_content(os.path.join(second_dir, 'b'), 'same')
+            self.assertEqual(similar_files_finder.as_roots([first_dir, os.path.join(first_dir, 'sub'),
+                                                            second_dir, first_dir]),
+                             [first_dir, second_dir])
+            duplicates = similar_files_finder.check_for_duplicates(
+                [os.path.join(first_dir, 'sub'), second_dir, first_dir])
+            self.assertEqual([sorted(files) for files in duplicates.values()],
+                             [sorted([os.path.join(first_dir, 'sub', 'a'),
+                                      os.path.join(second_dir, 'b')])])
+            with self.assertRaises(ValueError):
+                similar_files_finder.check_for_duplicates([first_dir, os.path.join(first_dir, 'no')])
+
+
+if __name__ == '__main__':
+    unittest.main()
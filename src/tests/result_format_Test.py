@@ -0,0 +1,82 @@
+from tempfile import TemporaryDirectory
+import io
+import json
+import os
+import unittest
+
+from supertool import result_format, similar_files_finder
+from helpers import create_file_with_content
+
+
+class ResultFormatTestsCase(unittest.TestCase):
+    """TestCase for testing the result files of the duplicates search"""
+
+    def test_binary_report(self):
+        """
+        verifies that a binary report gives back the groups, and the raw paths without copying
+        """
+
+        duplicates = {'aa': ['/x/1', '/x/2'], 'bb': ['/y/é', '/y/' + os.fsdecode(b'\xff'), '/y/3']}
+        with TemporaryDirectory() as temp_dir:
+            report_path = os.path.join(temp_dir, 'report.bin')
+            self.assertEqual(result_format.write_binary_report(iter(duplicates.items()), report_path), 2)
+            with result_format.DuplicateReport(report_path) as report:
+                self.assertEqual(len(report), 2)
+                self.assertEqual(dict(report), duplicates)
+                self.assertEqual(report.key(1), 'bb')
+                raw_path = report.raw_path(3)
+                self.assertIsInstance(raw_path, memoryview)
+                self.assertEqual(raw_path.tobytes(), b'/y/\xff')
+                raw_path.release()
+                with self.assertRaises(IndexError):
+                    report.key(2)
+
+    def test_wrong_report(self):
+        """
+        verifies that a file of another format is rejected
+        """
+
+        with TemporaryDirectory() as temp_dir:
+            report_path = os.path.join(temp_dir, 'report.bin')
+            create_file_with_content(report_path, 'not a report, but long enough for a header')
+            with self.assertRaises(ValueError):
+                result_format.DuplicateReport(report_path)
+            create_file_with_content(report_path, '')
+            with self.assertRaises(ValueError):
+                result_format.DuplicateReport(report_path)
+
+    def test_failed_search_keeps_report(self):
+        """
+        verifies that a search that fails before its first group
+        leaves the previous report intact
+        """
+
+        with TemporaryDirectory() as temp_dir:
+            report_path = os.path.join(temp_dir, 'report.bin')
+            result_format.write_binary_report({'aa': ['/x/1', '/x/2']}, report_path)
+            with self.assertRaises(ValueError):
+                result_format.write_binary_report(
+                    similar_files_finder.iter_duplicates(temp_dir, algorithm='unknown'), report_path)
+            with result_format.DuplicateReport(report_path) as report:
+                self.assertEqual(dict(report), {'aa': ['/x/1', '/x/2']})
+            self.assertEqual(os.listdir(temp_dir), ['report.bin'])
+
+    def test_json_lines(self):
+        """
+        verifies that every group of the search is written as a line of JSON
+        """
+
+        with TemporaryDirectory() as temp_dir:
+            for name in ('a', 'b'):
+                create_file_with_content(os.path.join(temp_dir, name), 'same')
+            output = io.StringIO()
+            count = result_format.write_json_lines(similar_files_finder.iter_duplicates(temp_dir),
+                                                   output)
+            lines = output.getvalue().splitlines()
+            self.assertEqual(count, 1)
+            self.assertEqual(sorted(json.loads(lines[0])['paths']),
+                             [os.path.join(temp_dir, 'a'), os.path.join(temp_dir, 'b')])
+
+
+if __name__ == '__main__':
+    unittest.main()
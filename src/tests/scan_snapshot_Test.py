@@ -0,0 +1,139 @@
+from tempfile import TemporaryDirectory
+from unittest import mock
+import os
+import unittest
+
+from supertool import scan_snapshot, similar_files_finder
+from helpers import create_file_with_content
+
+
+def age_tree(path: str) -> None:
+    """
+    Moves the modification times of the directories of the tree an hour back,
+    so that they are older than the start of the next scan
+
+    :param path: path to the directory
+    """
+
+    for directory, _, _ in os.walk(path):
+        stat = os.stat(directory)
+        os.utime(directory, ns=(stat.st_atime_ns, stat.st_mtime_ns - 3600 * 10 ** 9))
+
+
+class ScanSnapshotTestsCase(unittest.TestCase):
+    """TestCase for testing incremental rescans with scan snapshots"""
+
+    def test_unchanged_directories_are_reused(self):
+        """
+        verifies that only the directory with a new file is listed again
+        """
+
+        with TemporaryDirectory() as temp_dir, TemporaryDirectory() as snapshot_dir:
+            for name in ('a', 'b'):
+                os.mkdir(os.path.join(temp_dir, name))
+                create_file_with_content(os.path.join(temp_dir, name, 'file'), name)
+            age_tree(temp_dir)
+            snapshot_file = os.path.join(snapshot_dir, 'snapshot.gz')
+            first = scan_snapshot.ScanSnapshot.load(snapshot_file)
+            records = list(first.scan(temp_dir))
+            first.save(snapshot_file)
+            self.assertEqual(first.listed_directories, 3)
+
+            create_file_with_content(os.path.join(temp_dir, 'b', 'new'), 'new')
+            second = scan_snapshot.ScanSnapshot.load(snapshot_file)
+            new_records = list(second.scan(temp_dir))
+            self.assertEqual(second.reused_directories, 2)
+            self.assertEqual(second.listed_directories, 1)
+            self.assertEqual(sorted(record[3] for record in new_records),
+                             sorted([record[3] for record in records]
+                                    + [os.path.join(temp_dir, 'b', 'new')]))
+
+    def test_symlinked_root_is_listed_again(self):
+        """
+        verifies that a change in a root given as a symbolic link is noticed
+        """
+
+        with TemporaryDirectory() as temp_dir, TemporaryDirectory() as snapshot_dir:
+            tree = os.path.join(temp_dir, 'tree')
+            os.mkdir(tree)
+            create_file_with_content(os.path.join(tree, 'a'), 'same')
+            root = os.path.join(snapshot_dir, 'root')
+            os.symlink(tree, root)
+            age_tree(tree)
+            os.utime(root, ns=(0, 0), follow_symlinks=False)
+            snapshot_file = os.path.join(snapshot_dir, 'snapshot.gz')
+            snapshot = scan_snapshot.ScanSnapshot.load(snapshot_file)
+            self.assertEqual(similar_files_finder.check_for_duplicates(root, snapshot=snapshot), {})
+            snapshot.save(snapshot_file)
+
+            create_file_with_content(os.path.join(tree, 'b'), 'same')
+            snapshot = scan_snapshot.ScanSnapshot.load(snapshot_file)
+            duplicates = similar_files_finder.check_for_duplicates(root, snapshot=snapshot)
+            self.assertEqual([sorted(files) for files in duplicates.values()],
+                             [[os.path.join(root, 'a'), os.path.join(root, 'b')]])
+
+    def test_rescan_hashes_only_changed_files(self):
+        """
+        verifies that the hashes of unchanged files are taken from the snapshot,
+        and that the duplicates are updated
+        """
+
+        with TemporaryDirectory() as temp_dir, TemporaryDirectory() as snapshot_dir:
+            for name in ('a', 'b', 'c'):
+                create_file_with_content(os.path.join(temp_dir, name), 'same' * 1000)
+            create_file_with_content(os.path.join(temp_dir, 'd'), 'diff' * 1000)
+            age_tree(temp_dir)
+            snapshot_file = os.path.join(snapshot_dir, 'snapshot.gz')
+            snapshot = scan_snapshot.ScanSnapshot.load(snapshot_file)
+            duplicates = similar_files_finder.check_for_duplicates(temp_dir, snapshot=snapshot)
+            snapshot.save(snapshot_file)
+            self.assertEqual([len(files) for files in duplicates.values()], [3])
+
+            create_file_with_content(os.path.join(temp_dir, 'd'), 'same' * 1000)
+            stats = similar_files_finder.create_statistics()
+            snapshot = scan_snapshot.ScanSnapshot.load(snapshot_file)
+            with mock.patch.object(similar_files_finder, 'get_hash',
+                                   wraps=similar_files_finder.get_hash) as get_hash:
+                duplicates = similar_files_finder.check_for_duplicates(temp_dir, stats=stats,
+                                                                       snapshot=snapshot)
+            self.assertEqual([len(files) for files in duplicates.values()], [4])
+            self.assertEqual(stats['full']['cached_files'], 3)
+            get_hash.assert_called_once()
+            self.assertEqual(get_hash.call_args[0][0], os.path.join(temp_dir, 'd'))
+
+    def test_stat_files_notices_rewritten_files(self):
+        """
+        verifies that a file rewritten in place is noticed only with stat_files
+        """
+
+        with TemporaryDirectory() as temp_dir, TemporaryDirectory() as snapshot_dir:
+            file_path = os.path.join(temp_dir, 'file')
+            create_file_with_content(file_path, 'short')
+            age_tree(temp_dir)
+            snapshot_file = os.path.join(snapshot_dir, 'snapshot.gz')
+            first = scan_snapshot.ScanSnapshot.load(snapshot_file)
+            list(first.scan(temp_dir))
+            first.save(snapshot_file)
+            create_file_with_content(file_path, 'much longer')
+
+            trusting = scan_snapshot.ScanSnapshot.load(snapshot_file)
+            self.assertEqual([record[0] for record in trusting.scan(temp_dir)], [5])
+            checking = scan_snapshot.ScanSnapshot.load(snapshot_file, stat_files=True)
+            self.assertEqual([record[0] for record in checking.scan(temp_dir)], [11])
+
+    def test_wrong_options(self):
+        """
+        verifies that the snapshot can not be used with the hash cache or the pipeline
+        """
+
+        with TemporaryDirectory() as temp_dir:
+            with self.assertRaises(ValueError):
+                similar_files_finder.check_for_duplicates(temp_dir, snapshot=scan_snapshot.ScanSnapshot(),
+                                                          pipeline=True)
+            create_file_with_content(os.path.join(temp_dir, 'snapshot.gz'), 'garbage')
+            with self.assertRaises(ValueError):
+                scan_snapshot.ScanSnapshot.load(os.path.join(temp_dir, 'snapshot.gz'))
+
+
+if __name__ == '__main__':
+    unittest.main()
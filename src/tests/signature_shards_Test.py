@@ -0,0 +1,68 @@
+from tempfile import TemporaryDirectory
+import gzip
+import os
+import unittest
+
+from supertool import signature_shards
+from helpers import create_file_with_content
+
+
+class SignatureShardsTestsCase(unittest.TestCase):
+    """TestCase for testing the search of duplicates across nodes"""
+
+    def test_cross_node_duplicates(self):
+        """
+        verifies that only files copied to another node are reported,
+        unless duplicates within a node are asked for
+        """
+
+        with TemporaryDirectory() as first_node, TemporaryDirectory() as second_node, \
+                TemporaryDirectory() as shards_dir:
+            create_file_with_content(os.path.join(first_node, 'a'), 'shared')
+            create_file_with_content(os.path.join(first_node, 'b'), 'local')
+            create_file_with_content(os.path.join(first_node, 'c'), 'local')
+            create_file_with_content(os.path.join(second_node, 'd'), 'shared')
+            create_file_with_content(os.path.join(second_node, 'e'), 'SHARED')
+            first_shard = os.path.join(shards_dir, 'first.shard')
+            second_shard = os.path.join(shards_dir, 'second.shard')
+            self.assertEqual(signature_shards.write_shard(first_node, first_shard, 'first'), 3)
+            self.assertEqual(signature_shards.write_shard(second_node, second_shard, 'second',
+                                                          workers=2), 2)
+
+            duplicates = list(signature_shards.merge_shards([second_shard, first_shard]))
+            self.assertEqual([paths for _, paths in duplicates],
+                             [[f"first:{os.path.join(first_node, 'a')}",
+                               f"second:{os.path.join(second_node, 'd')}"]])
+            duplicates = list(signature_shards.merge_shards([first_shard, second_shard],
+                                                            cross_node_only=False))
+            self.assertEqual(len(duplicates), 2)
+
+    def test_wrong_shards(self):
+        """
+        verifies that shards of the same node, of other hash settings,
+        or of another format are rejected
+        """
+
+        with TemporaryDirectory() as node_dir, TemporaryDirectory() as shards_dir:
+            create_file_with_content(os.path.join(node_dir, 'a'), 'content')
+            md5_shard = os.path.join(shards_dir, 'md5.shard')
+            sha1_shard = os.path.join(shards_dir, 'sha1.shard')
+            signature_shards.write_shard(node_dir, md5_shard, 'first')
+            signature_shards.write_shard(node_dir, sha1_shard, 'second', algorithm='sha1')
+            with self.assertRaises(ValueError):
+                list(signature_shards.merge_shards([md5_shard, md5_shard]))
+            with self.assertRaises(ValueError):
+                list(signature_shards.merge_shards([md5_shard, sha1_shard]))
+
+            wrong_shard = os.path.join(shards_dir, 'wrong.shard')
+            with gzip.open(wrong_shard, 'wt') as shard_file:
+                shard_file.write('not a shard\n')
+            with self.assertRaises(ValueError):
+                list(signature_shards.merge_shards([md5_shard, wrong_shard]))
+            create_file_with_content(wrong_shard, 'not gzipped')
+            with self.assertRaises(ValueError):
+                list(signature_shards.merge_shards([md5_shard, wrong_shard]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,7 +5,8 @@ import random
 import unittest
 from unittest.mock import patch
 
-from supertool import similar_files_finder
+from supertool import hash_cache, similar_files_finder
+from helpers import create_file_with_content
 
 
 class HashTableTestsCase(unittest.TestCase):
@@ -47,19 +48,6 @@ class HashTableTestsCase(unittest.TestCase):
                              'Incorrect appended hash-table')
 
 
-def create_file_with_content(file_path: str, content: str) -> None:
-    """
-    Creates a file with the given name
-    and fills it with content
-
-    :param file_path: path to the file being created
-    :param content: content that will be filled with the file
-    """
-
-    with open(file_path, 'w') as file:
-        file.write(content)
-
-
 class HashReadingTestsCase(unittest.TestCase):
     """TestCase for testing the get_hash function"""
 
@@ -242,3 +230,461 @@ class SimilarFilesTestsCase(unittest.TestCase):
                 output += file_path1 + '\n'
                 output += file_path2
             self.assertEqual(fake_out.getvalue().strip(), output)
+
+
+class PartialHashTestsCase(unittest.TestCase):
+    """TestCase for testing the partial-content tier of the search"""
+
+    def test_get_partial_hash_ignores_middle(self):
+        """
+        verifies that files which differ only in the middle
+        have the same partial hash, unless the middle is sampled
+        """
+
+        with TemporaryDirectory() as temp_dir:
+            file_path1 = os.path.join(temp_dir, '1')
+            file_path2 = os.path.join(temp_dir, '2')
+            create_file_with_content(file_path1, 'a' * 100 + 'b' + 'a' * 100)
+            create_file_with_content(file_path2, 'a' * 100 + 'c' + 'a' * 100)
+
+            self.assertEqual(similar_files_finder.get_partial_hash(file_path1, 10),
+                             similar_files_finder.get_partial_hash(file_path2, 10))
+            self.assertNotEqual(similar_files_finder.get_partial_hash(file_path1, 10, True),
+                                similar_files_finder.get_partial_hash(file_path2, 10, True))
+
+    def test_partial_tier_eliminates_different_heads(self):
+        """
+        verifies that files of the same size with different heads
+        are eliminated before the full hashing
+        """
+
+        with TemporaryDirectory() as temp_dir:
+            create_file_with_content(os.path.join(temp_dir, 'unique1'), 'x' + 'a' * 100)
+            create_file_with_content(os.path.join(temp_dir, 'unique2'), 'y' + 'a' * 100)
+            create_file_with_content(os.path.join(temp_dir, 'copy1'), 'z' + 'a' * 100)
+            create_file_with_content(os.path.join(temp_dir, 'copy2'), 'z' + 'a' * 100)
+            create_file_with_content(os.path.join(temp_dir, 'other'), 'short')
+
+            stats = similar_files_finder.create_statistics()
+            result = similar_files_finder.check_for_duplicates(temp_dir, sample_size=10,
+                                                               stats=stats)
+
+            self.assertEqual([sorted(os.path.basename(path) for path in paths)
+                              for paths in result.values()], [['copy1', 'copy2']])
+            self.assertEqual(stats['size']['files'], 5)
+            self.assertEqual(stats['size']['eliminated_files'], 1)
+            self.assertEqual(stats['partial']['eliminated_files'], 2)
+            self.assertEqual(stats['partial']['eliminated_bytes'], 202)
+            self.assertEqual(stats['lockstep']['files'], 2)
+            self.assertEqual(stats['lockstep']['bytes_read'], 202)
+            self.assertEqual(stats['full']['files'], 0)
+
+
+class ParallelHashingTestsCase(unittest.TestCase):
+    """TestCase for testing the parallel hashing of files"""
+
+    def _test_pool(self, pool: str) -> None:
+        """
+        verifies that the pool finds the same duplicates
+        as the serial search
+
+        :param pool: kind of workers
+        :return: None
+        """
+
+        with TemporaryDirectory() as temp_dir:
+            SimilarFilesTestsCase.create_non_unique_files(temp_dir)
+            SimilarFilesTestsCase.create_unique_files(temp_dir)
+            self.assertDictEqual(similar_files_finder.check_for_duplicates(temp_dir, workers=4,
+                                                                           pool=pool),
+                                 similar_files_finder.check_for_duplicates(temp_dir))
+
+    def test_thread_pool(self):
+        """verifies the search with a thread pool"""
+        self._test_pool('thread')
+
+    def test_process_pool(self):
+        """verifies the search with a process pool"""
+        self._test_pool('process')
+
+    def test_unknown_pool(self):
+        """verifies reaction on unknown kind of workers"""
+        with self.assertRaises(ValueError):
+            similar_files_finder.create_executor(2, 'fiber')
+
+
+class CachedHashingTestsCase(unittest.TestCase):
+    """TestCase for testing the search with the persistent hash cache"""
+
+    def test_rescan_uses_cache(self):
+        """
+        verifies that the second search takes all hashes from the cache
+        and finds the same duplicates
+        """
+
+        with TemporaryDirectory() as temp_dir, TemporaryDirectory() as cache_dir:
+            SimilarFilesTestsCase.create_non_unique_files(temp_dir)
+            with hash_cache.HashCache(cache_dir) as cache:
+                expected = similar_files_finder.check_for_duplicates(temp_dir, cache=cache)
+            stats = similar_files_finder.create_statistics()
+            with hash_cache.HashCache(cache_dir) as cache:
+                result = similar_files_finder.check_for_duplicates(temp_dir, cache=cache,
+                                                                   stats=stats)
+                self.assertEqual(cache.misses, 0)
+            self.assertDictEqual(result, expected)
+            self.assertEqual(stats['full']['bytes_read'], 0)
+            self.assertEqual(stats['full']['cached_files'], stats['full']['files'])
+
+
+class ScanFilesTestsCase(unittest.TestCase):
+    """TestCase for testing the scan_files function"""
+
+    def test_scan_files_skips_links_and_dirs(self):
+        """
+        verifies that only regular files of the nested directories are yielded
+        """
+
+        with TemporaryDirectory() as temp_dir:
+            subdir = os.path.join(temp_dir, 'a', 'b')
+            os.makedirs(subdir)
+            file_path1 = os.path.join(temp_dir, '1')
+            file_path2 = os.path.join(subdir, '2')
+            create_file_with_content(file_path1, 'hello')
+            create_file_with_content(file_path2, 'hello')
+            os.symlink(file_path1, os.path.join(temp_dir, 'link'))
+            os.symlink(subdir, os.path.join(temp_dir, 'dir_link'))
+
+            entries = list(similar_files_finder.scan_files(temp_dir))
+            self.assertEqual(sorted(entry.path for entry in entries),
+                             sorted([file_path1, file_path2]))
+            self.assertEqual(similar_files_finder.check_for_duplicates_by_size(temp_dir),
+                             ([entry.path for entry in entries],))
+
+
+class HardlinksTestsCase(unittest.TestCase):
+    """TestCase for testing the handling of hard links"""
+
+    def test_hardlinks_are_not_duplicates(self):
+        """
+        verifies that hard links to the same inode are reported
+        as hard links, but not as duplicates
+        """
+
+        with TemporaryDirectory() as temp_dir:
+            file_path = os.path.join(temp_dir, '1')
+            link_path = os.path.join(temp_dir, '2')
+            create_file_with_content(file_path, 'hello')
+            os.link(file_path, link_path)
+
+            hardlinks = {}
+            self.assertDictEqual(similar_files_finder.check_for_duplicates(temp_dir,
+                                                                           hardlinks=hardlinks),
+                                 {})
+            self.assertEqual([sorted(links) for links in hardlinks.values()],
+                             [[file_path, link_path]])
+
+    def test_hardlinks_are_hashed_once(self):
+        """
+        verifies that an inode with hard links is hashed once,
+        and all its paths are reported if it has a copy
+        """
+
+        with TemporaryDirectory() as temp_dir:
+            file_path = os.path.join(temp_dir, '1')
+            link_path = os.path.join(temp_dir, '2')
+            copy_path = os.path.join(temp_dir, '3')
+            create_file_with_content(file_path, 'hello')
+            create_file_with_content(copy_path, 'hello')
+            os.link(file_path, link_path)
+
+            stats = similar_files_finder.create_statistics()
+            result = similar_files_finder.check_for_duplicates(temp_dir, stats=stats)
+            self.assertEqual([sorted(paths) for paths in result.values()],
+                             [[file_path, link_path, copy_path]])
+            self.assertEqual(stats['size']['files'], 3)
+            self.assertEqual(stats['lockstep']['files'], 2)
+
+
+class BufferedHashingTestsCase(unittest.TestCase):
+    """TestCase for testing the reading paths of get_hash"""
+
+    def test_reading_paths_give_same_hash(self):
+        """
+        verifies that small buffers and memory mapping
+        give the same hash as the default reading
+        """
+
+        with TemporaryDirectory() as temp_dir:
+            file_path = os.path.join(temp_dir, 'tmp_file')
+            create_file_with_content(file_path, 'text' * 1000)
+            expected_hash = similar_files_finder.get_hash(file_path)
+
+            self.assertEqual(similar_files_finder.get_hash(file_path, block_size=7),
+                             expected_hash)
+            self.assertEqual(similar_files_finder.get_hash(file_path, mmap_threshold=1),
+                             expected_hash)
+            self.assertEqual(similar_files_finder.get_hash(file_path, mmap_threshold=None),
+                             expected_hash)
+
+    def test_buffer_reader(self):
+        """
+        verifies that buffer_reader yields the whole content
+        """
+
+        with TemporaryDirectory() as temp_dir:
+            file_path = os.path.join(temp_dir, 'tmp_file')
+            create_file_with_content(file_path, 'abcdefghij')
+            with open(file_path, 'rb', buffering=0) as file_object:
+                blocks = [bytes(block) for block in similar_files_finder.buffer_reader(file_object, 4)]
+            self.assertEqual(blocks, [b'abcd', b'efgh', b'ij'])
+
+
+class VerificationTestsCase(unittest.TestCase):
+    """TestCase for testing hash algorithms and the byte-for-byte verification"""
+
+    def test_algorithms_find_same_duplicates(self):
+        """
+        verifies that every algorithm finds the same groups of duplicates
+        """
+
+        with TemporaryDirectory() as temp_dir:
+            SimilarFilesTestsCase.create_non_unique_files(temp_dir)
+            SimilarFilesTestsCase.create_unique_files(temp_dir)
+            expected = sorted(sorted(paths) for paths in
+                              similar_files_finder.check_for_duplicates(temp_dir).values())
+            for algorithm in similar_files_finder.HASH_ALGORITHMS:
+                result = similar_files_finder.check_for_duplicates(temp_dir, algorithm=algorithm,
+                                                                   verify=True)
+                self.assertEqual(sorted(sorted(paths) for paths in result.values()),
+                                 expected, algorithm)
+
+    def test_unknown_algorithm(self):
+        """verifies reaction on unknown hash algorithm"""
+        with TemporaryDirectory() as temp_dir:
+            with self.assertRaises(ValueError):
+                similar_files_finder.check_for_duplicates(temp_dir, algorithm='crc')
+
+    def test_compare_files(self):
+        """
+        verifies that compare_files splits files into groups of identical files
+        """
+
+        with TemporaryDirectory() as temp_dir:
+            contents = ['aaaa', 'aaab', 'aaaa', 'baaa', 'aaab', 'cccc']
+            file_paths = [os.path.join(temp_dir, str(i)) for i in range(len(contents))]
+            for file_path, content in zip(file_paths, contents):
+                create_file_with_content(file_path, content)
+
+            groups = similar_files_finder.compare_files(file_paths, block_size=2)
+            self.assertEqual(sorted(groups), [[file_paths[0], file_paths[2]],
+                                              [file_paths[1], file_paths[4]]])
+
+    def test_compare_files_in_batches(self):
+        """
+        verifies that big groups are compared in batches
+        """
+
+        with TemporaryDirectory() as temp_dir:
+            file_paths = [os.path.join(temp_dir, str(i)) for i in range(7)]
+            for index, file_path in enumerate(file_paths):
+                create_file_with_content(file_path, 'same' if index % 3 else 'diff')
+
+            with patch.object(similar_files_finder, 'MAX_LOCKSTEP_FILES', 3):
+                groups = similar_files_finder.compare_files(file_paths)
+            self.assertEqual(sorted(map(sorted, groups)),
+                             [[file_paths[0], file_paths[3], file_paths[6]],
+                              [file_paths[1], file_paths[2], file_paths[4], file_paths[5]]])
+
+
+class StreamingTestsCase(unittest.TestCase):
+    """TestCase for testing the iter_duplicates generator"""
+
+    def test_groups_are_yielded_before_the_end(self):
+        """
+        verifies that the first group is yielded
+        before all the groups are hashed
+        """
+
+        with TemporaryDirectory() as temp_dir:
+            non_unique_table = SimilarFilesTestsCase.create_non_unique_files(temp_dir)
+            for size in range(3):
+                for copy in range(2):
+                    create_file_with_content(os.path.join(temp_dir, f'size{size}_{copy}'),
+                                             'x' * (100 + size))
+
+            with patch.object(similar_files_finder, 'STREAM_BATCH_FILES', 1), \
+                    patch.object(similar_files_finder, 'get_hash',
+                                 wraps=similar_files_finder.get_hash) as get_hash:
+                duplicates = similar_files_finder.iter_duplicates(temp_dir, partial_hash=False)
+                next(duplicates)
+                self.assertLess(get_hash.call_count,
+                                sum(map(len, non_unique_table.values())) + 6)
+                self.assertEqual(len(list(duplicates)), len(non_unique_table) + 2)
+
+    def test_printer_accepts_iterator(self):
+        """
+        verifies that duplicates_printer displays groups from an iterator
+        """
+
+        with patch('sys.stdout', new=StringIO()) as fake_out:
+            similar_files_finder.duplicates_printer(iter([('hash', ['1', '2'])]))
+        self.assertEqual(fake_out.getvalue().strip(),
+                         'Duplicates found:\n---\nWith hash hash\n1\n2')
+
+
+class LockstepTestsCase(unittest.TestCase):
+    """TestCase for testing the lockstep comparison of small groups"""
+
+    def test_hash_files_in_lockstep(self):
+        """
+        verifies that groups of identical files get the hash of their content,
+        and reading stops at the first difference
+        """
+
+        with TemporaryDirectory() as temp_dir:
+            contents = ['ab' + 'x' * 100, 'ab' + 'x' * 100, 'ac' + 'x' * 100, 'b' + 'x' * 101]
+            file_paths = [os.path.join(temp_dir, str(i)) for i in range(len(contents))]
+            for file_path, content in zip(file_paths, contents):
+                create_file_with_content(file_path, content)
+
+            hashes, bytes_read = similar_files_finder.hash_files_in_lockstep(file_paths,
+                                                                             block_size=2)
+            self.assertDictEqual(hashes, {similar_files_finder.get_hash(file_paths[0]):
+                                          file_paths[:2]})
+            self.assertEqual(bytes_read, 4 * 2 + 2 * 100)
+
+    def test_small_groups_are_not_hashed(self):
+        """
+        verifies that groups of different files of the same size
+        are resolved without hashing
+        """
+
+        with TemporaryDirectory() as temp_dir:
+            create_file_with_content(os.path.join(temp_dir, '1'), 'a' * 1000)
+            create_file_with_content(os.path.join(temp_dir, '2'), 'b' * 1000)
+
+            stats = similar_files_finder.create_statistics()
+            self.assertDictEqual(similar_files_finder.check_for_duplicates(temp_dir, stats=stats), {})
+            self.assertEqual(stats['lockstep']['eliminated_files'], 2)
+            self.assertEqual(stats['full']['files'], 0)
+
+    def test_partial_tier_runs_before_lockstep(self):
+        """
+        verifies that a pair of large files that differ only at the tail
+        is resolved by the partial tier, without reading the files entirely
+        """
+
+        with TemporaryDirectory() as temp_dir:
+            create_file_with_content(os.path.join(temp_dir, '1'), 'x' * 1000000 + 'a')
+            create_file_with_content(os.path.join(temp_dir, '2'), 'x' * 1000000 + 'b')
+
+            stats = similar_files_finder.create_statistics()
+            self.assertDictEqual(similar_files_finder.check_for_duplicates(temp_dir, stats=stats), {})
+            self.assertEqual(sum(counters['bytes_read'] for counters in stats.values()),
+                             2 * 2 * similar_files_finder.PARTIAL_SAMPLE_SIZE)
+            self.assertEqual(stats['lockstep']['files'], 0)
+
+
+class ProgressTestsCase(unittest.TestCase):
+    """TestCase for testing progress events of a scan"""
+
+    def test_progress_events(self):
+        """
+        verifies that the observer receives the events of each phase
+        with final counters of the scan
+        """
+
+        with TemporaryDirectory() as temp_dir:
+            non_unique_table = SimilarFilesTestsCase.create_non_unique_files(temp_dir)
+            events = []
+            with patch.object(similar_files_finder, 'PROGRESS_INTERVAL', 0):
+                similar_files_finder.check_for_duplicates(temp_dir,
+                                                          observer=lambda *event: events.append(event))
+
+            names = [name for name, _ in events]
+            files = sum(map(len, non_unique_table.values()))
+            self.assertEqual(names[-1], 'done')
+            self.assertIn('hash', names)
+            self.assertEqual(dict(events)['walk'], {'directories': 1, 'files': files})
+            self.assertEqual(dict(events)['candidates']['files'], files)
+            self.assertEqual(dict(events)['candidates']['bytes'],
+                             sum(os.path.getsize(path) for paths in non_unique_table.values()
+                                 for path in paths))
+            self.assertEqual(events[-1][1]['files'], files)
+
+
+class PipelineTestsCase(unittest.TestCase):
+    """TestCase for testing the concurrent hashing pipeline"""
+
+    def test_pipeline_finds_same_duplicates(self):
+        """
+        verifies that the pipeline finds the same duplicates
+        and hard links as the staged search
+        """
+
+        with TemporaryDirectory() as temp_dir:
+            SimilarFilesTestsCase.create_non_unique_files(temp_dir)
+            SimilarFilesTestsCase.create_unique_files(temp_dir)
+            for index in range(3):
+                create_file_with_content(os.path.join(temp_dir, f'big{index}'),
+                                         'x' * 100 + str(index % 2) + 'x' * 100)
+            os.link(os.path.join(temp_dir, 'big0'), os.path.join(temp_dir, 'big_link'))
+
+            def normalize(duplicates):
+                return sorted(sorted(paths) for paths in duplicates.values())
+
+            hardlinks, pipeline_hardlinks = {}, {}
+            expected = similar_files_finder.check_for_duplicates(temp_dir, sample_size=60,
+                                                                 hardlinks=hardlinks)
+            for workers in (1, 4):
+                stats = similar_files_finder.create_statistics()
+                with patch.object(similar_files_finder, 'PIPELINE_QUEUE_SIZE', 2):
+                    result = similar_files_finder.check_for_duplicates(temp_dir, sample_size=60,
+                                                                       workers=workers, pipeline=True,
+                                                                       hardlinks=pipeline_hardlinks,
+                                                                       stats=stats)
+                self.assertEqual(normalize(result), normalize(expected))
+                self.assertEqual(normalize(pipeline_hardlinks), normalize(hardlinks))
+                self.assertEqual(stats['partial']['files'], 3)
+
+    def test_pipeline_hardlinks_of_unique_size(self):
+        """
+        verifies that the pipeline records the hard links of a file of a unique size
+        """
+
+        with TemporaryDirectory() as temp_dir:
+            create_file_with_content(os.path.join(temp_dir, 'a'), 'unique size')
+            os.link(os.path.join(temp_dir, 'a'), os.path.join(temp_dir, 'a_link'))
+            hardlinks, pipeline_hardlinks = {}, {}
+            similar_files_finder.check_for_duplicates(temp_dir, hardlinks=hardlinks)
+            self.assertDictEqual(similar_files_finder.check_for_duplicates(
+                                     temp_dir, pipeline=True, hardlinks=pipeline_hardlinks), {})
+            self.assertEqual(len(hardlinks), 1)
+            self.assertDictEqual(pipeline_hardlinks, hardlinks)
+
+    def test_pipeline_caches_stat_taken_before_hashing(self):
+        """
+        verifies that the pipeline stores a hash in the cache
+        with the stat that was taken before the file was hashed
+        """
+
+        with TemporaryDirectory() as temp_dir, TemporaryDirectory() as cache_dir:
+            for name in ('1', '2'):
+                create_file_with_content(os.path.join(temp_dir, name), 'same')
+            with hash_cache.HashCache(cache_dir) as cache:
+                with patch.object(cache, 'get', return_value=None) as get, \
+                        patch.object(cache, 'set') as set_hash:
+                    similar_files_finder.check_for_duplicates(temp_dir, pipeline=True, cache=cache)
+                self.assertEqual(sorted(call.args[2] for call in get.call_args_list),
+                                 sorted(call.args[3] for call in set_hash.call_args_list))
+                self.assertTrue(all(call.args[3] is not None for call in set_hash.call_args_list))
+
+    def test_pipeline_rejects_staged_options(self):
+        """
+        verifies that options of the staged search are not silently ignored by the pipeline
+        """
+
+        with TemporaryDirectory() as temp_dir:
+            for options in ({'compact': True}, {'memory_budget': 1024 * 1024}, {'io_order': 'inode'}):
+                with self.assertRaises(ValueError):
+                    similar_files_finder.check_for_duplicates(temp_dir, pipeline=True, **options)
@@ -0,0 +1,172 @@
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+import errno
+import os
+import time
+import unittest
+
+from supertool import path_filter, watcher
+from helpers import create_file_with_content
+
+
+class DuplicateIndexTestsCase(unittest.TestCase):
+    """TestCase for testing the live index of duplicates"""
+
+    def test_add_and_remove(self):
+        """
+        verifies that files are hashed only on a size collision,
+        and that removed files leave their groups
+        """
+
+        with TemporaryDirectory() as temp_dir:
+            paths = [os.path.join(temp_dir, name) for name in ('a', 'b', 'c')]
+            create_file_with_content(paths[0], 'same')
+            create_file_with_content(paths[1], 'same')
+            create_file_with_content(paths[2], 'diff')
+            index = watcher.DuplicateIndex()
+            self.assertEqual(index.add(paths[0]), [])
+            self.assertEqual(index.hashes, {})
+            [(_, group)] = index.add(paths[1])
+            self.assertEqual(group, sorted(paths[:2]))
+            self.assertEqual(index.add(paths[2]), [])
+            self.assertEqual(index.add(paths[1]), [])
+
+            os.remove(paths[1])
+            index.remove(paths[1])
+            self.assertEqual(index.duplicates(), {})
+            self.assertEqual(len(index), 2)
+
+    def test_reconcile(self):
+        """
+        verifies that reconciliation finds new and removed files, ignoring hard links
+        """
+
+        with TemporaryDirectory() as temp_dir:
+            create_file_with_content(os.path.join(temp_dir, 'a'), 'same')
+            os.link(os.path.join(temp_dir, 'a'), os.path.join(temp_dir, 'link'))
+            index = watcher.DuplicateIndex()
+            self.assertEqual(index.reconcile([temp_dir]), [])
+
+            os.mkdir(os.path.join(temp_dir, 'sub'))
+            create_file_with_content(os.path.join(temp_dir, 'sub', 'b'), 'same')
+            [(_, group)] = index.reconcile([temp_dir])
+            self.assertEqual(len(group), 3)
+
+            os.remove(os.path.join(temp_dir, 'sub', 'b'))
+            self.assertEqual(index.reconcile([temp_dir]), [])
+            self.assertEqual(index.duplicates(), {})
+
+    def test_reconcile_with_filter(self):
+        """
+        verifies that files rejected by the path filter are not indexed
+        """
+
+        with TemporaryDirectory() as temp_dir:
+            os.mkdir(os.path.join(temp_dir, '.git'))
+            create_file_with_content(os.path.join(temp_dir, 'a'), 'same')
+            create_file_with_content(os.path.join(temp_dir, '.git', 'b'), 'same')
+            create_file_with_content(os.path.join(temp_dir, 'c.tmp'), 'same')
+            index = watcher.DuplicateIndex(path_filter=path_filter.PathFilter(exclude=['.git', '*.tmp']))
+            self.assertEqual(index.reconcile([temp_dir]), [])
+            self.assertEqual(list(index.files), [os.path.join(temp_dir, 'a')])
+            self.assertEqual(index.add(os.path.join(temp_dir, 'c.tmp')), [])
+            self.assertEqual(len(index), 1)
+
+
+@unittest.skipUnless(watcher.inotify_available(), 'inotify is not available')
+class DuplicateWatcherTestsCase(unittest.TestCase):
+    """TestCase for testing the watch mode"""
+
+    def poll_until(self, duplicate_watcher: watcher.DuplicateWatcher, reported: list,
+                   count: int) -> None:
+        """
+        Polls the watcher until count groups are reported or a second passes
+        """
+
+        deadline = time.monotonic() + 1
+        while len(reported) < count and time.monotonic() < deadline:
+            duplicate_watcher.poll(0.05)
+
+    def test_new_duplicates_are_reported(self):
+        """
+        verifies that existing duplicates are reported on start,
+        and new ones as soon as files are written, also in new directories
+        """
+
+        with TemporaryDirectory() as temp_dir:
+            create_file_with_content(os.path.join(temp_dir, 'a'), 'first')
+            create_file_with_content(os.path.join(temp_dir, 'b'), 'first')
+            reported = []
+            with watcher.DuplicateWatcher([temp_dir], lambda key, paths: reported.append(paths),
+                                          reconcile_interval=3600) as duplicate_watcher:
+                self.assertEqual(len(reported), 1)
+
+                create_file_with_content(os.path.join(temp_dir, 'c'), 'first')
+                self.poll_until(duplicate_watcher, reported, 2)
+                self.assertEqual(len(reported[1]), 3)
+
+                os.mkdir(os.path.join(temp_dir, 'new'))
+                create_file_with_content(os.path.join(temp_dir, 'new', 'd'), 'second')
+                create_file_with_content(os.path.join(temp_dir, 'new', 'e'), 'second')
+                self.poll_until(duplicate_watcher, reported, 3)
+                self.assertEqual(reported[2], [os.path.join(temp_dir, 'new', 'd'),
+                                               os.path.join(temp_dir, 'new', 'e')])
+
+    def test_removed_directory(self):
+        """
+        verifies that files of a moved away directory leave the index
+        """
+
+        with TemporaryDirectory() as temp_dir, TemporaryDirectory() as other_dir:
+            os.mkdir(os.path.join(temp_dir, 'sub'))
+            create_file_with_content(os.path.join(temp_dir, 'sub', 'a'), 'same')
+            create_file_with_content(os.path.join(temp_dir, 'b'), 'same')
+            with watcher.DuplicateWatcher([temp_dir], lambda key, paths: None,
+                                          reconcile_interval=3600) as duplicate_watcher:
+                self.assertEqual(len(duplicate_watcher.index.duplicates()), 1)
+                os.rename(os.path.join(temp_dir, 'sub'), os.path.join(other_dir, 'sub'))
+                duplicate_watcher.poll(0.5)
+                self.assertEqual(duplicate_watcher.index.duplicates(), {})
+                self.assertEqual(len(duplicate_watcher.directories), 1)
+
+    def test_excluded_directory_is_not_watched(self):
+        """
+        verifies that excluded directories are not watched and their files are not reported
+        """
+
+        with TemporaryDirectory() as temp_dir:
+            create_file_with_content(os.path.join(temp_dir, 'a'), 'same')
+            reported = []
+            with watcher.DuplicateWatcher([temp_dir], lambda key, paths: reported.append(paths),
+                                          reconcile_interval=3600,
+                                          path_filter=path_filter.PathFilter(exclude=['.git'])
+                                          ) as duplicate_watcher:
+                os.mkdir(os.path.join(temp_dir, '.git'))
+                create_file_with_content(os.path.join(temp_dir, '.git', 'b'), 'same')
+                create_file_with_content(os.path.join(temp_dir, 'c'), 'same')
+                self.poll_until(duplicate_watcher, reported, 1)
+                self.assertEqual(reported, [sorted([os.path.join(temp_dir, 'a'),
+                                                    os.path.join(temp_dir, 'c')])])
+                self.assertEqual(len(duplicate_watcher.directories), 1)
+
+
+    def test_watch_errors(self):
+        """
+        verifies that unreadable directories are skipped,
+        and that reaching the limit of inotify watches is reported
+        """
+
+        with TemporaryDirectory() as temp_dir:
+            os.mkdir(os.path.join(temp_dir, 'sub'))
+            with watcher.DuplicateWatcher([temp_dir], lambda key, paths: None) as duplicate_watcher:
+                with patch.object(duplicate_watcher.inotify, 'add_watch',
+                                  side_effect=OSError(errno.EACCES, 'Permission denied')):
+                    duplicate_watcher.reconcile()
+                with patch.object(duplicate_watcher.inotify, 'add_watch',
+                                  side_effect=OSError(errno.ENOSPC, 'No space left on device')):
+                    with self.assertRaises(ValueError):
+                        duplicate_watcher.reconcile()
+
+
+if __name__ == '__main__':
+    unittest.main()